@@ -0,0 +1,333 @@
+# Headless JSON API over the insurance data functions
+#
+#   python api.py --port 8080 [--workers 4]
+#
+#   POST /login                          {"username", "password"} -> {"role", "user_id"}
+#   GET  /policies                       policy catalog
+#   GET  /users/{user_id}/policies       the user's purchased policies
+#   POST /users/{user_id}/purchases      {"policy_id", "name", "age", "contact", "address"}
+#   POST /claims                         {"policy_holder_id", "claim_amount", "description", "policy_id"}
+#   PUT  /claims/{claim_id}/status       {"status": "Approved" | "Rejected", "username", "password"}
+#   GET  /holders/{holder_id}/claims     the holder's claims
+#   GET  /health
+#
+# Runs on aiohttp with an aiomysql connection pool (pip install aiohttp aiomysql)
+# against the database db.py is configured for. The statements come from
+# queries.py and rollups.py, so the API reads and writes exactly like the
+# Streamlit app. When HIMS_API_KEY is set, every request except /health must send
+# it in the X-API-Key header; without it, adjudicating a claim needs an admin's
+# username and password in the body. Only Pending claims can be adjudicated.
+# loadtest_api.py drives it with a mixed workload.
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import aiomysql
+from aiohttp import web
+from pymysql import IntegrityError, OperationalError
+
+import cache
+import db
+import queries
+import rollups
+
+API_KEY = os.environ.get("HIMS_API_KEY")
+API_POOL_MIN = int(os.environ.get("HIMS_API_POOL_MIN", "5"))
+API_POOL_SIZE = int(os.environ.get("HIMS_API_POOL_SIZE", "50"))  # connections per worker process
+
+MAX_CLAIM_AMOUNT = Decimal("99999999.99")  # claims.claim_amount is DECIMAL(10, 2)
+CLAIM_STATUSES = ("Approved", "Rejected")  # what a Pending claim can be adjudicated to
+
+routes = web.RouteTableDef()
+pool_key = web.AppKey("pool", aiomysql.Pool)
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+dumps = functools.partial(json.dumps, default=json_default)
+
+
+def respond(data, status=200):
+    return web.json_response(data, status=status, dumps=dumps)
+
+
+def error(http_error, message):
+    return http_error(text=json.dumps({"error": message}), content_type="application/json")
+
+
+async def read_body(request, *required):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise error(web.HTTPBadRequest, "Request body must be JSON")
+    if not isinstance(body, dict):
+        raise error(web.HTTPBadRequest, "Request body must be a JSON object")
+    missing = [field for field in required if body.get(field) in (None, "")]
+    if missing:
+        raise error(web.HTTPBadRequest, f"Missing field(s): {', '.join(missing)}")
+    return body
+
+
+def int_value(value, name, minimum=None, maximum=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise error(web.HTTPBadRequest, f"{name} must be an integer")
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise error(web.HTTPBadRequest, f"{name} is out of range")
+    return number
+
+
+def path_id(request, name):
+    return int_value(request.match_info[name], name, minimum=1)
+
+
+async def fetch(request, query, params=()):
+    async with request.app[pool_key].acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            return await cursor.fetchall()
+
+
+@routes.get("/health")
+async def health(request):
+    return respond({"status": "ok"})
+
+
+@routes.post("/login")
+async def login(request):
+    body = await read_body(request, "username", "password")
+    rows = await fetch(request, queries.LOGIN, (body["username"], body["password"]))
+    if not rows:
+        raise error(web.HTTPUnauthorized, "Invalid username or password")
+    role, user_id = rows[0]
+    return respond({"role": role, "user_id": user_id})
+
+
+# Adjudication is an admin action: a request that got past the API key check is
+# trusted, otherwise it must carry an admin's credentials
+async def require_admin(request, body):
+    if API_KEY:
+        return
+    if body.get("username") in (None, "") or body.get("password") in (None, ""):
+        raise error(web.HTTPUnauthorized, "Adjudicating a claim needs an admin username and password")
+    rows = await fetch(request, queries.LOGIN, (body["username"], body["password"]))
+    if not rows or rows[0][0] != 'admin':
+        raise error(web.HTTPForbidden, "Only an admin can adjudicate claims")
+
+
+@routes.get("/policies")
+async def view_policies(request):
+    async def load():
+        return await fetch(request, queries.POLICY_CATALOG)
+
+    policies = await cache.get_or_load_async("policy_catalog", load, depends_on=("policies",), ttl=cache.CATALOG_TTL)
+    return respond([{"policy_id": policy_id, "policy_name": name, "policy_details": details, "premium": premium}
+                    for policy_id, name, details, premium in policies])
+
+
+@routes.get("/users/{user_id}/policies")
+async def get_user_policies(request):
+    rows = await fetch(request, queries.USER_POLICIES, (path_id(request, "user_id"),))
+    return respond([{"policy_id": policy_id, "policy_name": name, "policy_details": details, "premium": premium,
+                     "latest_purchase_date": purchased}
+                    for policy_id, name, details, premium, purchased in rows])
+
+
+@routes.post("/users/{user_id}/purchases")
+async def buy_policy(request):
+    user_id = path_id(request, "user_id")
+    body = await read_body(request, "policy_id")
+    policy_id = int_value(body["policy_id"], "policy_id", minimum=1)
+
+    # With the holder details, the holder record is created if needed (an
+    # existing one is kept as is); without them it must already exist
+    has_details = all(body.get(field) not in (None, "") for field in ("name", "age"))
+    if has_details:
+        age = int_value(body["age"], "age", minimum=18, maximum=100)
+
+    async with request.app[pool_key].acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cursor:
+                if has_details:
+                    await cursor.execute(queries.UPSERT_POLICY_HOLDER,
+                                         (user_id, body["name"], age, body.get("contact"), body.get("address")))
+                    policy_holder_id = cursor.lastrowid
+                else:
+                    await cursor.execute(queries.POLICY_HOLDER_ID, (user_id,))
+                    existing_policy_holder = await cursor.fetchone()
+                    if existing_policy_holder is None:
+                        raise error(web.HTTPBadRequest, "Missing field(s) for a new policy holder: name, age")
+                    policy_holder_id = existing_policy_holder[0]
+
+                if not await cursor.execute(queries.INSERT_PURCHASE, (user_id, policy_id)):
+                    raise error(web.HTTPNotFound, f"No policy {policy_id}")
+                purchase_id = cursor.lastrowid
+                await cursor.execute(rollups.RECORD_PURCHASE, (policy_id,))
+            await conn.commit()
+        except IntegrityError:
+            await conn.rollback()
+            raise error(web.HTTPUnprocessableEntity, f"Unknown user {user_id}")
+        except BaseException:
+            await conn.rollback()
+            raise
+    cache.bump("purchases", "policy_holders")
+    return respond({"purchase_id": purchase_id, "policy_holder_id": policy_holder_id}, status=201)
+
+
+@routes.post("/claims")
+async def submit_claim(request):
+    body = await read_body(request, "policy_holder_id", "claim_amount")
+    policy_holder_id = int_value(body["policy_holder_id"], "policy_holder_id", minimum=1)
+    try:
+        claim_amount = Decimal(str(body["claim_amount"]))
+        if not claim_amount.is_finite():
+            raise InvalidOperation
+        claim_amount = claim_amount.quantize(Decimal("0.01"), ROUND_HALF_UP)
+    except InvalidOperation:
+        raise error(web.HTTPBadRequest, "claim_amount must be a number")
+    if not Decimal(0) < claim_amount <= MAX_CLAIM_AMOUNT:
+        raise error(web.HTTPBadRequest, "claim_amount is out of range")
+    policy_id = body.get("policy_id")
+    if policy_id is not None:
+        policy_id = int_value(policy_id, "policy_id", minimum=1)
+
+    async with request.app[pool_key].acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cursor:
+                await cursor.execute(queries.INSERT_CLAIM,
+                                     (policy_holder_id, policy_id, claim_amount, body.get("description"), 'Pending'))
+                claim_id = cursor.lastrowid
+                await cursor.execute(rollups.RECORD_CLAIMS_SUBMITTED,
+                                     (policy_id or rollups.UNATTRIBUTED_POLICY_ID, 1))
+            await conn.commit()
+        except IntegrityError:
+            await conn.rollback()
+            unknown = f"policy holder {policy_holder_id}" + (f" or policy {policy_id}" if policy_id else "")
+            raise error(web.HTTPUnprocessableEntity, f"Unknown {unknown}")
+        except BaseException:
+            await conn.rollback()
+            raise
+    cache.bump("claims")
+    return respond({"claim_id": claim_id, "status": "Pending"}, status=201)
+
+
+@routes.put("/claims/{claim_id}/status")
+async def update_claim_status(request):
+    claim_id = path_id(request, "claim_id")
+    body = await read_body(request, "status")
+    new_status = str(body["status"]).capitalize()
+    if new_status not in CLAIM_STATUSES:
+        raise error(web.HTTPBadRequest, f"status must be one of {', '.join(CLAIM_STATUSES)}")
+    await require_admin(request, body)
+
+    async with request.app[pool_key].acquire() as conn:
+        await conn.begin()
+        try:
+            async with conn.cursor() as cursor:
+                changed = await cursor.execute(queries.UPDATE_CLAIM_STATUS, (new_status, claim_id))
+                if changed and new_status == 'Approved':
+                    await cursor.execute(*rollups.claims_approved_statement([claim_id]))
+                elif not changed:
+                    await cursor.execute("SELECT status FROM claims WHERE claim_id = %s", (claim_id,))
+                    current = await cursor.fetchone()
+                    if current is None:
+                        raise error(web.HTTPNotFound, f"No claim {claim_id}")
+                    raise error(web.HTTPConflict, f"Claim {claim_id} is already {current[0]}")
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    cache.bump("claims")
+    return respond({"claim_id": claim_id, "status": new_status})
+
+
+@routes.get("/holders/{holder_id}/claims")
+async def get_policy_holder_claims(request):
+    rows = await fetch(request, queries.POLICY_HOLDER_CLAIMS, (path_id(request, "holder_id"),))
+    return respond([{"claim_id": claim_id, "claim_amount": amount, "description": description, "status": status}
+                    for claim_id, amount, description, status in rows])
+
+
+@web.middleware
+async def api_middleware(request, handler):
+    if API_KEY and request.path != "/health" and request.headers.get("X-API-Key") != API_KEY:
+        raise error(web.HTTPUnauthorized, "Missing or invalid X-API-Key")
+    try:
+        return await handler(request)
+    except OperationalError as e:
+        raise error(web.HTTPServiceUnavailable, f"Database unavailable: {e}")
+
+
+def create_app(pool_size=API_POOL_SIZE):
+    app = web.Application(middlewares=[api_middleware])
+    app.add_routes(routes)
+
+    async def open_pool(app):
+        # autocommit keeps reads from leaving transactions open, which would make
+        # the pool close the connection on release; writes use conn.begin()
+        app[pool_key] = await aiomysql.create_pool(
+            host=db.DB_CONFIG["host"], port=db.DB_CONFIG["port"], user=db.DB_CONFIG["user"],
+            password=db.DB_CONFIG["password"], db=db.DB_CONFIG["database"],
+            minsize=min(API_POOL_MIN, pool_size), maxsize=pool_size, autocommit=True, pool_recycle=db.POOL_RECYCLE)
+
+    async def close_pool(app):
+        app[pool_key].close()
+        await app[pool_key].wait_closed()
+
+    app.on_startup.append(open_pool)
+    app.on_cleanup.append(close_pool)
+    return app
+
+
+def serve(host, port, pool_size, reuse_port=False):
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    web.run_app(create_app(pool_size), host=host, port=port, access_log=None, reuse_port=reuse_port,
+                print=None if reuse_port else print)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the insurance data functions as a JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes sharing the port (SO_REUSEPORT), each with its own pool")
+    parser.add_argument("--pool-size", type=int, default=API_POOL_SIZE, help="database connections per process")
+    args = parser.parse_args()
+    if db.BACKEND != "mysql":
+        parser.error("the API connects with aiomysql and needs HIMS_DB_BACKEND=mysql")
+
+    if args.workers == 1:
+        serve(args.host, args.port, args.pool_size)
+        return
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} worker processes")
+    workers = [multiprocessing.Process(target=serve, args=(args.host, args.port, args.pool_size, True))
+               for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# Monthly partitions, archival and querying for the trigger-maintained log tables
+#
+#   python audit_logs.py status
+#   python audit_logs.py rotate [--months-ahead 3]
+#   python audit_logs.py archive --retain-months 12 [--archive-dir audit_archive] [--dry-run]
+#   python audit_logs.py query claim_status_change_logs --start 2024-01-01 --end 2024-03-31
+#
+# Each log table is range partitioned by month on its date column, with a
+# p_future partition catching everything past the last monthly one. `rotate`
+# (run it daily, e.g. from cron) splits p_future so that the current month and
+# --months-ahead further months have their own partitions; the first run after
+# migration 0005 splits the existing rows into months once. `archive` exports
+# every month older than --retain-months to a gzip CSV file, records it in
+# audit_log_archives and drops the partition, which takes the same time however
+# many rows it held. read_logs() returns rows from the archive files and the
+# live table as one stream. Partition boundaries are in the server's time zone.
+import argparse
+import csv
+import gzip
+import os
+import re
+import sys
+from datetime import date, datetime, time, timedelta
+
+import db
+
+ARCHIVE_DIR = os.environ.get("HIMS_AUDIT_ARCHIVE_DIR",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_archive"))
+MONTHS_AHEAD = 3
+FETCH_SIZE = 10000
+
+# log table -> the date column it is partitioned on
+LOG_TABLES = {
+    "purchase_logs": "purchase_date",
+    "claim_submission_logs": "submission_date",
+    "claim_status_change_logs": "change_date",
+    "policy_creation_logs": "creation_date",
+    "policy_deletion_logs": "deletion_date",
+}
+
+FUTURE_PARTITION = "p_future"
+MONTH_PARTITION = re.compile(r"^p(\d{4})(\d{2})$")
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def archive_path(table, month, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, table, f"{table}_{month:%Y-%m}.csv.gz")
+
+
+def check_table(table):
+    if table not in LOG_TABLES:
+        raise ValueError(f"Unknown log table {table!r}; expected one of {', '.join(LOG_TABLES)}")
+
+
+# {month: approximate row count} for the table's monthly partitions (empty if the
+# table isn't partitioned yet)
+def monthly_partitions(cursor, table):
+    cursor.execute("""
+        SELECT PARTITION_NAME, TABLE_ROWS
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """, (table,))
+    months = {}
+    for name, rows in cursor.fetchall():
+        match = MONTH_PARTITION.match(name)
+        if match:
+            months[date(int(match.group(1)), int(match.group(2)), 1)] = rows
+    return months
+
+
+# Split p_future so every month up to months_ahead past the current one has its
+# own partition. Returns the months added.
+def rotate(conn, table, months_ahead=MONTHS_AHEAD, today=None):
+    check_table(table)
+    column = LOG_TABLES[table]
+    cursor = conn.cursor()
+    months = monthly_partitions(cursor, table)
+    if months:
+        first = add_months(max(months), 1)
+    else:
+        # First rotation: start from the oldest row so existing history is split
+        # into months (p_future still holds every row at this point)
+        cursor.execute(f"SELECT MIN({column}) FROM {table}")
+        oldest = cursor.fetchone()[0]
+        first = month_start(oldest or today or date.today())
+    last = add_months(month_start(today or date.today()), months_ahead)
+
+    added = []
+    month = first
+    while month <= last:
+        added.append(month)
+        month = add_months(month, 1)
+    if added:
+        partitions = ", ".join(f"PARTITION {partition_name(month)} VALUES LESS THAN "
+                               f"(UNIX_TIMESTAMP('{add_months(month, 1):%Y-%m-%d}'))" for month in added)
+        cursor.execute(f"""
+            ALTER TABLE {table} REORGANIZE PARTITION {FUTURE_PARTITION} INTO
+            ({partitions}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)
+        """)
+    return added
+
+
+# Write every row of the month's partition to its archive file. Returns the
+# number of rows written.
+def export_partition(conn, table, month, archive_dir=ARCHIVE_DIR):
+    path = archive_path(table, month, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    written = 0
+    cursor = conn.cursor(db.pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(f"SELECT * FROM {table} PARTITION ({partition_name(month)}) ORDER BY log_id")
+        with gzip.open(temp_path, "wt", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(column[0] for column in cursor.description)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                written += len(rows)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        cursor.close()
+    os.replace(temp_path, path)
+    return written
+
+
+# Export and drop every monthly partition that ended before the first day of the
+# month retain_months ago. Returns [(month, rows)] for the archived partitions.
+def archive(conn, table, retain_months, archive_dir=ARCHIVE_DIR, dry_run=False, today=None):
+    check_table(table)
+    if retain_months < 1:
+        raise ValueError("retain_months must be at least 1")
+    cutoff = add_months(month_start(today or date.today()), -retain_months)
+    cursor = conn.cursor()
+    archived = []
+    for month in sorted(monthly_partitions(cursor, table)):
+        if month >= cutoff:
+            break
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*) FROM {table} PARTITION ({partition_name(month)})")
+            archived.append((month, cursor.fetchone()[0]))
+            continue
+        written = export_partition(conn, table, month, archive_dir)
+        # Rows for past months are never written by the triggers, but don't drop
+        # anything the file doesn't hold
+        cursor.execute(f"SELECT COUNT(*) FROM {table} PARTITION ({partition_name(month)})")
+        if cursor.fetchone()[0] != written:
+            raise RuntimeError(f"{table} {month:%Y-%m} changed while it was being exported; not dropped")
+        cursor.execute("""
+            INSERT INTO audit_log_archives (table_name, month, row_count, path)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE row_count = VALUES(row_count), path = VALUES(path), archived_at = NOW()
+        """, (table, month, written, archive_path(table, month, archive_dir)))
+        conn.commit()
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {partition_name(month)}")
+        archived.append((month, written))
+    return archived
+
+
+# First day whose log rows are all still in the live tables (the first day after
+# the last archived month), or None when nothing has been archived
+def live_since(cursor, tables=LOG_TABLES):
+    placeholders = ", ".join(["%s"] * len(tables))
+    cursor.execute(f"SELECT MAX(month) FROM audit_log_archives WHERE table_name IN ({placeholders})", tuple(tables))
+    last_archived = cursor.fetchone()[0]
+    return add_months(last_archived, 1) if last_archived else None
+
+
+def read_archive(path, column, start=None, end=None):
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row[column] = datetime.fromisoformat(row[column])
+            if (start is None or row[column] >= start) and (end is None or row[column] < end):
+                yield row
+
+
+# Log rows with start <= date < end (datetimes, either may be None) as dicts, in
+# date order: first from the archive files of the months in range, then from the
+# live table. Archived values other than the date are strings.
+def read_logs(table, start=None, end=None, conn=None, archive_dir=ARCHIVE_DIR):
+    check_table(table)
+    column = LOG_TABLES[table]
+    own_conn = conn is None
+    conn = conn or db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT month, path FROM audit_log_archives WHERE table_name = %s ORDER BY month", (table,))
+        archives = cursor.fetchall()
+        for month, path in archives:
+            if (start is None or add_months(month, 1) > start.date()) and (end is None or month <= end.date()):
+                if not os.path.exists(path):
+                    path = archive_path(table, month, archive_dir)
+                yield from read_archive(path, column, start, end)
+
+        conditions, params = [], []
+        if start is not None:
+            conditions.append(f"{column} >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"{column} < %s")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = conn.cursor(db.pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(f"SELECT * FROM {table} {where} ORDER BY {column}, log_id", params)
+            names = [description[0] for description in cursor.description]
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(names, row))
+        finally:
+            cursor.close()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotate, archive and query the partitioned log tables")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="list each table's monthly partitions and archives")
+    rotate_parser = subparsers.add_parser("rotate", help="add partitions for the coming months")
+    rotate_parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    archive_parser = subparsers.add_parser("archive", help="export and drop partitions older than the retention")
+    archive_parser.add_argument("--retain-months", type=int, required=True,
+                                help="months kept live, not counting the current one")
+    archive_parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    archive_parser.add_argument("--dry-run", action="store_true", help="only list what would be archived")
+    for subparser in (rotate_parser, archive_parser):
+        subparser.add_argument("--table", choices=sorted(LOG_TABLES), action="append",
+                               help="limit to this table (repeatable; default: all log tables)")
+    query_parser = subparsers.add_parser("query", help="print live and archived rows as CSV")
+    query_parser.add_argument("table", choices=sorted(LOG_TABLES))
+    query_parser.add_argument("--start", type=date.fromisoformat, help="first day (default: all history)")
+    query_parser.add_argument("--end", type=date.fromisoformat, help="last day, inclusive (default: no limit)")
+    query_parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+    if db.BACKEND != "mysql" and args.command != "query":
+        parser.error(f"{args.command} works on partitioned MySQL tables; the SQLite log tables aren't partitioned")
+
+    conn = db.get_connection()
+    try:
+        if args.command == "status":
+            cursor = conn.cursor()
+            for table in LOG_TABLES:
+                months = monthly_partitions(cursor, table)
+                cursor.execute("SELECT COUNT(*), MIN(month), MAX(month) FROM audit_log_archives "
+                               "WHERE table_name = %s", (table,))
+                archived, first_archived, last_archived = cursor.fetchone()
+                live = f"{min(months):%Y-%m} to {max(months):%Y-%m}, ~{sum(months.values()):,} rows" if months \
+                    else "not rotated yet"
+                print(f"{table:26} live: {live}")
+                if archived:
+                    print(f"{'':26} archived: {archived} month(s), {first_archived:%Y-%m} to {last_archived:%Y-%m}")
+        elif args.command == "rotate":
+            for table in args.table or LOG_TABLES:
+                added = rotate(conn, table, args.months_ahead)
+                print(f"{table}: added {len(added)} partition(s)"
+                      + (f" {added[0]:%Y-%m} to {added[-1]:%Y-%m}" if added else ""))
+        elif args.command == "archive":
+            for table in args.table or LOG_TABLES:
+                archived = archive(conn, table, args.retain_months, args.archive_dir, args.dry_run)
+                verb = "would archive" if args.dry_run else "archived"
+                print(f"{table}: {verb} {len(archived)} month(s), {sum(rows for _, rows in archived):,} rows")
+        elif args.command == "query":
+            start = datetime.combine(args.start, time.min) if args.start else None
+            end = datetime.combine(args.end + timedelta(days=1), time.min) if args.end else None
+            writer = None
+            for row in read_logs(args.table, start, end, conn, args.archive_dir):
+                if writer is None:
+                    writer = csv.DictWriter(sys.stdout, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
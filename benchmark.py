@@ -0,0 +1,346 @@
+# Data-layer benchmarks for hims.py
+#
+#   python benchmark.py --scale small --scale medium --output bench.json
+#   python benchmark.py --no-fill --compare bench.json       re-run on the current data
+#   python benchmark.py --backend mysql --backend sqlite      same workload on each backend
+#
+# For each scale, synthetic_data.py first tops the database up to that scale's row
+# counts; then every benchmark calls the corresponding hims.py data function
+# --repeat times with randomly sampled arguments and records latency percentiles
+# and rows returned. buy_policy.concurrent runs --buyers threads purchasing at
+# once and also reports throughput and any duplicate holder records. Results are
+# written as JSON. --compare reads an earlier
+# results file, prints the change in median latency per benchmark and exits
+# non-zero when any of them slowed down by more than --threshold. --backend runs
+# the whole benchmark once per storage backend (db.BACKENDS), each in its own
+# process with HIMS_DB_BACKEND set, and prints their medians side by side.
+#
+# The functions are loaded from hims.py's imports, constants and definitions
+# without running the page. buy_policy writes real purchases, so run against a
+# throwaway database (HIMS_DB_NAME=hims_bench built from hims.sql, or
+# HIMS_SQLITE_PATH=bench.sqlite3).
+import argparse
+import ast
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import db
+import synthetic_data
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "hims.py")
+
+REPEAT = 20
+WARMUP = 2
+THRESHOLD = 0.25  # allowed slowdown of a median before --compare fails
+PAGE_SIZE = 25
+BUYERS = 16  # concurrent threads in buy_policy.concurrent (capped in effect by HIMS_POOL_SIZE)
+
+
+# hims.py's top-level imports, assignments and function definitions as a module,
+# leaving out the statements that render the page
+def load_app_functions(script=APP_SCRIPT):
+    with open(script, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), script)
+    tree.body = [node for node in tree.body
+                 if isinstance(node, (ast.Import, ast.ImportFrom, ast.Assign, ast.FunctionDef))]
+    module = types.ModuleType("hims")
+    module.__file__ = script
+    exec(compile(tree, script, "exec"), module.__dict__)
+    return module
+
+
+def table_counts(cursor):
+    return {table: synthetic_data.table_count(cursor, table)
+            for table in ("users", "policy_holders", "policies", "policy_purchases", "claims")}
+
+
+def id_range(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MIN({column}), 0), COALESCE(MAX({column}), 0) FROM {table}")
+    return cursor.fetchone()
+
+
+# name -> function of a random.Random returning the call to time, as (func, args)
+def benchmark_cases(app, cursor):
+    user_low, user_high = id_range(cursor, "policy_holders", "user_id")
+    holder_low, holder_high = id_range(cursor, "policy_holders", "id")
+    claim_low, claim_high = id_range(cursor, "claims", "claim_id")
+    cursor.execute("SELECT policy_id FROM policies")
+    policy_ids = [row[0] for row in cursor.fetchall()]
+    today = date.today()
+
+    def buy_policy(rng):
+        user_id = rng.randint(user_low, user_high)
+        return app.buy_policy, (user_id, rng.choice(policy_ids), f"Holder {user_id}", rng.randint(18, 90),
+                                "9999999999", "1 Benchmark Street")
+
+    return {
+        # view_claims: first page, a deep page and a filtered page of the queue
+        "view_claims.first_page": lambda rng: (app.get_pending_claims_page, (0, PAGE_SIZE)),
+        "view_claims.deep_page": lambda rng: (app.get_pending_claims_page,
+                                              (rng.randint(claim_low, claim_high), PAGE_SIZE)),
+        "view_claims.filtered": lambda rng: (app.get_pending_claims_page,
+                                             (0, PAGE_SIZE, 50000, None, rng.randint(holder_low, holder_high))),
+        "get_user_policies": lambda rng: (app.get_user_policies, (rng.randint(user_low, user_high),)),
+        "get_policy_holder_claims": lambda rng: (app.get_policy_holder_claims,
+                                                 (rng.randint(holder_low, holder_high),)),
+        # generate_reports on a cache miss: the totals and the 30-day trends
+        "generate_reports.load_reports": lambda rng: (app.load_reports, ()),
+        "generate_reports.load_trends": lambda rng: (app.load_trends, (today - timedelta(days=30), today)),
+        "buy_policy": buy_policy,
+    }
+
+
+def summarize(samples, rows):
+    samples = sorted(samples)
+    return {
+        "calls": len(samples),
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        "max_ms": samples[-1],
+        "mean_ms": statistics.fmean(samples),
+        "mean_rows": statistics.fmean(rows),
+    }
+
+
+def result_rows(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    return len(result) if isinstance(result, (list, tuple)) else 0
+
+
+# buy_policy from `buyers` threads at once, each making `purchases` calls for
+# users drawn from a small shared set. Half of the users have no policy holder
+# record yet, so their first purchases race to create it.
+def run_concurrent_purchases(app, buyers=BUYERS, purchases=REPEAT, seed=0):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT policy_id FROM policies")
+        policy_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT user_id FROM policy_holders ORDER BY id DESC LIMIT %s", (buyers,))
+        users = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT u.user_id FROM users u
+            LEFT JOIN policy_holders h ON h.user_id = u.user_id
+            WHERE u.role = 'policy_holder' AND h.id IS NULL
+            LIMIT %s
+        """, (buyers,))
+        users += [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    samples, failures = [], []
+    start = threading.Barrier(buyers)
+
+    def buyer(index):
+        rng = random.Random(seed + index)
+        start.wait()
+        for _ in range(purchases):
+            user_id = rng.choice(users)
+            started = time.perf_counter()
+            bought = app.buy_policy(user_id, rng.choice(policy_ids), f"Holder {user_id}", rng.randint(18, 90),
+                                    "9999999999", "1 Benchmark Street")
+            samples.append((time.perf_counter() - started) * 1000)
+            if not bought:
+                failures.append(user_id)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(buyers) as executor:
+        list(executor.map(buyer, range(buyers)))
+    elapsed = time.perf_counter() - started
+
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        placeholders = ", ".join(["%s"] * len(users))
+        cursor.execute(f"""
+            SELECT COUNT(*) FROM (
+                SELECT user_id FROM policy_holders WHERE user_id IN ({placeholders})
+                GROUP BY user_id HAVING COUNT(*) > 1
+            ) duplicated
+        """, users)
+        duplicate_holders = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    results = summarize(samples, [0] * len(samples))
+    results.update(buyers=buyers, purchases_per_second=len(samples) / elapsed, failed=len(failures),
+                   duplicate_holders=duplicate_holders)
+    return results
+
+
+def run_benchmarks(app, repeat=REPEAT, warmup=WARMUP, seed=0, only=None, buyers=BUYERS, log=print):
+    conn = db.get_connection()
+    try:
+        cases = benchmark_cases(app, conn.cursor())
+    finally:
+        conn.close()
+
+    rng = random.Random(seed)
+    results = {}
+    for name, make_call in cases.items():
+        if only and name not in only:
+            continue
+        samples, rows = [], []
+        for i in range(warmup + repeat):
+            func, args = make_call(rng)
+            started = time.perf_counter()
+            result = func(*args)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if i >= warmup:
+                samples.append(elapsed_ms)
+                rows.append(result_rows(result))
+        results[name] = summarize(samples, rows)
+        log(f"  {name:32} median {results[name]['median_ms']:9.2f} ms   p95 {results[name]['p95_ms']:9.2f} ms")
+
+    name = "buy_policy.concurrent"
+    if not only or name in only:
+        results[name] = stats = run_concurrent_purchases(app, buyers, repeat, seed)
+        log(f"  {name:32} median {stats['median_ms']:9.2f} ms   p95 {stats['p95_ms']:9.2f} ms   "
+            f"{stats['purchases_per_second']:,.0f} purchases/s with {buyers} buyers, {stats['failed']} failed, "
+            f"{stats['duplicate_holders']} duplicate holders")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Run this script once per backend with the given arguments (less --backend,
+# --output and --compare) and return {backend: results}
+def run_backends(backends, argv):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            output = os.path.join(tmp, f"{backend}.json")
+            print(f"== {backend} ==", flush=True)
+            env = dict(os.environ, HIMS_DB_BACKEND=backend)
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__)] + argv + ["--output", output],
+                                       cwd=APP_DIR, env=env)
+            if completed.returncode != 0:
+                sys.exit(f"error: the {backend} run failed (exit status {completed.returncode})")
+            with open(output, encoding="utf-8") as f:
+                results[backend] = json.load(f)
+    return results
+
+
+# [(scale, benchmark, {backend: median})] for every benchmark any backend ran
+def compare_backends(results):
+    medians = {}
+    for backend, report in results.items():
+        for run in report["runs"]:
+            for name, stats in run["benchmarks"].items():
+                medians.setdefault((run["scale"], name), {})[backend] = stats["median_ms"]
+    return [(scale, name, by_backend) for (scale, name), by_backend in medians.items()]
+
+
+# [(scale, benchmark, old median, new median, relative change)] for benchmarks in both runs
+def compare(previous, current):
+    old = {(run["scale"], name): stats["median_ms"]
+           for run in previous["runs"] for name, stats in run["benchmarks"].items()}
+    changes = []
+    for run in current["runs"]:
+        for name, stats in run["benchmarks"].items():
+            key = (run["scale"], name)
+            if key in old and old[key] > 0:
+                changes.append((run["scale"], name, old[key], stats["median_ms"], stats["median_ms"] / old[key] - 1))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hims.py's data functions at several data volumes")
+    parser.add_argument("--scale", action="append", choices=synthetic_data.SCALES,
+                        help="fill to this scale and benchmark it; repeatable (default: small)")
+    parser.add_argument("--no-fill", action="store_true", help="benchmark the data already in the database")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed calls per benchmark")
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="untimed calls before each benchmark")
+    parser.add_argument("--only", action="append", help="run only this benchmark; repeatable")
+    parser.add_argument("--buyers", type=int, default=BUYERS, help="concurrent threads in buy_policy.concurrent")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for data and arguments")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="allowed relative slowdown of a median with --compare (default: 0.25)")
+    parser.add_argument("--backend", action="append", choices=db.BACKENDS,
+                        help="run the benchmarks on this storage backend; repeatable")
+    args = parser.parse_args()
+
+    if args.backend:
+        if args.compare:
+            parser.error("--compare can't be combined with --backend")
+        argv = ["--no-fill"] if args.no_fill else [f"--scale={scale}" for scale in args.scale or ["small"]]
+        argv += [f"--repeat={args.repeat}", f"--warmup={args.warmup}", f"--buyers={args.buyers}",
+                 f"--seed={args.seed}"] + [f"--only={name}" for name in args.only or []]
+        backends = list(dict.fromkeys(args.backend))
+        results = run_backends(backends, argv)
+        print(f"{'scale':8} {'benchmark':32} " + " ".join(f"{backend + ' ms':>12}" for backend in backends))
+        for scale, name, by_backend in compare_backends(results):
+            print(f"{scale:8} {name:32} " + " ".join(
+                f"{by_backend[backend]:12.2f}" if backend in by_backend else f"{'-':>12}" for backend in backends))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"started_at": datetime.now().isoformat(timespec="seconds"), "backends": results}, f,
+                          indent=2)
+            print(f"Results written to {args.output}")
+        return
+
+    app = load_app_functions()
+    scales = ["current"] if args.no_fill else (args.scale or ["small"])
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": {"backend": db.BACKEND, "location": db.describe()},
+        "repeat": args.repeat,
+        "runs": [],
+    }
+    for scale in scales:
+        conn = db.get_connection()
+        try:
+            if scale != "current":
+                print(f"Filling to scale {scale}")
+                synthetic_data.fill(conn, seed=args.seed, **synthetic_data.SCALES[scale])
+            counts = table_counts(conn.cursor())
+        finally:
+            conn.close()
+        print(f"Benchmarking at scale {scale} ({', '.join(f'{n:,} {table}' for table, n in counts.items())})")
+        benchmarks = run_benchmarks(app, args.repeat, args.warmup, args.seed, args.only, args.buyers)
+        report["runs"].append({"scale": scale, "table_rows": counts, "benchmarks": benchmarks})
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        regressed = False
+        for scale, name, old_ms, new_ms, change in compare(previous, report):
+            flag = "  REGRESSION" if change > args.threshold else ""
+            regressed = regressed or bool(flag)
+            print(f"{scale:8} {name:32} {old_ms:9.2f} -> {new_ms:9.2f} ms  {change:+7.1%}{flag}")
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# Bulk import of policy holders, purchases and claims from CSV
+#
+#   python bulk_import.py holders partner_holders.csv --rejects holders_rejects.csv
+#   python bulk_import.py purchases partner_purchases.csv --commit-size 20000
+#   python bulk_import.py claims partner_claims.csv
+#
+# Files are streamed in chunks with pandas, validated column-wise, and inserted with
+# batched executemany calls, committing every --commit-size rows. Rows that fail
+# validation are written to the reject file with a reject_reason column. The admin
+# page's upload form calls import_csv() the same way.
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+import cache
+import db
+import rollups
+
+CHUNK_SIZE = 50000  # rows read from the CSV at a time
+COMMIT_SIZE = 10000  # rows inserted per transaction
+ID_LOOKUP_BATCH = 5000  # IDs per existence check query
+
+MAX_CLAIM_AMOUNT = 99999999.99  # claims.claim_amount is DECIMAL(10, 2)
+CLAIM_STATUSES = {"Pending", "Approved", "Rejected"}
+
+IMPORT_KINDS = {
+    "holders": {
+        "required": ["user_id", "name", "age"],
+        "optional": ["contact", "address"],
+        "insert": "INSERT INTO policy_holders (user_id, name, age, contact, address) VALUES (%s, %s, %s, %s, %s)",
+        "changes": "policy_holders",
+    },
+    "purchases": {
+        "required": ["user_id", "policy_id"],
+        "optional": ["purchase_date"],
+        "insert": "INSERT INTO policy_purchases (user_id, policy_id, purchase_date) VALUES (%s, %s, %s)",
+        "changes": "purchases",
+    },
+    "claims": {
+        "required": ["policy_holder_id", "claim_amount"],
+        "optional": ["policy_id", "description", "status"],
+        "insert": "INSERT INTO claims (policy_holder_id, policy_id, claim_amount, description, status, ingest_ref) "
+                  "VALUES (%s, %s, %s, %s, %s, %s)",
+        "changes": "claims",
+    },
+}
+
+INSERT_STATUS_CHANGE_LOG = ("INSERT INTO claim_status_change_logs (claim_id, old_status, new_status, change_date, "
+                            "log_details) VALUES (%s, %s, %s, %s, %s)")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+# Return the set of IDs from a numeric column that are present in table.column
+def existing_ids(cursor, table, column, values):
+    ids = values.dropna().astype(int).unique().tolist()
+    found = set()
+    for i in range(0, len(ids), ID_LOOKUP_BATCH):
+        batch = ids[i:i + ID_LOOKUP_BATCH]
+        placeholders = ", ".join(["%s"] * len(batch))
+        cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders})", batch)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+
+# Python values for a column (None for missing), as pymysql cannot escape numpy types
+def column_values(series):
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+# Record the first failing check for each row
+def reject(reasons, mask, reason):
+    reasons[mask & (reasons == "")] = reason
+
+
+def integer_column(chunk, column):
+    values = pd.to_numeric(chunk[column], errors="coerce")
+    return values.where(values == values.round())
+
+
+class Importer:
+    def __init__(self, conn, kind):
+        self.conn = conn
+        self.kind = kind
+        self.spec = IMPORT_KINDS[kind]
+        self.seen_holder_users = set()
+        cursor = conn.cursor()
+        cursor.execute("SELECT policy_id, premium FROM policies")
+        self.premiums = dict(cursor.fetchall())
+
+    # Split a chunk into (rows ready to insert, rejected rows with reject_reason)
+    def validate(self, chunk):
+        cursor = self.conn.cursor()
+        reasons = pd.Series("", index=chunk.index, dtype=object)
+        for column in self.spec["required"]:
+            reject(reasons, chunk[column].isna() | (chunk[column].str.strip() == ""), f"missing {column}")
+        for column in self.spec["optional"]:
+            if column not in chunk:
+                chunk[column] = None
+
+        if self.kind == "holders":
+            user_id = integer_column(chunk, "user_id")
+            age = integer_column(chunk, "age")
+            reject(reasons, user_id.isna(), "user_id is not an integer")
+            reject(reasons, age.isna() | (age < 18) | (age > 100), "age must be between 18 and 100")
+            reject(reasons, chunk["name"].str.len() > 100, "name longer than 100 characters")
+            reject(reasons, chunk["contact"].astype(object).str.len() > 50, "contact longer than 50 characters")
+            reject(reasons, ~user_id.isin(existing_ids(cursor, "users", "user_id", user_id)), "unknown user_id")
+            has_holder = existing_ids(cursor, "policy_holders", "user_id", user_id) | self.seen_holder_users
+            reject(reasons, user_id.isin(has_holder), "user already has a policy holder record")
+            candidates = user_id.where(reasons == "")
+            reject(reasons, candidates.notna() & candidates.duplicated(), "duplicate user_id in file")
+            valid = reasons == ""
+            self.seen_holder_users.update(user_id[valid].astype(int).tolist())
+            rows = pd.DataFrame({
+                "user_id": user_id.astype("Int64"),
+                "name": chunk["name"].str.strip(),
+                "age": age.astype("Int64"),
+                "contact": chunk["contact"],
+                "address": chunk["address"],
+            })
+
+        elif self.kind == "purchases":
+            user_id = integer_column(chunk, "user_id")
+            policy_id = integer_column(chunk, "policy_id")
+            purchase_date = pd.to_datetime(chunk["purchase_date"], errors="coerce")
+            reject(reasons, user_id.isna(), "user_id is not an integer")
+            reject(reasons, policy_id.isna(), "policy_id is not an integer")
+            reject(reasons, ~policy_id.isin(list(self.premiums)), "unknown policy_id")
+            reject(reasons, chunk["purchase_date"].notna() & purchase_date.isna(), "unparseable purchase_date")
+            reject(reasons, ~user_id.isin(existing_ids(cursor, "users", "user_id", user_id)), "unknown user_id")
+            rows = pd.DataFrame({
+                "user_id": user_id.astype("Int64"),
+                "policy_id": policy_id.astype("Int64"),
+                "purchase_date": purchase_date.fillna(pd.Timestamp(datetime.now())).dt.strftime("%Y-%m-%d %H:%M:%S"),
+            })
+
+        else:
+            holder_id = integer_column(chunk, "policy_holder_id")
+            policy_id = integer_column(chunk, "policy_id")
+            amount = pd.to_numeric(chunk["claim_amount"], errors="coerce").round(2)
+            status = chunk["status"].fillna("Pending").astype(object).str.strip().str.capitalize()
+            reject(reasons, holder_id.isna(), "policy_holder_id is not an integer")
+            reject(reasons, chunk["policy_id"].notna() & policy_id.isna(), "policy_id is not an integer")
+            reject(reasons, policy_id.notna() & ~policy_id.isin(list(self.premiums)), "unknown policy_id")
+            reject(reasons, amount.isna() | (amount <= 0) | (amount > MAX_CLAIM_AMOUNT), "invalid claim_amount")
+            reject(reasons, ~status.isin(CLAIM_STATUSES), "invalid status")
+            reject(reasons, ~holder_id.isin(existing_ids(cursor, "policy_holders", "id", holder_id)),
+                   "unknown policy_holder_id")
+            rows = pd.DataFrame({
+                "policy_holder_id": holder_id.astype("Int64"),
+                "policy_id": policy_id.astype("Int64"),
+                "claim_amount": amount,
+                "description": chunk["description"],
+                "status": status,
+                # Decided claims get an ingest_ref to find them again for their status change log
+                "ingest_ref": [None if value == "Pending" else uuid.uuid4().hex for value in status],
+            })
+
+        valid = reasons == ""
+        rejected = chunk[~valid].copy()
+        rejected["reject_reason"] = reasons[~valid]
+        return rows[valid], rejected
+
+    # Daily rollup increments for a batch of inserted rows
+    def rollup_rows(self, rows):
+        if self.kind == "purchases":
+            days = rows["purchase_date"].str[:10]
+            premium = rows["policy_id"].map(self.premiums).astype(float)
+            totals = (pd.DataFrame({"day": days, "policy_id": rows["policy_id"], "premium": premium})
+                      .groupby(["day", "policy_id"]).agg(purchases=("premium", "size"), premium=("premium", "sum")))
+            return [(day, int(policy_id), int(t.purchases), float(t.premium), 0, 0, 0.0)
+                    for (day, policy_id), t in totals.iterrows()]
+        if self.kind == "claims":
+            approved = rows["status"] == "Approved"
+            today = datetime.now().date().isoformat()
+            totals = (pd.DataFrame({"policy_id": rows["policy_id"].fillna(rollups.UNATTRIBUTED_POLICY_ID),
+                                    "approved": approved,
+                                    "approved_amount": rows["claim_amount"].where(approved, 0.0)})
+                      .groupby("policy_id").agg(submitted=("approved", "size"), approved=("approved", "sum"),
+                                                approved_amount=("approved_amount", "sum")))
+            return [(today, int(policy_id), 0, 0.0, int(t.submitted), int(t.approved), float(t.approved_amount))
+                    for policy_id, t in totals.iterrows()]
+        return []
+
+    # Claims imported as Approved or Rejected get the log row the
+    # after_claim_status_change trigger writes when the app decides a claim, so
+    # rollups.py backfill counts their approvals like the import's rollup increments
+    def log_status_changes(self, cursor, rows):
+        refs = rows["ingest_ref"].dropna().tolist()
+        changed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logs = []
+        for i in range(0, len(refs), ID_LOOKUP_BATCH):
+            batch = refs[i:i + ID_LOOKUP_BATCH]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"SELECT claim_id, status FROM claims WHERE ingest_ref IN ({placeholders})", batch)
+            logs.extend((claim_id, "Pending", status, changed_at,
+                         f"Claim status changed from Pending to {status} for Claim ID: {claim_id}")
+                        for claim_id, status in cursor.fetchall())
+        if logs:
+            cursor.executemany(INSERT_STATUS_CHANGE_LOG, logs)
+
+    # Insert validated rows, committing every commit_size rows
+    def insert(self, rows, commit_size, on_commit):
+        cursor = self.conn.cursor()
+        columns = [column_values(rows[column]) for column in rows.columns]
+        values = list(zip(*columns))
+        for i in range(0, len(values), commit_size):
+            batch = values[i:i + commit_size]
+            cursor.executemany(self.spec["insert"], batch)
+            if self.kind == "claims":
+                self.log_status_changes(cursor, rows.iloc[i:i + commit_size])
+            totals = self.rollup_rows(rows.iloc[i:i + commit_size])
+            if totals:
+                rollups.add_daily_totals(cursor, totals)
+            self.conn.commit()
+            on_commit(len(batch))
+
+
+# Stream a CSV file (path or file object) into the database. Rejected rows go to
+# rejects (path or file object) when given. progress(stats) is called after every
+# commit. Returns the final stats dict.
+def import_csv(source, kind, commit_size=COMMIT_SIZE, chunk_size=CHUNK_SIZE, rejects=None, progress=None):
+    if kind not in IMPORT_KINDS:
+        raise ImportFormatError(f"Unknown import kind {kind!r}; expected one of {', '.join(IMPORT_KINDS)}")
+    spec = IMPORT_KINDS[kind]
+    stats = {"read": 0, "inserted": 0, "rejected": 0, "elapsed": 0.0, "rows_per_second": 0.0}
+    started = time.monotonic()
+
+    def on_commit(count):
+        stats["inserted"] += count
+        stats["elapsed"] = time.monotonic() - started
+        stats["rows_per_second"] = stats["read"] / stats["elapsed"] if stats["elapsed"] else 0.0
+        if progress:
+            progress(dict(stats))
+
+    reject_file = open(rejects, "w", newline="") if isinstance(rejects, str) else rejects
+    conn = db.get_connection()
+    try:
+        importer = Importer(conn, kind)
+        reader = pd.read_csv(source, dtype=str, chunksize=chunk_size, skipinitialspace=True)
+        wrote_reject_header = False
+        for chunk in reader:
+            chunk.columns = [column.strip().lower() for column in chunk.columns]
+            missing = [column for column in spec["required"] if column not in chunk.columns]
+            if missing:
+                raise ImportFormatError(f"CSV is missing required column(s): {', '.join(missing)}")
+
+            stats["read"] += len(chunk)
+            rows, rejected = importer.validate(chunk)
+            if len(rejected):
+                stats["rejected"] += len(rejected)
+                if reject_file is not None:
+                    rejected.to_csv(reject_file, header=not wrote_reject_header, index=False)
+                    wrote_reject_header = True
+            if len(rows):
+                importer.insert(rows, commit_size, on_commit)
+            else:
+                on_commit(0)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        if isinstance(rejects, str):
+            reject_file.close()
+        if stats["inserted"]:
+            cache.bump(spec["changes"])
+
+    stats["elapsed"] = time.monotonic() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import policy holders, purchases or claims from CSV")
+    parser.add_argument("kind", choices=sorted(IMPORT_KINDS))
+    parser.add_argument("csv_file")
+    parser.add_argument("--rejects", help="write rejected rows to this CSV file")
+    parser.add_argument("--commit-size", type=int, default=COMMIT_SIZE, help="rows per transaction")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows read from the CSV at a time")
+    args = parser.parse_args()
+
+    def show_progress(stats):
+        sys.stderr.write(f"\r{stats['read']:,} read, {stats['inserted']:,} inserted, "
+                         f"{stats['rejected']:,} rejected ({stats['rows_per_second']:,.0f} rows/s)")
+        sys.stderr.flush()
+
+    try:
+        stats = import_csv(args.csv_file, args.kind, commit_size=args.commit_size, chunk_size=args.chunk_size,
+                           rejects=args.rejects, progress=show_progress)
+    except ImportFormatError as e:
+        sys.exit(f"error: {e}")
+    sys.stderr.write("\n")
+    print(f"Imported {stats['inserted']:,} of {stats['read']:,} rows in {stats['elapsed']:.1f}s; "
+          f"{stats['rejected']:,} rejected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Process-wide, version-invalidated cache shared by every Streamlit session
+#
+# Each cached value records the versions of the data it was built from. Writers
+# call bump() on the tables they change, which makes every dependent entry stale
+# on this node immediately. The optional TTL bounds how long a value may be served
+# when the change happened on another node (which cannot bump our counters).
+# Entries whose data changed within db.READ_AFTER_WRITE_SECONDS are loaded from
+# the primary, so a lagging read replica can't put pre-write data back in the cache.
+# Keys can carry arguments (e.g. a report's date range), so the cache keeps only
+# the MAX_ENTRIES most recently used entries.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+# Seconds before a cached value is reloaded even without a local invalidation
+# (0 disables the TTL fallback)
+CATALOG_TTL = float(os.environ.get("HIMS_CATALOG_TTL", "60"))
+REPORTS_TTL = float(os.environ.get("HIMS_REPORTS_TTL", "60"))
+MAX_ENTRIES = int(os.environ.get("HIMS_CACHE_MAX_ENTRIES", "256"))
+
+_versions = {}
+_changed_at = {}
+_entries = OrderedDict()  # least recently used first
+_lock = threading.Lock()
+
+
+def version(name):
+    with _lock:
+        return _versions.get(name, 0)
+
+
+# Mark data as changed; entries depending on any of the names are rebuilt on next use
+def bump(*names):
+    with _lock:
+        for name in names:
+            _versions[name] = _versions.get(name, 0) + 1
+            _changed_at[name] = time.monotonic()
+
+
+# Whether any of names was bumped in the last `seconds`
+def changed_within(names, seconds):
+    since = time.monotonic() - seconds
+    with _lock:
+        return any(_changed_at.get(name, float("-inf")) > since for name in names)
+
+
+# (fresh, value, versions): whether key holds a value that is neither stale nor
+# expired, that value, and the current versions of depends_on
+def _lookup(key, depends_on, ttl):
+    with _lock:
+        current = tuple(_versions.get(name, 0) for name in depends_on)
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+    if entry is not None:
+        versions, loaded_at, value = entry
+        if versions == current and not (ttl and time.monotonic() - loaded_at > ttl):
+            return True, value, current
+    return False, None, current
+
+
+def _store(key, value, depends_on, versions):
+    if value is None:
+        return
+    with _lock:
+        # Don't store the value if a writer bumped a version while we were loading
+        if versions == tuple(_versions.get(name, 0) for name in depends_on):
+            _entries[key] = (versions, time.monotonic(), value)
+            _entries.move_to_end(key)
+            while len(_entries) > MAX_ENTRIES:
+                _entries.popitem(last=False)
+
+
+# Return the cached value for key, calling loader() when it is missing, built from
+# older versions of depends_on, or older than ttl seconds. A loader returning None
+# (e.g. no database connection) is not cached.
+def get_or_load(key, loader, depends_on=(), ttl=None):
+    fresh, value, versions = _lookup(key, depends_on, ttl)
+    if not fresh:
+        if changed_within(depends_on, db.READ_AFTER_WRITE_SECONDS):
+            with db.primary_reads():
+                value = loader()
+        else:
+            value = loader()
+        _store(key, value, depends_on, versions)
+    return value
+
+
+# get_or_load() for a coroutine loader (used by the async JSON API)
+async def get_or_load_async(key, loader, depends_on=(), ttl=None):
+    fresh, value, versions = _lookup(key, depends_on, ttl)
+    if not fresh:
+        value = await loader()
+        _store(key, value, depends_on, versions)
+    return value
+
+
+def invalidate(key):
+    with _lock:
+        _entries.pop(key, None)
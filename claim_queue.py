@@ -0,0 +1,250 @@
+# Optional group-commit ingestion queue for claim submissions
+#
+# When HIMS_CLAIM_QUEUE names a file, submit_claim() appends the claim to that
+# local SQLite queue (WAL mode, synchronous=FULL, so an acknowledged claim
+# survives a crash) instead of writing to MySQL inside the user's rerun. A
+# background thread drains the queue in multi-row INSERTs, one transaction and
+# one commit per batch, and the claims appear in get_policy_holder_claims once
+# their batch is flushed. Each queued claim carries a random ingest_ref stored in
+# claims.ingest_ref (UNIQUE), and refs already in claims are skipped, so a batch
+# that is flushed again after a crash, or by a second process sharing the file,
+# is only recorded once. A claim the database rejects (an unknown holder or
+# policy, an amount out of range) is moved to the queue file's dead_claims table
+# with the error instead of holding up the claims behind it.
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+
+import pymysql
+
+import cache
+import db
+import metrics
+import rollups
+
+QUEUE_PATH = os.environ.get("HIMS_CLAIM_QUEUE")  # unset disables the queue
+BATCH_SIZE = int(os.environ.get("HIMS_CLAIM_QUEUE_BATCH", "500"))  # claims per INSERT and commit
+# Seconds the writer waits after being woken so concurrent submissions share a commit
+FLUSH_DELAY = float(os.environ.get("HIMS_CLAIM_QUEUE_DELAY_MS", "50")) / 1000
+POLL_INTERVAL = 5.0  # seconds between checks for claims queued by other processes
+RETRY_DELAY = 2.0  # seconds to wait after a failed flush
+
+ENABLED = bool(QUEUE_PATH)
+
+logger = logging.getLogger("hims.claim_queue")
+
+_local = threading.local()
+_wakeup = threading.Event()
+_writer = None
+_writer_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"enqueued": 0, "flushed": 0, "duplicates": 0, "dead_lettered": 0, "batches": 0, "errors": 0,
+          "last_error": None}
+
+# Errors that reject one claim's values rather than the whole flush
+ROW_ERRORS = (pymysql.err.IntegrityError, pymysql.err.DataError)
+
+
+def _bump(stat, count=1):
+    with _stats_lock:
+        _stats[stat] += count
+
+
+# This thread's connection to the queue file
+def _queue_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(QUEUE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS queued_claims (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                ingest_ref TEXT NOT NULL UNIQUE,
+                policy_holder_id INTEGER NOT NULL,
+                policy_id INTEGER,
+                claim_amount TEXT NOT NULL,
+                description TEXT,
+                queued_at REAL NOT NULL
+            )
+        """)
+        # Queue files created before claims recorded their policy
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(queued_claims)")}
+        if "policy_id" not in columns:
+            conn.execute("ALTER TABLE queued_claims ADD COLUMN policy_id INTEGER")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_claims (
+                seq INTEGER PRIMARY KEY,
+                ingest_ref TEXT NOT NULL UNIQUE,
+                policy_holder_id INTEGER NOT NULL,
+                policy_id INTEGER,
+                claim_amount TEXT NOT NULL,
+                description TEXT,
+                queued_at REAL NOT NULL,
+                error TEXT NOT NULL,
+                failed_at REAL NOT NULL
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+# Durably queue a claim and return its ingest_ref
+def enqueue(policy_holder_id, claim_amount, description, policy_id=None):
+    ingest_ref = uuid.uuid4().hex
+    _queue_connection().execute(
+        "INSERT INTO queued_claims (ingest_ref, policy_holder_id, policy_id, claim_amount, description, queued_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (ingest_ref, policy_holder_id, policy_id, f"{claim_amount:.2f}", description, time.time()))
+    _bump("enqueued")
+    db.note_write()  # read the claims list from the primary once it's flushed
+    start_writer()
+    _wakeup.set()
+    return ingest_ref
+
+
+# Number of the holder's claims still waiting to be flushed
+def queued_count(policy_holder_id):
+    if not ENABLED:
+        return 0
+    return _queue_connection().execute("SELECT COUNT(*) FROM queued_claims WHERE policy_holder_id = ?",
+                                       (policy_holder_id,)).fetchone()[0]
+
+
+INSERT_QUEUED_CLAIM = """
+    INSERT INTO claims (ingest_ref, policy_holder_id, policy_id, claim_amount, description, status)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+# Insert the batch's new claims one at a time, each behind a savepoint, after the
+# multi-row INSERT was rejected. Returns (inserted rows, duplicate count,
+# [(row, error)] for the claims the database refused).
+def _insert_one_by_one(cursor, rows):
+    inserted, duplicates, failed = [], 0, []
+    for row in rows:
+        cursor.execute("SAVEPOINT queued_claim")
+        try:
+            cursor.execute(INSERT_QUEUED_CLAIM, row[1:] + ('Pending',))
+        except ROW_ERRORS as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT queued_claim")
+            # Another process may have written the same ref since the locking read
+            cursor.execute("SELECT 1 FROM claims WHERE ingest_ref = %s FOR UPDATE", (row[1],))
+            if cursor.fetchone():
+                duplicates += 1
+            else:
+                failed.append((row, str(e)))
+        else:
+            inserted.append(row)
+        cursor.execute("RELEASE SAVEPOINT queued_claim")
+    return inserted, duplicates, failed
+
+
+# Write the oldest batch of queued claims to the database in one transaction and
+# remove them from the queue. Returns the number of queued claims handled.
+@metrics.tagged
+def flush(batch_size=BATCH_SIZE):
+    queue = _queue_connection()
+    batch = queue.execute("SELECT seq, ingest_ref, policy_holder_id, policy_id, claim_amount, description "
+                          "FROM queued_claims ORDER BY seq LIMIT ?", (batch_size,)).fetchall()
+    if not batch:
+        return 0
+
+    conn = db.get_connection()
+    inserted, failed = [], []
+    try:
+        cursor = conn.cursor()
+        # Skip refs a previous flush already wrote; the locking read keeps another
+        # process flushing the same batch from writing them in between
+        refs = [row[1] for row in batch]
+        cursor.execute(f"SELECT ingest_ref FROM claims WHERE ingest_ref IN ({', '.join(['%s'] * len(refs))}) "
+                       "FOR UPDATE", refs)
+        written = {row[0] for row in cursor.fetchall()}
+        new = [row for row in batch if row[1] not in written]
+        duplicates = len(batch) - len(new)
+        if new:
+            cursor.execute("SAVEPOINT queued_batch")
+            try:
+                # pymysql sends this as a single multi-row INSERT (every value
+                # must be a placeholder for it to do so)
+                cursor.executemany(INSERT_QUEUED_CLAIM, [row[1:] + ('Pending',) for row in new])
+                inserted = new
+            except ROW_ERRORS:
+                cursor.execute("ROLLBACK TO SAVEPOINT queued_batch")
+                inserted, late_duplicates, failed = _insert_one_by_one(cursor, new)
+                duplicates += late_duplicates
+            for policy_id, count in Counter(row[3] for row in inserted).items():
+                rollups.record_claims_submitted(cursor, policy_id, count)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    queue.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        for row, error in failed:
+            queue.execute("INSERT OR REPLACE INTO dead_claims (seq, ingest_ref, policy_holder_id, policy_id, "
+                          "claim_amount, description, queued_at, error, failed_at) "
+                          "SELECT seq, ingest_ref, policy_holder_id, policy_id, claim_amount, description, queued_at, "
+                          "?, ? FROM queued_claims WHERE seq = ?", (error, now, row[0]))
+            logger.error("queued claim %s moved to dead_claims: %s", row[1], error)
+        queue.execute("DELETE FROM queued_claims WHERE seq <= ?", (batch[-1][0],))
+        queue.execute("COMMIT")
+    except Exception:
+        queue.execute("ROLLBACK")
+        raise
+    if inserted:
+        cache.bump("claims")
+    with _stats_lock:
+        _stats["flushed"] += len(inserted)
+        _stats["duplicates"] += duplicates
+        _stats["dead_lettered"] += len(failed)
+        _stats["batches"] += 1
+    return len(batch)
+
+
+def _run():
+    while True:
+        if _wakeup.wait(POLL_INTERVAL):
+            # Let the rest of the burst arrive so it shares this commit
+            time.sleep(FLUSH_DELAY)
+        _wakeup.clear()
+        try:
+            while flush() == BATCH_SIZE:
+                pass
+        except Exception as e:
+            logger.exception("flushing queued claims failed; retrying in %.0fs", RETRY_DELAY)
+            with _stats_lock:
+                _stats["errors"] += 1
+                _stats["last_error"] = str(e)
+            time.sleep(RETRY_DELAY)
+
+
+# Start the background writer once per process. Safe to call on every rerun;
+# does nothing when the queue is disabled. Claims left in the queue by a previous
+# run are flushed on start.
+def start_writer():
+    global _writer
+    if not ENABLED or _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run, name="hims-claim-queue", daemon=True)
+            _writer.start()
+            _wakeup.set()
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    queue = _queue_connection()
+    snapshot["queued"] = queue.execute("SELECT COUNT(*) FROM queued_claims").fetchone()[0]
+    snapshot["dead_claims"] = queue.execute("SELECT COUNT(*) FROM dead_claims").fetchone()[0]
+    return snapshot
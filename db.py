@@ -0,0 +1,419 @@
+# Shared database connection pool for the Health Insurance Management System
+#
+# Streamlit re-executes hims.py on every interaction, so anything defined there
+# is rebuilt per rerun. Living in an imported module, this pool is created once
+# per process and shared by every session and every data function.
+#
+# Writes and transactional reads use the primary (get_connection). When
+# HIMS_DB_REPLICAS lists read replicas, get_read_connection() spreads reads over
+# them round-robin, except for a session that committed a write in the last
+# HIMS_READ_AFTER_WRITE_SECONDS (so it reads its own writes) and code running
+# under primary_reads(). A replica that can't be reached is skipped for
+# HIMS_REPLICA_RETRY_AFTER seconds and its reads go to the primary meanwhile.
+# To try it locally, run a second MySQL instance replicating from the first (e.g.
+# on port 3307) and start the app with HIMS_DB_REPLICAS=127.0.0.1:3307; stopping
+# the replica sends reads back to the primary.
+#
+# HIMS_DB_BACKEND=sqlite swaps MySQL for an embedded SQLite database file
+# (sqlite_backend.py); the pool, and everything using it, works the same way.
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+from pymysql import OperationalError
+
+import metrics
+
+# Storage backend: "mysql" (the server below) or "sqlite" (HIMS_SQLITE_PATH)
+BACKENDS = ("mysql", "sqlite")
+BACKEND = os.environ.get("HIMS_DB_BACKEND", "mysql").lower()
+if BACKEND not in BACKENDS:
+    raise ValueError(f"HIMS_DB_BACKEND must be one of {', '.join(BACKENDS)}, not {BACKEND!r}")
+
+# Connection settings (override through environment variables)
+DB_CONFIG = {
+    "host": os.environ.get("HIMS_DB_HOST", "localhost"),
+    "port": int(os.environ.get("HIMS_DB_PORT", "3306")),
+    "user": os.environ.get("HIMS_DB_USER", "root"),
+    "password": os.environ.get("HIMS_DB_PASSWORD", "pwd"),
+    "database": os.environ.get("HIMS_DB_NAME", "HealthInsuranceDB"),
+}
+
+# Read replicas as comma-separated host[:port] entries; they use the user,
+# password and database above (MySQL only)
+REPLICA_HOSTS = [host.strip() for host in os.environ.get("HIMS_DB_REPLICAS", "").split(",")
+                 if host.strip() and BACKEND == "mysql"]
+READ_AFTER_WRITE_SECONDS = float(os.environ.get("HIMS_READ_AFTER_WRITE_SECONDS", "5"))  # longer than replica lag
+REPLICA_RETRY_AFTER = float(os.environ.get("HIMS_REPLICA_RETRY_AFTER", "30"))  # seconds a failed replica is skipped
+REPLICA_CONNECT_TIMEOUT = float(os.environ.get("HIMS_REPLICA_CONNECT_TIMEOUT", "2"))
+# Seconds to wait for a busy replica's pool before trying the next one (0: don't wait)
+REPLICA_CHECKOUT_TIMEOUT = float(os.environ.get("HIMS_REPLICA_CHECKOUT_TIMEOUT", "0"))
+
+# Pool settings
+POOL_SIZE = int(os.environ.get("HIMS_POOL_SIZE", "10"))  # max open connections
+POOL_TIMEOUT = float(os.environ.get("HIMS_POOL_TIMEOUT", "5"))  # seconds to wait for a free connection
+POOL_RECYCLE = float(os.environ.get("HIMS_POOL_RECYCLE", "1800"))  # replace connections older than this
+POOL_PING_AFTER = float(os.environ.get("HIMS_POOL_PING_AFTER", "30"))  # health check connections idle longer than this
+
+# Threads for reads issued concurrently (e.g. the admin dashboard's prefetch),
+# shared by every session and capped at the pool size
+FETCH_WORKERS = int(os.environ.get("HIMS_FETCH_WORKERS", "8"))
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+# Connection handed out by the pool; close() gives it back instead of disconnecting
+class PooledConnection:
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.checked_out = False
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise AttributeError(name)
+        return getattr(raw, name)
+
+    # Cursors time their statements for metrics.py
+    def cursor(self, *args):
+        return metrics.InstrumentedCursor(self._raw.cursor(*args))
+
+    # A commit on the primary starts the session's read-your-writes window
+    def commit(self):
+        self._raw.commit()
+        if self._pool.primary:
+            note_write()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.checked_out:
+            self._pool.release(self)
+
+    def __del__(self):
+        # A checkout that was never closed (e.g. an exception skipped conn.close())
+        # must not keep its slot forever
+        if getattr(self, "checked_out", False):
+            self._pool.discard(self, leaked=True)
+
+
+class ConnectionPool:
+    def __init__(self, config, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, ping_after=POOL_PING_AFTER, primary=True):
+        self.config = config
+        self.primary = primary
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "creations": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+            "leaked": 0,
+        }
+
+    def _connect(self):
+        raw = connect(self.config)
+        with self._cond:
+            self._stats["creations"] += 1
+        return PooledConnection(self, raw)
+
+    def _close_raw(self, conn):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+
+    # Return True if an idle connection can be handed out again
+    def _is_healthy(self, conn):
+        now = time.monotonic()
+        if now - conn.created_at > self.recycle:
+            self._bump("recycled")
+            return False
+        if now - conn.last_used > self.ping_after:
+            try:
+                conn._raw.ping(reconnect=False)
+            except Exception:
+                self._bump("failed_health_checks")
+                return False
+        return True
+
+    def _bump(self, stat):
+        with self._cond:
+            self._stats[stat] += 1
+
+    def connection(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"No database connection available within {timeout:.1f}s "
+                                          f"(pool size {self.size})")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._open += 1
+
+            # Health checks and new connections happen outside the lock so other
+            # checkouts are not blocked on network round trips
+            if conn is not None:
+                if self._is_healthy(conn):
+                    break
+                self.discard(conn)
+                continue
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            break
+
+        with self._cond:
+            return self._checkout(conn, waited, started)
+
+    def _checkout(self, conn, waited, started):
+        conn.checked_out = True
+        conn.last_used = time.monotonic()
+        self._stats["checkouts"] += 1
+        if waited:
+            self._stats["waits"] += 1
+            self._stats["wait_time"] += conn.last_used - started
+        return conn
+
+    def release(self, conn):
+        conn.checked_out = False
+        try:
+            # End any transaction left open (including read-only snapshots) so the
+            # next user starts clean
+            conn._raw.rollback()
+        except Exception:
+            self.discard(conn)
+            return
+        with self._cond:
+            conn.last_used = time.monotonic()
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn, leaked=False):
+        conn.checked_out = False
+        self._close_raw(conn)
+        with self._cond:
+            self._open -= 1
+            if leaked:
+                self._stats["leaked"] += 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = self._open
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._open - len(self._idle)
+        return stats
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            self._close_raw(conn)
+
+
+# Open a connection to the configured backend
+def connect(config):
+    if BACKEND == "sqlite":
+        import sqlite_backend
+        return sqlite_backend.connect()
+    return pymysql.connect(**config)
+
+
+# Where the data lives, for reports and log lines
+def describe():
+    if BACKEND == "sqlite":
+        import sqlite_backend
+        return f"sqlite:{sqlite_backend.SQLITE_PATH}"
+    return f"mysql://{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG)
+    return _pool
+
+
+# Check a connection out of the shared pool; call close() on it to give it back
+def get_connection(timeout=None):
+    return get_pool().connection(timeout)
+
+
+def pool_stats():
+    stats = get_pool().stats()
+    if REPLICA_HOSTS:
+        now = time.monotonic()
+        with _routing_lock:
+            stats["reads"] = dict(_read_stats)
+            down_until = dict(_replica_down_until)
+        stats["replicas"] = {host: dict(pool.stats(), available=down_until.get(host, 0) <= now)
+                             for host, pool in get_replica_pools().items()}
+    return stats
+
+
+# Routing state of the current Streamlit session ({"last_write": monotonic time}),
+# bound for each rerun by bind_session(); fetch threads inherit it through
+# contextvars.copy_context()
+_session_routing = contextvars.ContextVar("session_routing", default=None)
+_force_primary = contextvars.ContextVar("force_primary", default=False)
+
+_replica_pools = None
+_replica_down_until = {}  # host -> monotonic time before which it isn't tried (under _routing_lock)
+_next_replica = itertools.count()
+_routing_lock = threading.Lock()
+_read_stats = {"primary": 0, "replica": 0, "failovers": 0}
+
+logger = logging.getLogger("hims.db")
+
+
+# Use state (a dict kept in the session, e.g. in st.session_state) for the
+# read-your-writes window of the code that runs in this context
+def bind_session(state):
+    _session_routing.set(state)
+
+
+def note_write():
+    state = _session_routing.get()
+    if state is not None:
+        state["last_write"] = time.monotonic()
+
+
+def wrote_recently():
+    state = _session_routing.get()
+    return state is not None and time.monotonic() - state.get("last_write", float("-inf")) < READ_AFTER_WRITE_SECONDS
+
+
+# Send every read made inside the block to the primary
+@contextmanager
+def primary_reads():
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def replica_config(host):
+    host, _, port = host.partition(":")
+    return dict(DB_CONFIG, host=host, port=int(port) if port else DB_CONFIG["port"],
+                connect_timeout=REPLICA_CONNECT_TIMEOUT)
+
+
+# host -> pool for each configured replica
+def get_replica_pools():
+    global _replica_pools
+    if _replica_pools is None:
+        with _pool_lock:
+            if _replica_pools is None:
+                _replica_pools = {host: ConnectionPool(replica_config(host), primary=False) for host in REPLICA_HOSTS}
+    return _replica_pools
+
+
+def _count_read(route):
+    with _routing_lock:
+        _read_stats[route] += 1
+
+
+# Check out a connection for reads that may be slightly behind the primary: a
+# replica when one is configured and available, otherwise the primary. A replica
+# whose pool is full is skipped after REPLICA_CHECKOUT_TIMEOUT rather than the
+# full pool timeout, so busy replicas don't add up to a long wait; the timeout
+# argument applies to the primary. Don't write through it.
+def get_read_connection(timeout=None):
+    if REPLICA_HOSTS and not _force_primary.get() and not wrote_recently():
+        pools = list(get_replica_pools().items())
+        first = next(_next_replica)
+        for i in range(len(pools)):
+            host, pool = pools[(first + i) % len(pools)]
+            with _routing_lock:
+                down_until = _replica_down_until.get(host, 0)
+            if down_until > time.monotonic():
+                continue
+            try:
+                conn = pool.connection(REPLICA_CHECKOUT_TIMEOUT)
+            except PoolTimeout:
+                continue  # busy, not down
+            except OperationalError as e:
+                logger.warning("replica %s unavailable, reading from the primary for %.0fs: %s",
+                               host, REPLICA_RETRY_AFTER, e)
+                with _routing_lock:
+                    _replica_down_until[host] = time.monotonic() + REPLICA_RETRY_AFTER
+                continue
+            _count_read("replica")
+            return conn
+        _count_read("failovers")
+    _count_read("primary")
+    return get_connection(timeout)
+
+
+_fetch_executor = None
+_fetch_thread = threading.local()
+
+
+def _mark_fetch_thread():
+    _fetch_thread.active = True
+
+
+def get_fetch_executor():
+    global _fetch_executor
+    if _fetch_executor is None:
+        with _pool_lock:
+            if _fetch_executor is None:
+                _fetch_executor = ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, POOL_SIZE)),
+                                                     thread_name_prefix="hims-fetch",
+                                                     initializer=_mark_fetch_thread)
+    return _fetch_executor
+
+
+# True on the fetch executor's threads, which must not call Streamlit
+def in_fetch_thread():
+    return getattr(_fetch_thread, "active", False)
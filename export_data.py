@@ -0,0 +1,227 @@
+# Streaming extracts of claims, purchases and the log tables for actuarial use
+#
+#   python export_data.py claims --status Approved --status Rejected --output claims.parquet
+#   python export_data.py claims --start 2024-01-01 --end 2024-03-31 --output q1_claims.csv.gz
+#   python export_data.py policy_purchases --start 2024-01-01 --end 2024-12-31 --output purchases.csv.gz
+#   python export_data.py claim_status_change_logs --status Approved --output approvals.csv
+#
+# Rows are read through an unbuffered server-side cursor (SSCursor) CHUNK_SIZE at
+# a time, and each chunk is written out before the next one is fetched, so memory
+# stays flat however large the table is. CSV output is gzip-compressed when the
+# file name ends in .gz; Parquet output (pip install pyarrow) gets one row group
+# per chunk. Claims have no date of their own and are filtered by their
+# submission date in claim_submission_logs (claims whose logs were archived by
+# audit_logs.py aren't matched by a date filter). Exports read from a replica
+# when one is configured. The admin page's Data Export section calls export() the
+# same way.
+import argparse
+import csv
+import gzip
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from pymysql.constants import FIELD_TYPE
+
+import audit_logs
+import db
+
+CHUNK_SIZE = 50000
+FORMATS = ("csv", "parquet")
+
+# dataset -> (date column, status column, order column); None where the table has
+# no such column. The log tables are partitioned, so they are read in storage
+# order rather than sorted.
+DATASETS = {
+    "claims": ("submission_date", "status", "claim_id"),
+    "policy_purchases": ("purchase_date", None, "purchase_id"),
+}
+DATASETS.update({table: (column, "new_status" if table == "claim_status_change_logs" else None, None)
+                 for table, column in audit_logs.LOG_TABLES.items()})
+# Datasets whose date column is in another table: dataset -> (key column, table)
+DATE_TABLES = {"claims": ("claim_id", "claim_submission_logs")}
+
+INTEGER_TYPES = {FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.INT24, FIELD_TYPE.LONGLONG,
+                 FIELD_TYPE.YEAR}
+FLOAT_TYPES = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE}
+DECIMAL_TYPES = {FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+DATETIME_TYPES = {FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP}
+DATE_TYPES = {FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE}
+STRING_TYPES = {FIELD_TYPE.VARCHAR, FIELD_TYPE.VAR_STRING, FIELD_TYPE.STRING, FIELD_TYPE.ENUM, FIELD_TYPE.SET,
+                FIELD_TYPE.BLOB, FIELD_TYPE.TINY_BLOB, FIELD_TYPE.MEDIUM_BLOB, FIELD_TYPE.LONG_BLOB,
+                FIELD_TYPE.JSON}
+
+
+class ExportError(Exception):
+    pass
+
+
+# SELECT statement and parameters for a dataset with optional filters; start and
+# end are dates, both inclusive
+def export_query(dataset, start=None, end=None, statuses=()):
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset {dataset!r}; expected one of {', '.join(DATASETS)}")
+    date_column, status_column, order_column = DATASETS[dataset]
+    conditions, params = [], []
+    if start or end:
+        if date_column is None:
+            raise ExportError(f"{dataset} has no date column to filter on")
+        date_conditions = []
+        if start:
+            date_conditions.append(f"{date_column} >= %s")
+            params.append(start)
+        if end:
+            date_conditions.append(f"{date_column} < %s")
+            params.append(end + timedelta(days=1))
+        if dataset in DATE_TABLES:
+            key_column, table = DATE_TABLES[dataset]
+            conditions.append(f"{key_column} IN (SELECT {key_column} FROM {table} "
+                              f"WHERE {' AND '.join(date_conditions)})")
+        else:
+            conditions.extend(date_conditions)
+    if statuses:
+        if status_column is None:
+            raise ExportError(f"{dataset} has no status column to filter on")
+        conditions.append(f"{status_column} IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+    query = f"SELECT * FROM {dataset}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if order_column:
+        query += f" ORDER BY {order_column}"
+    return query, params
+
+
+def format_for(path):
+    return "parquet" if path.endswith(".parquet") else "csv"
+
+
+class CsvWriter:
+    def __init__(self, output, columns):
+        self.file = gzip.open(output, "wt", newline="", encoding="utf-8") if output.endswith(".gz") \
+            else open(output, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, output, columns, description):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.pq = pq
+        self.output = output
+        self.columns = columns
+        self.types = [self.arrow_type(column) for column in description]
+        self.writer = None
+
+    # Arrow type for a cursor description entry, or None to infer it from the data
+    def arrow_type(self, column):
+        type_code, scale = column[1], column[5]
+        if type_code in INTEGER_TYPES:
+            return self.pa.int64()
+        if type_code in FLOAT_TYPES:
+            return self.pa.float64()
+        if type_code in DECIMAL_TYPES:
+            return self.pa.decimal128(38, scale or 0)
+        if type_code in DATETIME_TYPES:
+            return self.pa.timestamp("us")
+        if type_code in DATE_TYPES:
+            return self.pa.date32()
+        if type_code in STRING_TYPES:
+            return self.pa.string()
+        return None
+
+    def write(self, rows):
+        values = list(zip(*rows))
+        arrays = [self.pa.array(column, type=arrow_type) for column, arrow_type in zip(values, self.types)]
+        if self.writer is None:
+            # Types the description didn't give are fixed by the first chunk
+            self.types = [array.type for array in arrays]
+            schema = self.pa.schema(list(zip(self.columns, self.types)))
+            self.writer = self.pq.ParquetWriter(self.output, schema, compression="snappy")
+        self.writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, names=self.columns))
+
+    def close(self):
+        if self.writer is None:
+            schema = self.pa.schema([(name, arrow_type or self.pa.null())
+                                     for name, arrow_type in zip(self.columns, self.types)])
+            self.writer = self.pq.ParquetWriter(self.output, schema)
+        self.writer.close()
+
+
+# Stream a dataset to output. progress(rows) is called after every chunk. Returns
+# {"rows", "seconds", "rows_per_second", "bytes"}.
+def export(dataset, output, fmt=None, start=None, end=None, statuses=(), chunk_size=CHUNK_SIZE, progress=None):
+    fmt = fmt or format_for(output)
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    query, params = export_query(dataset, start, end, statuses)
+
+    started = time.perf_counter()
+    rows_written = 0
+    conn = db.get_read_connection()
+    try:
+        cursor = conn.cursor(db.pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            writer = ParquetWriter(output, columns, cursor.description) if fmt == "parquet" \
+                else CsvWriter(output, columns)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    writer.write(rows)
+                    rows_written += len(rows)
+                    if progress:
+                        progress(rows_written)
+            finally:
+                writer.close()
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows_written,
+        "seconds": seconds,
+        "rows_per_second": rows_written / seconds if seconds else 0.0,
+        "bytes": os.path.getsize(output),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a table to CSV or Parquet for actuarial analysis")
+    parser.add_argument("dataset", choices=list(DATASETS))
+    parser.add_argument("--output", required=True, help="file to write (.csv, .csv.gz or .parquet)")
+    parser.add_argument("--format", choices=FORMATS, help="output format (default: from the file name)")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day to include")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day to include")
+    parser.add_argument("--status", action="append", default=[], help="include only this status; repeatable")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows fetched and written at a time")
+    args = parser.parse_args()
+
+    try:
+        stats = export(args.dataset, args.output, args.format, args.start, args.end, args.status,
+                       args.chunk_size, progress=lambda rows: print(f"  {rows:,} rows", end="\r", file=sys.stderr))
+    except ExportError as e:
+        sys.exit(f"error: {e}")
+    print(f"Exported {stats['rows']:,} rows to {args.output} in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_second']:,.0f} rows/s, {stats['bytes'] / 1e6:,.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
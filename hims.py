@@ -1,46 +1,126 @@
 # Trial_App.py with Data Visualisation under report & analytics 
 import streamlit as st
-import pymysql
 from pymysql import OperationalError
 import base64
+import contextvars
+import io
+import os
+import re
 
-import matplotlib.pyplot as plt
-import pandas as pd
-import plotly.express as px
-from datetime import datetime
+import cache
+import claim_queue
+import db
+import metrics
+import queries
+import rollups
 
-# Initialize the total premium variable globally
-total_premium_collected = 0
+from datetime import date, datetime, timedelta
 
-# Initialize the total claims approved variable globally
-total_claims_approved = 0
+# pandas and plotly are imported inside the reporting functions that use them, so
+# sessions that never render the admin reports don't pay for loading them
+# (startup_report.py --check guards this)
 
-# Database connection function
+# Database connection function (checks a connection out of the shared pool;
+# conn.close() returns it to the pool)
 def create_connection():
     try:
-        connection = pymysql.connect(
-            host="localhost",
-            user="root",
-            password="pwd",
-            database="HealthInsuranceDB"
-        )
-        return connection
+        return db.get_connection()
     except OperationalError as e:
+        if db.in_fetch_thread():
+            raise  # memoized() retries on the script thread, which reports it
         st.error(f"Database connection error: {e}")
         return None
 
+# Connection for reads that tolerate replica lag: a read replica when one is
+# configured (db.py falls back to the primary), the primary for a while after this
+# session writes
+def create_read_connection():
+    try:
+        return db.get_read_connection()
+    except OperationalError as e:
+        if db.in_fetch_thread():
+            raise
+        st.error(f"Database connection error: {e}")
+        return None
+
+# Results of data lookups made during the current rerun, and lookups started ahead
+# of rendering by prefetch(). Streamlit re-executes this script on every
+# interaction, so both start empty each time.
+rerun_memo = {}
+prefetched = {}
+
+# Versions of the cached data, to tell whether a write happened since a prefetch
+def data_versions():
+    return tuple(cache.version(name) for name in ("policies", "claims", "purchases", "policy_holders"))
+
+# Call func(*args) at most once per rerun. A prefetched result is used if no write
+# happened on this node since it was started. Otherwise, or if the prefetch failed,
+# func runs again here, where any error can be shown on the page.
+def memoized(func, *args):
+    key = (func.__name__,) + args
+    if key not in rerun_memo:
+        fetched = prefetched.pop(key, None)
+        value = None
+        if fetched is not None and fetched[0] == data_versions():
+            try:
+                value = (fetched[1].result(),)
+            except Exception:
+                pass
+        rerun_memo[key] = value[0] if value else func(*args)
+    return rerun_memo[key]
+
+# Start func(*args) on the shared fetch threads so independent reads overlap;
+# memoized(func, *args) later in the rerun waits for the result. Fetch threads
+# have no page to write to, so data functions must not call st.* there.
+def prefetch(func, *args):
+    key = (func.__name__,) + args
+    if key not in rerun_memo and key not in prefetched:
+        # The copied context carries the session's read routing to the fetch thread
+        prefetched[key] = (data_versions(),
+                           db.get_fetch_executor().submit(contextvars.copy_context().run, func, *args))
+
+# Background images live here and are served by Streamlit at app/static/ when
+# server.enableStaticServing is on (see .streamlit/config.toml)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
 # Function to encode the image to base64
 def get_base64_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
-# Function to set page style with conditional background
-def set_page_style(background_image_path):
-    base64_image = get_base64_image(background_image_path)
-    page_bg = f"""
+# CSS background-image declarations for an image in static/. With static serving
+# the browser fetches and caches the file itself (preferring a .webp variant when
+# one exists, and re-fetching when the version tag changes); otherwise the image is
+# inlined as a base64 data URI.
+def background_image_css(image_name, static_serving, version):
+    if not static_serving:
+        base64_image = get_base64_image(os.path.join(STATIC_DIR, image_name))
+        return f'background-image: url("data:image/png;base64,{base64_image}");'
+
+    png_url = f"app/static/{image_name}?v={version}"
+    css = f'background-image: url("{png_url}");'
+    webp_name = os.path.splitext(image_name)[0] + ".webp"
+    if os.path.exists(os.path.join(STATIC_DIR, webp_name)):
+        css += (f'\n        background-image: image-set(url("app/static/{webp_name}?v={version}") type("image/webp"), '
+                f'url("{png_url}") type("image/png"));')
+    return css
+
+# Function to set page style with conditional background. The stylesheet is built
+# once per process for each image and file version, not on every rerun.
+def set_page_style(image_name):
+    image_path = os.path.join(STATIC_DIR, image_name)
+    webp_path = os.path.splitext(image_path)[0] + ".webp"
+    version = int(max(os.path.getmtime(path) for path in (image_path, webp_path) if os.path.exists(path)))
+    static_serving = st.get_option("server.enableStaticServing")
+    page_bg = cache.get_or_load(("page_style", image_name, static_serving, version),
+                                lambda: page_style_css(background_image_css(image_name, static_serving, version)))
+    st.markdown(page_bg, unsafe_allow_html=True)
+
+def page_style_css(background_css):
+    return f"""
     <style>
     .stApp {{
-        background-image: url("data:image/png;base64,{base64_image}");
+        {background_css}
         background-size: cover;
         background-position: center;
         background-attachment: fixed;
@@ -116,7 +196,6 @@ def set_page_style(background_image_path):
     }}
     </style>
     """
-    st.markdown(page_bg, unsafe_allow_html=True)
 
 # Apply the appropriate background based on login state
 if st.session_state.get("logged_in", False):
@@ -124,6 +203,7 @@ if st.session_state.get("logged_in", False):
 else:
     set_page_style("LoginPageBackground.png")   # Login/registration background
 
+@metrics.tagged
 def register_user(username, password):
     conn = create_connection()
     if conn is None:
@@ -141,13 +221,14 @@ def register_user(username, password):
     finally:
         conn.close()
 
+@metrics.tagged
 def login(username, password):
-    conn = create_connection()
+    conn = create_read_connection()
     if conn is None:
         return None, None
     
     cursor = conn.cursor()
-    cursor.execute("SELECT role, user_id FROM users WHERE username = %s and password = %s", (username, password))
+    cursor.execute(queries.LOGIN, (username, password))
     result = cursor.fetchone()
     conn.close()
 
@@ -157,6 +238,7 @@ def login(username, password):
         return None, None
    
 # Add new policy holder
+@metrics.tagged
 def add_policy_holder(name, age, contact, address):
     conn = create_connection()
     if conn is None:
@@ -169,19 +251,69 @@ def add_policy_holder(name, age, contact, address):
     conn.close()
     st.success("Policy holder added successfully.")
 
-# View all policy holders
-def view_policy_holders():
-    conn = create_connection()
+# Page sizes offered in the policy holder directory
+HOLDER_PAGE_SIZES = [25, 50, 100, 250]
+
+# Fields the policy holder directory searches by
+HOLDER_SEARCH_FIELDS = ["Name", "Contact", "ID"]
+
+# Shortest word the FULLTEXT index holds (innodb_ft_min_token_size)
+FULLTEXT_MIN_WORD = 3
+
+# LIKE pattern matching values that start with term
+def like_prefix(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+# WHERE clause (and its parameters) for a policy holder directory search. Each
+# form is served by an index: ID by the primary key, contacts and short names by
+# prefix indexes, and longer names by the FULLTEXT index (the FTS5 table on
+# SQLite), matching any word of the name that starts with the words searched for.
+def holder_search_filter(search_by, term):
+    term = term.strip()
+    if not term:
+        return "1 = 1", []
+    if search_by == "ID":
+        return ("id = %s", [int(term)]) if term.isdigit() else ("1 = 0", [])
+    if search_by == "Contact":
+        return "contact LIKE %s", [like_prefix(term)]
+    words = re.findall(r"\w+", term)
+    if words and all(len(word) >= FULLTEXT_MIN_WORD for word in words):
+        if db.BACKEND == "sqlite":
+            return ("id IN (SELECT rowid FROM policy_holders_fts WHERE policy_holders_fts MATCH %s)",
+                    [" ".join(f'"{word}"*' for word in words)])
+        return "MATCH(name) AGAINST (%s IN BOOLEAN MODE)", [" ".join(f"+{word}*" for word in words)]
+    return "name LIKE %s", [like_prefix(term)]
+
+# Fetch one page of the policy holder directory after the given holder ID (keyset
+# pagination on the primary key), with only the columns the directory shows.
+# Returns the page and whether more holders follow it.
+@metrics.tagged
+def search_policy_holders(search_by, term, after_id, page_size):
+    conn = create_read_connection()
     if conn is None:
-        return []
-    
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM policy_holders")
-    policy_holders = cursor.fetchall()
-    conn.close()
-    return policy_holders
+        return [], False
+
+    where, params = holder_search_filter(search_by, term)
+    # Fetch one extra row to know whether there is a next page
+    query = f"""
+        SELECT id, name, age, contact, user_id
+        FROM policy_holders
+        WHERE {where} AND id > %s
+        ORDER BY id
+        LIMIT %s
+    """
+    params += [after_id, page_size + 1]
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        holders = cursor.fetchall()
+    finally:
+        conn.close()
+    return holders[:page_size], len(holders) > page_size
 
 # Add new policy
+@metrics.tagged
 def add_policy(policy_name, policy_details, premium):
     conn = create_connection()
     if conn is None:
@@ -192,8 +324,10 @@ def add_policy(policy_name, policy_details, premium):
                    (policy_name, policy_details, premium))
     conn.commit()
     conn.close()
+    cache.bump("policies")
 
 # Update existing policy
+@metrics.tagged
 def update_policy(policy_id, policy_name, premium, coverage_amount):
     conn = create_connection()
     if conn is None:
@@ -204,38 +338,46 @@ def update_policy(policy_id, policy_name, premium, coverage_amount):
                    (policy_name, premium, coverage_amount, policy_id))
     conn.commit()
     conn.close()
+    cache.bump("policies")
     st.success("Policy updated successfully.")
 
 # Premium calculation (based on coverage and age factors for simplicity)
 def calculate_premium(coverage_amount, age):
-    base_rate = 0.05
-    age_factor = 1.2 if age > 45 else 1.0
-    premium = coverage_amount * base_rate * age_factor
-    return premium
+    import rating  # NumPy loads on first quote, not at startup
+    return rating.quote(coverage_amount, age)
 
+@metrics.tagged
 def get_policy_holder_id(user_id):
-    conn = create_connection()
+    conn = create_read_connection()
     if conn is None:
         return None
     
     cursor = conn.cursor()
-    cursor.execute("SELECT id FROM policy_holders WHERE user_id = %s", (user_id,))
+    cursor.execute(queries.POLICY_HOLDER_ID, (user_id,))
     result = cursor.fetchone()
     conn.close()
     
     return result[0] if result else None
 
-def view_policies():
-    conn = create_connection()
+@metrics.tagged
+def load_policies():
+    conn = create_read_connection()
     if conn is None:
-        return []
+        return None
     
     cursor = conn.cursor()
-    cursor.execute("SELECT policy_id, policy_name, policy_details, premium FROM policies")
+    cursor.execute(queries.POLICY_CATALOG)
     policies = cursor.fetchall()
     conn.close()
     return policies
 
+# Policy catalog served from the shared cache; add/update/delete_policy invalidate it
+def view_policies():
+    policies = cache.get_or_load("policy_catalog", load_policies,
+                                 depends_on=("policies",), ttl=cache.CATALOG_TTL)
+    return list(policies) if policies else []
+
+@metrics.tagged
 def buy_policy(user_id, policy_id, name, age, contact, address):
     conn = create_connection()
     if conn is None:
@@ -244,40 +386,19 @@ def buy_policy(user_id, policy_id, name, age, contact, address):
     try:
         cursor = conn.cursor()
 
-        # Check if the policy holder already exists
-        cursor.execute("""
-            SELECT id FROM policy_holders WHERE user_id = %s
-        """, (user_id,))
-        existing_policy_holder = cursor.fetchone()
-
-        # If policy holder exists, use their ID; otherwise, insert new record
-        if existing_policy_holder:
-            policy_holder_id = existing_policy_holder[0]
-        else:
-            # Insert new policy holder
-            cursor.execute("""
-                INSERT INTO policy_holders (user_id, name, age, contact, address) 
-                VALUES (%s, %s, %s, %s, %s)
-            """, (user_id, name, age, contact, address))
-            policy_holder_id = cursor.lastrowid  # Get the newly inserted policy holder ID
-        
-          # Fetch the premium amount for the selected policy
-        cursor.execute("""
-            SELECT premium FROM policies WHERE policy_id = %s
-        """, (policy_id,))
-        premium_amount = cursor.fetchone()[0]
+        # Create the policy holder record on the first purchase; concurrent
+        # purchases by the same user all resolve to the one record
+        cursor.execute(queries.UPSERT_POLICY_HOLDER, (user_id, name, age, contact, address))
 
-        # Update the total premium collected
-        global total_premium_collected
-        total_premium_collected += premium_amount
-
-        # Add to policy_purchases
-        cursor.execute("""
-            INSERT INTO policy_purchases (user_id, policy_id)
-            VALUES (%s, %s)
-        """, (user_id, policy_id))
+        # Add to policy_purchases (the premium is added to the daily rollup)
+        if not cursor.execute(queries.INSERT_PURCHASE, (user_id, policy_id)):
+            conn.rollback()
+            st.error("This policy is no longer available.")
+            return False
+        rollups.record_purchase(cursor, policy_id)
 
         conn.commit()
+        cache.bump("purchases", "policy_holders")
         return True
     except Exception as e:
         st.error(f"Error purchasing policy: {e}")
@@ -286,31 +407,21 @@ def buy_policy(user_id, policy_id, name, age, contact, address):
     finally:
         conn.close()
 
-# Add this new function to get user's purchased policies and latest purchased policy (Nested Query)
+# Get user's purchased policies with the latest purchase date of each
+@metrics.tagged
 def get_user_policies(user_id):
-    conn = create_connection()
+    conn = create_read_connection()
     if conn is None:
         return []
 
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT p.policy_id, p.policy_name, p.policy_details, p.premium,
-            (SELECT MAX(pp.purchase_date) 
-             FROM policy_purchases pp 
-             WHERE pp.policy_id = p.policy_id AND pp.user_id = %s) AS latest_purchase_date
-        FROM policies p
-        WHERE p.policy_id IN (
-            SELECT pp.policy_id
-            FROM policy_purchases pp
-            WHERE pp.user_id = %s
-        )
-        ORDER BY latest_purchase_date DESC
-    """, (user_id, user_id))
+    cursor.execute(queries.USER_POLICIES, (user_id,))
     
     policies = cursor.fetchall()
     conn.close()
     return policies
 
+@metrics.tagged
 def delete_policy(policy_id):
     conn = create_connection()
     if conn is None:
@@ -320,6 +431,7 @@ def delete_policy(policy_id):
         cursor = conn.cursor()
         cursor.execute("DELETE FROM policies WHERE policy_id = %s", (policy_id,))
         conn.commit()
+        cache.bump("policies")
         return True
     except Exception as e:
         st.error(f"Error deleting policy: {e}")
@@ -329,45 +441,194 @@ def delete_policy(policy_id):
         conn.close()
 
 # Submit a claim
-def submit_claim(policy_holder_id, claim_amount, description):
+@metrics.tagged
+def submit_claim(policy_holder_id, claim_amount, description, policy_id=None):
+    # Ingestion mode: acknowledge once the claim is in the durable local queue;
+    # the background writer adds it to the claims table shortly after
+    if claim_queue.ENABLED:
+        try:
+            claim_queue.enqueue(policy_holder_id, claim_amount, description, policy_id)
+        except Exception as e:
+            st.error(f"Error submitting claim: {e}")
+            return
+        st.success("Claim received. It will appear under Your Claims within a few seconds.")
+        return
+
     conn = create_connection()
     if conn is None:
         return
     
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO claims (policy_holder_id, claim_amount, description, status) VALUES (%s, %s, %s, %s)",
-                   (policy_holder_id, claim_amount, description, 'Pending'))
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(queries.INSERT_CLAIM, (policy_holder_id, policy_id, claim_amount, description, 'Pending'))
+        rollups.record_claims_submitted(cursor, policy_id)
+        conn.commit()
+    except Exception as e:
+        st.error(f"Error submitting claim: {e}")
+        conn.rollback()
+        return
+    finally:
+        conn.close()
+    cache.bump("claims")
     st.success("Claim submitted successfully.")
 
 # Process claim by admin
 def process_claim(claim_id, action):
-    conn = create_connection()
-    if conn is None:
-        return
-    
-    cursor = conn.cursor()
     status = 'Approved' if action == 'approve' else 'Rejected'
-    cursor.execute("UPDATE claims SET status = %s WHERE claim_id = %s", (status, claim_id))
-    conn.commit()
-    conn.close()
-    st.success(f"Claim {status} successfully.")
+    update_claim_status(claim_id, status)
 
-# View claims for processing by admin
-def view_claims():
+# Page sizes offered in the claims review queue
+CLAIMS_PAGE_SIZES = [10, 25, 50, 100]
+
+# Max claim IDs per IN (...) list in bulk adjudication
+BULK_CLAIMS_CHUNK = 1000
+
+# WHERE clause (and its parameters) selecting pending claims that match the
+# admin's amount range and policy holder filters
+def pending_claims_filter(min_amount=None, max_amount=None, policy_holder_id=None):
+    where = "status = 'Pending'"
+    params = []
+    if min_amount is not None:
+        where += " AND claim_amount >= %s"
+        params.append(min_amount)
+    if max_amount is not None:
+        where += " AND claim_amount <= %s"
+        params.append(max_amount)
+    if policy_holder_id is not None:
+        where += " AND policy_holder_id = %s"
+        params.append(policy_holder_id)
+    return where, params
+
+# Fetch one page of pending claims after the given claim ID (keyset pagination on
+# the claims(status, claim_id) index), optionally filtered by amount range and
+# policy holder. Returns the page and whether more claims follow it.
+@metrics.tagged
+def get_pending_claims_page(after_claim_id, page_size, min_amount=None, max_amount=None,
+                            policy_holder_id=None):
+    conn = create_read_connection()
+    if conn is None:
+        return [], False
+
+    where, params = pending_claims_filter(min_amount, max_amount, policy_holder_id)
+    # Fetch one extra row to know whether there is a next page
+    query = f"""
+        SELECT claim_id, policy_holder_id, claim_amount, description, status
+        FROM claims
+        WHERE {where} AND claim_id > %s
+        ORDER BY claim_id
+        LIMIT %s
+    """
+    params += [after_claim_id, page_size + 1]
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        claims = cursor.fetchall()
+    finally:
+        conn.close()
+    return claims[:page_size], len(claims) > page_size
+
+# Approve or reject many pending claims in one transaction. Either pass the claim
+# IDs, or filters=(min_amount, max_amount, policy_holder_id) to act on every
+# pending claim matching them. Returns a list of (claim_id, outcome), or None if
+# the transaction failed.
+@metrics.tagged
+def bulk_update_claim_status(new_status, claim_ids=None, filters=None):
     conn = create_connection()
     if conn is None:
-        return
-    
-    cursor = conn.cursor()
-    cursor.execute("SELECT claim_id, policy_holder_id, claim_amount, description, status FROM claims WHERE status = 'Pending'")
-    pending_claims = cursor.fetchall()
+        return None
+
+    results = []
+    try:
+        cursor = conn.cursor()
+        if filters is not None:
+            where, params = pending_claims_filter(*filters)
+            cursor.execute(f"SELECT claim_id FROM claims WHERE {where} ORDER BY claim_id FOR UPDATE", params)
+            claim_ids = [row[0] for row in cursor.fetchall()]
+
+        claim_ids = sorted(set(claim_ids or []))
+        for i in range(0, len(claim_ids), BULK_CLAIMS_CHUNK):
+            chunk = claim_ids[i:i + BULK_CLAIMS_CHUNK]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            # Lock the rows so the outcome we report is the one we commit
+            cursor.execute(f"SELECT claim_id, status FROM claims WHERE claim_id IN ({placeholders}) FOR UPDATE", chunk)
+            current = dict(cursor.fetchall())
+            pending = [claim_id for claim_id in chunk if current.get(claim_id) == 'Pending']
+            if pending:
+                placeholders = ", ".join(["%s"] * len(pending))
+                # One statement per chunk; the after_claim_status_change trigger still
+                # fires and logs once for every row it changes
+                cursor.execute(f"UPDATE claims SET status = %s WHERE claim_id IN ({placeholders}) AND status = 'Pending'",
+                               [new_status] + pending)
+                if new_status == 'Approved':
+                    rollups.record_claims_approved(cursor, pending)
+            for claim_id in chunk:
+                if claim_id not in current:
+                    results.append((claim_id, "Not found"))
+                elif current[claim_id] == 'Pending':
+                    results.append((claim_id, new_status))
+                else:
+                    results.append((claim_id, f"Skipped (already {current[claim_id]})"))
+        conn.commit()
+    except Exception as e:
+        st.error(f"Error updating claims: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+    cache.bump("claims")
+    return results
+
+# Arguments of get_pending_claims_page() for the claims queue's filters. Starts
+# again from the first page whenever the filters change; the stack in session
+# state holds the claim ID each visited page starts after.
+def claims_page_args(min_amount, max_amount, holder_id, page_size):
+    filters = (min_amount, max_amount, holder_id, page_size)
+    if st.session_state.get("claims_filters") != filters:
+        st.session_state.claims_filters = filters
+        st.session_state.claims_page_starts = [0]
+    after_claim_id = st.session_state.claims_page_starts[-1]
+    return after_claim_id, page_size, min_amount or None, max_amount or None, holder_id or None
+
+# View claims for processing by admin, one page at a time
+def view_claims():
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        min_amount = st.number_input("Min Claim Amount", min_value=0.0, step=100.0, key="claims_min_amount")
+    with col2:
+        max_amount = st.number_input("Max Claim Amount (0 = any)", min_value=0.0, step=100.0, key="claims_max_amount")
+    with col3:
+        holder_id = st.number_input("Policy Holder ID (0 = all)", min_value=0, step=1, key="claims_holder_id")
+    with col4:
+        page_size = st.selectbox("Claims per Page", CLAIMS_PAGE_SIZES, key="claims_page_size")
+
+    page_args = claims_page_args(min_amount, max_amount, holder_id, page_size)
+    page_starts = st.session_state.claims_page_starts
+    claim_filters = page_args[2:]
+    pending_claims, has_more = memoized(get_pending_claims_page, *page_args)
+
+    # Result of the last bulk action, kept across the rerun that refreshes the queue
+    bulk_summary = st.session_state.pop("claims_bulk_summary", None)
+    if bulk_summary is not None:
+        new_status, results = bulk_summary
+        changed = sum(1 for _, outcome in results if outcome == new_status)
+        st.success(f"{changed} of {len(results)} claims {new_status.lower()}.")
+        if results:
+            with st.expander("Per-claim results"):
+                st.dataframe([{"Claim ID": claim_id, "Result": outcome} for claim_id, outcome in results],
+                             hide_index=True)
+
+    # Claims ticked for bulk adjudication, kept across pages
+    selected = st.session_state.setdefault("claims_selected", set())
     
     if pending_claims:
         for claim in pending_claims:
             claim_id, policy_holder_id, claim_amount, description, status = claim
             
+            if st.checkbox(f"Select Claim {claim_id}", value=claim_id in selected, key=f"select_{claim_id}"):
+                selected.add(claim_id)
+            else:
+                selected.discard(claim_id)
             st.write(f"Claim ID: {claim_id}")
             st.write(f"Policy Holder ID: {policy_holder_id}")
             st.write(f"Claim Amount: {claim_amount}")
@@ -385,119 +646,411 @@ def view_claims():
             st.markdown("---")
     else:
         st.info("No pending claims.")
-    
-    conn.close()
 
-# Update claim status and track approved claim amount
-def update_claim_status(claim_id, new_status, claim_amount):
-    global total_claims_approved
+    # Page navigation
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if st.button("Previous Page", key="claims_prev_page", disabled=len(page_starts) == 1):
+            page_starts.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next Page", key="claims_next_page", disabled=not has_more):
+            page_starts.append(pending_claims[-1][0])
+            st.rerun()
+    with col3:
+        st.caption(f"Page {len(page_starts)}")
+
+    # Bulk adjudication of the ticked claims, or of every claim matching the filters
+    st.write("**Bulk Adjudication**")
+    scope = st.radio("Apply to", [f"Selected claims ({len(selected)})", "All pending claims matching the filters"],
+                     key="claims_bulk_scope", horizontal=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        bulk_approve = st.button("Approve in Bulk", key="claims_bulk_approve")
+    with col2:
+        bulk_reject = st.button("Reject in Bulk", key="claims_bulk_reject")
+    if bulk_approve or bulk_reject:
+        new_status = 'Approved' if bulk_approve else 'Rejected'
+        if scope.startswith("Selected"):
+            if not selected:
+                st.warning("No claims selected.")
+                return
+            results = bulk_update_claim_status(new_status, claim_ids=selected)
+        else:
+            results = bulk_update_claim_status(new_status, filters=claim_filters)
+        if results is not None:
+            selected.clear()
+            st.session_state.claims_bulk_summary = (new_status, results)
+            st.rerun()
+
+# Update claim status; approvals are added to the daily rollups in the same transaction
+@metrics.tagged
+def update_claim_status(claim_id, new_status):
     conn = create_connection()
     if conn is None:
         return
     
     try:
         cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE claims SET status = %s WHERE claim_id = %s
-        """, (new_status, claim_id))
-
-        if new_status == 'Approved':
-            # Update the total claims approved
-            total_claims_approved += claim_amount
-        
+        changed = cursor.execute(queries.UPDATE_CLAIM_STATUS, (new_status, claim_id))
+        if changed and new_status == 'Approved':
+            rollups.record_claims_approved(cursor, [claim_id])
         conn.commit()
     except Exception as e:
         st.error(f"Error updating claim status: {e}")
         conn.rollback()
+        return
     finally:
         conn.close()
-
-# Update claim status function
-def update_claim_status(claim_id, new_status):
-    conn = create_connection()
-    if conn is None:
-        return
-    
-    cursor = conn.cursor()
-    cursor.execute("UPDATE claims SET status = %s WHERE claim_id = %s", (new_status, claim_id))
-    conn.commit()
-    conn.close()
+    if not changed:
+        st.warning(f"Claim {claim_id} is no longer pending.")
+        return False
+    cache.bump("claims")
     st.success(f"Claim {claim_id} has been {new_status.lower()}.")
 
 # Retrieve claims submitted by a policy holder
+@metrics.tagged
 def get_policy_holder_claims(policy_holder_id):
-    conn = create_connection()
+    conn = create_read_connection()
     if conn is None:
         return []
 
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT claim_id, claim_amount, description, status
-        FROM claims
-        WHERE policy_holder_id = %s
-        ORDER BY claim_id DESC
-    """, (policy_holder_id,))
+    cursor.execute(queries.POLICY_HOLDER_CLAIMS, (policy_holder_id,))
     
     claims = cursor.fetchall()
     conn.close()
     return claims
 
-# Generate reports and analytics
-def generate_reports():
-    conn = create_connection()
+# Compute the report figures and charts. The scalar totals come from a single
+# aggregation query and sales by policy from a second one.
+@metrics.tagged
+def load_reports():
+    import pandas as pd
+    import plotly.express as px
+
+    conn = create_read_connection()
     if conn is None:
-        return
-    
-    cursor = conn.cursor()
-    
-    # Report: Total policies
-    cursor.execute("SELECT COUNT(*) FROM policies")
-    total_policies = cursor.fetchone()[0]
-    
-    # Report: Total claims submitted and approved
-    cursor.execute("SELECT COUNT(*) FROM claims WHERE status = 'Approved'")
-    approved_claims = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM claims")
-    total_claims = cursor.fetchone()[0]
-    
-    # Report: Total premium collected
-    cursor.execute("SELECT SUM(premium) FROM policies")
-    total_premium_collected = cursor.fetchone()[0] or 0.0
+        return None
 
-    # Report: Total claims approved (sum of approved claim amounts)
-    cursor.execute("SELECT SUM(claim_amount) FROM claims WHERE status = 'Approved'")
-    total_claims_approved = cursor.fetchone()[0] or 0.0
+    try:
+        cursor = conn.cursor()
 
-    # Report: Total policies sold by category
-    cursor.execute("SELECT policy_name, COUNT(*) FROM policy_purchases p JOIN policies pol ON p.policy_id = pol.policy_id GROUP BY policy_name")
-    policies_data = cursor.fetchall()
-    policies_df = pd.DataFrame(policies_data, columns=["Policy Name", "Number of Policies Sold"])
+        # Report: Total policies, premium collected (from the daily rollups), claims
+        # submitted/approved and approved amount
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM policies),
+                (SELECT COALESCE(SUM(premium_collected), 0) FROM daily_policy_rollups),
+                COUNT(*),
+                COALESCE(SUM(status = 'Approved'), 0),
+                COALESCE(SUM(CASE WHEN status = 'Approved' THEN claim_amount END), 0)
+            FROM claims
+        """)
+        (total_policies, total_premium_collected, total_claims,
+         approved_claims, total_claims_approved) = cursor.fetchone()
 
-    # Plot: Number of Policies Sold
-    st.subheader("Number of Policies Sold by Category")
+        # Report: Total policies sold by category
+        cursor.execute("SELECT policy_name, COUNT(*) FROM policy_purchases p JOIN policies pol ON p.policy_id = pol.policy_id GROUP BY policy_name")
+        policies_data = cursor.fetchall()
+    finally:
+        conn.close()
+
+    policies_df = pd.DataFrame(policies_data, columns=["Policy Name", "Number of Policies Sold"])
     fig1 = px.bar(policies_df, x="Policy Name", y="Number of Policies Sold", title="Number of Policies Sold by Category")
-    st.plotly_chart(fig1)
 
-    # Plot: Relationship between Total Premium Collected and Total Claims Approved (without time constraint)
-    st.subheader("Total Premium Collected vs. Total Claims Approved")
-    
-    # Create a DataFrame for plotting
+    # Relationship between Total Premium Collected and Total Claims Approved (without time constraint)
     relationship_df = pd.DataFrame({
         "Category": ["Total Premium Collected", "Total Claims Approved"],
-        "Amount": [total_premium_collected, total_claims_approved]
+        "Amount": [float(total_premium_collected), float(total_claims_approved)]
     })
-
-    # Create a bar chart
     fig2 = px.bar(relationship_df, x="Category", y="Amount", color="Category", title="Total Premium Collected vs. Total Claims Approved")
-    st.plotly_chart(fig2)
 
-    conn.close()
+    return {
+        "total_policies": total_policies,
+        "total_claims": total_claims,
+        "approved_claims": int(approved_claims),
+        "total_premium_collected": total_premium_collected,
+        "total_claims_approved": total_claims_approved,
+        "policies_df": policies_df,
+        "relationship_df": relationship_df,
+        "policies_fig": fig1,
+        "relationship_fig": fig2,
+    }
+
+# Daily business trends between start and end, read from the rollup table
+@metrics.tagged
+def load_trends(start, end):
+    import pandas as pd
+    import plotly.express as px
+
+    conn = create_read_connection()
+    if conn is None:
+        return None
+
+    try:
+        rows = rollups.fetch_daily_totals(conn.cursor(), start, end)
+    finally:
+        conn.close()
+
+    trends_df = pd.DataFrame(rows, columns=["Day", "Policies Sold", "Premium Collected", "Claims Submitted",
+                                            "Claims Approved", "Approved Amount"])
+    for column in trends_df.columns[1:]:
+        trends_df[column] = trends_df[column].astype(float)
+    amounts_fig = px.line(trends_df, x="Day", y=["Premium Collected", "Approved Amount"],
+                          title="Premium Collected vs. Approved Claim Amount per Day")
+    counts_fig = px.line(trends_df, x="Day", y=["Policies Sold", "Claims Submitted", "Claims Approved"],
+                         title="Policies Sold and Claims per Day")
+    return {"trends_df": trends_df, "amounts_fig": amounts_fig, "counts_fig": counts_fig}
+
+# Monthly loss ratio (approved claim amount / premium collected) per policy
+# between start and end, aggregated from the daily rollups rather than the claims
+@metrics.tagged
+def load_loss_ratios(start, end):
+    import pandas as pd
+    import plotly.express as px
+
+    conn = create_read_connection()
+    if conn is None:
+        return None
+
+    try:
+        rows = rollups.fetch_monthly_loss_ratios(conn.cursor(), start, end)
+    finally:
+        conn.close()
+
+    loss_df = pd.DataFrame(rows, columns=["Month", "Policy ID", "Policy", "Premium Collected", "Approved Amount",
+                                          "Loss Ratio"])
+    loss_df["Policy"] = loss_df["Policy"].fillna("Unattributed claims")
+    for column in ["Premium Collected", "Approved Amount", "Loss Ratio"]:
+        loss_df[column] = loss_df[column].astype(float)
+    ratios_df = loss_df.pivot_table(index="Policy", columns="Month", values="Loss Ratio", aggfunc="first")
+    loss_fig = px.line(loss_df.dropna(subset=["Loss Ratio"]), x="Month", y="Loss Ratio", color="Policy",
+                       markers=True, title="Loss Ratio by Policy per Month")
+    return {"loss_df": loss_df, "ratios_df": ratios_df, "loss_fig": loss_fig}
+
+# The computed report data and figures are cached until a write bumps the
+# policies, claims or purchases version, so reruns without new writes cost no
+# queries and no chart construction
+def cached_reports():
+    return cache.get_or_load("reports", load_reports,
+                             depends_on=("policies", "claims", "purchases"), ttl=cache.REPORTS_TTL)
+
+def cached_trends(start, end):
+    return cache.get_or_load(("trends", start, end), lambda: load_trends(start, end),
+                             depends_on=("policies", "claims", "purchases"), ttl=cache.REPORTS_TTL)
+
+def cached_loss_ratios(start, end):
+    return cache.get_or_load(("loss_ratios", start, end), lambda: load_loss_ratios(start, end),
+                             depends_on=("policies", "claims", "purchases"), ttl=cache.REPORTS_TTL)
+
+# Date range the trends chart shows until the admin picks another one
+def default_trends_range():
+    today = date.today()
+    return today - timedelta(days=30), today
+
+# The loss ratio report covers the current month and the LOSS_RATIO_MONTHS - 1
+# before it
+LOSS_RATIO_MONTHS = 12
+
+def loss_ratio_range():
+    today = date.today()
+    year, month = divmod(today.year * 12 + today.month - LOSS_RATIO_MONTHS, 12)
+    return date(year, month + 1, 1), today
+
+# Generate reports and analytics
+def generate_reports():
+    reports = memoized(cached_reports)
+    if reports is None:
+        return
+
+    # Plot: Number of Policies Sold
+    st.subheader("Number of Policies Sold by Category")
+    st.plotly_chart(reports["policies_fig"])
+
+    # Plot: Relationship between Total Premium Collected and Total Claims Approved
+    st.subheader("Total Premium Collected vs. Total Claims Approved")
+    st.plotly_chart(reports["relationship_fig"])
     
-    st.write(f"Total Policies: {total_policies}")
-    st.write(f"Total Claims Submitted: {total_claims}")
-    st.write(f"Total Claims Approved: {approved_claims}")
-    st.write(f"Total Premium Collected: {total_premium_collected}")
-    st.write(f"Total Claims Approved (Amount): {total_claims_approved}")
+    st.write(f"Total Policies: {reports['total_policies']}")
+    st.write(f"Total Claims Submitted: {reports['total_claims']}")
+    st.write(f"Total Claims Approved: {reports['approved_claims']}")
+    st.write(f"Total Premium Collected: {reports['total_premium_collected']}")
+    st.write(f"Total Claims Approved (Amount): {reports['total_claims_approved']}")
+
+    # Loss ratio per policy and month
+    st.subheader("Loss Ratio by Policy and Month")
+    loss_ratios = memoized(cached_loss_ratios, *loss_ratio_range())
+    if loss_ratios is not None:
+        if loss_ratios["loss_df"].empty:
+            st.info("No premium or approved claims in the last months.")
+        else:
+            st.plotly_chart(loss_ratios["loss_fig"])
+            ratios_df = loss_ratios["ratios_df"]
+            st.dataframe(ratios_df, column_config={month: st.column_config.NumberColumn(format="percent")
+                                                   for month in ratios_df.columns})
+
+    # Trends over a chosen date range
+    st.subheader("Trends")
+    date_range = st.date_input("Date Range", value=default_trends_range(), key="trends_date_range")
+    if len(date_range) != 2:
+        return
+    trends = memoized(cached_trends, *date_range)
+    if trends is None:
+        return
+    if trends["trends_df"].empty:
+        st.info("No activity in the selected date range.")
+        return
+    st.plotly_chart(trends["amounts_fig"])
+    st.plotly_chart(trends["counts_fig"])
+
+# Per-user lookups kept in session state across reruns: the user's policies, the
+# set of policy IDs they own and their policy holder ID. They are rebuilt when the
+# policy catalog changes and cleared when the user buys a policy or submits a claim.
+def user_lookups():
+    lookups = st.session_state.get("user_lookups")
+    policies_version = cache.version("policies")
+    if lookups is None or lookups["policies_version"] != policies_version:
+        user_id = st.session_state.user_id
+        user_policies = memoized(get_user_policies, user_id)
+        lookups = {
+            "policies_version": policies_version,
+            "user_policies": user_policies,
+            "owned_policy_ids": frozenset(policy[0] for policy in user_policies),
+            "policy_holder_id": memoized(get_policy_holder_id, user_id),
+        }
+        st.session_state.user_lookups = lookups
+    return lookups
+
+def invalidate_user_lookups():
+    st.session_state.pop("user_lookups", None)
+    rerun_memo.clear()
+
+# Arguments of search_policy_holders() for the directory's search box. Starts
+# again from the first page whenever the search changes; the stack in session
+# state holds the holder ID each visited page starts after.
+def holder_directory_args(search_by, term, page_size):
+    search = (search_by, term, page_size)
+    if st.session_state.get("holders_search_state") != search:
+        st.session_state.holders_search_state = search
+        st.session_state.holders_page_starts = [0]
+    return search_by, term, st.session_state.holders_page_starts[-1], page_size
+
+# Searchable policy holder directory for admins, one page at a time
+def view_policy_holder_directory():
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        search_by = st.selectbox("Search By", HOLDER_SEARCH_FIELDS, key="holders_search_by")
+    with col2:
+        term = st.text_input("Search Policy Holders", key="holders_search")
+    with col3:
+        page_size = st.selectbox("Holders per Page", HOLDER_PAGE_SIZES, key="holders_page_size")
+
+    holders, has_more = memoized(search_policy_holders, *holder_directory_args(search_by, term, page_size))
+    page_starts = st.session_state.holders_page_starts
+    if holders:
+        st.dataframe([{"Policy Holder ID": holder_id, "Name": name, "Age": age, "Contact": contact, "User ID": user_id}
+                      for holder_id, name, age, contact, user_id in holders],
+                     hide_index=True)
+    else:
+        st.info("No matching policy holders.")
+
+    # Page navigation
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if st.button("Previous Page", key="holders_prev_page", disabled=len(page_starts) == 1):
+            page_starts.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next Page", key="holders_next_page", disabled=not has_more):
+            page_starts.append(holders[-1][0])
+            st.rerun()
+    with col3:
+        st.caption(f"Page {len(page_starts)}")
+
+# Extract format choices: label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+# Contents of a prepared export file, read when the download is clicked
+def read_export(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+# Admin form for streaming a table to a CSV or Parquet file (export_data.py) and
+# downloading it. The export is written to a temporary file chunk by chunk.
+def view_data_export():
+    import tempfile
+    import export_data
+
+    dataset = st.selectbox("Dataset", list(export_data.DATASETS), key="export_dataset")
+    date_column, status_column, _ = export_data.DATASETS[dataset]
+    format_label = st.selectbox("Format", list(EXPORT_FORMATS), key="export_format")
+    start = end = None
+    if date_column and st.checkbox("Filter by Date", key="export_filter_dates"):
+        date_range = st.date_input("Date Range", value=default_trends_range(), key="export_date_range")
+        if len(date_range) == 2:
+            start, end = date_range
+    statuses = []
+    if status_column:
+        statuses = st.multiselect("Statuses (all when empty)", ["Pending", "Approved", "Rejected"],
+                                  key="export_statuses")
+
+    if st.button("Prepare Export", key="export_button"):
+        extension, mime = EXPORT_FORMATS[format_label]
+        previous = st.session_state.pop("export_file", None)
+        if previous and os.path.exists(previous[0]):
+            os.remove(previous[0])
+        fd, path = tempfile.mkstemp(prefix="hims_export_", suffix=extension)
+        os.close(fd)
+        progress_text = st.empty()
+        try:
+            stats = export_data.export(dataset, path, start=start, end=end, statuses=statuses,
+                                       progress=lambda rows: progress_text.text(f"{rows:,} rows exported"))
+        except (export_data.ExportError, OperationalError) as e:
+            os.remove(path)
+            st.error(f"Export failed: {e}")
+        else:
+            progress_text.empty()
+            st.success(f"Exported {stats['rows']:,} rows in {stats['seconds']:.1f}s "
+                       f"({stats['rows_per_second']:,.0f} rows/s, {stats['bytes'] / 1e6:,.1f} MB).")
+            st.session_state.export_file = (path, f"{dataset}{extension}", mime)
+    if st.session_state.get("export_file"):
+        path, file_name, mime = st.session_state.export_file
+        if os.path.exists(path):
+            st.download_button(f"Download {file_name}", lambda: read_export(path), file_name=file_name, mime=mime,
+                               key="export_download")
+
+# Start the admin dashboard's independent reads (catalog, policy holder directory,
+# the current claims page, reports and trends) concurrently before anything
+# renders, so the page waits for the slowest query rather than the sum of all of
+# them. Widget values come from session state, where Streamlit has already stored
+# them.
+def prefetch_admin_page():
+    prefetch(view_policies)
+    prefetch(search_policy_holders, *holder_directory_args(
+        st.session_state.get("holders_search_by", HOLDER_SEARCH_FIELDS[0]),
+        st.session_state.get("holders_search", ""),
+        st.session_state.get("holders_page_size", HOLDER_PAGE_SIZES[0])))
+    prefetch(get_pending_claims_page, *claims_page_args(
+        st.session_state.get("claims_min_amount", 0.0), st.session_state.get("claims_max_amount", 0.0),
+        st.session_state.get("claims_holder_id", 0), st.session_state.get("claims_page_size", CLAIMS_PAGE_SIZES[0])))
+    prefetch(cached_reports)
+    prefetch(cached_loss_ratios, *loss_ratio_range())
+    date_range = st.session_state.get("trends_date_range", default_trends_range())
+    if len(date_range) == 2:
+        prefetch(cached_trends, *date_range)
+
+# Metrics endpoint for query and render timings (started once per process, and
+# only when HIMS_METRICS_PORT is set)
+metrics.start_server()
+
+# Background writer for the claim ingestion queue (only when HIMS_CLAIM_QUEUE is
+# set); flushes anything left queued by a previous run
+claim_queue.start_writer()
 
 # Initialize session state
 if 'logged_in' not in st.session_state:
@@ -509,6 +1062,9 @@ if 'logged_in' not in st.session_state:
 if 'registration_mode' not in st.session_state:
     st.session_state.registration_mode = False
 
+# Reads go to the primary for a while after this session writes (db.py)
+db.bind_session(st.session_state.setdefault("db_routing", {}))
+
 # UI for the Health Insurance Management System
 st.markdown("<h1 style='text-align: center;font-weight: bold;'>Health Insurance Management System</h1>", unsafe_allow_html=True)
 
@@ -564,20 +1120,23 @@ if st.session_state.logged_in:
     
     # Admin specific functions
     if role == 'admin':
-        st.header("Available Policies")
-        policies = view_policies()
+        prefetch_admin_page()
+
+        with metrics.render_span("catalog"):
+            st.header("Available Policies")
+            policies = memoized(view_policies)
         
-        for policy in policies:
-            policy_id, name, policy_details, premium = policy
-            st.write(f"*{name}*")
-            st.write(f"Details: {policy_details}")
-            st.write(f"Premium: Rs{premium:.2f}")
+            for policy in policies:
+                policy_id, name, policy_details, premium = policy
+                st.write(f"*{name}*")
+                st.write(f"Details: {policy_details}")
+                st.write(f"Premium: Rs{premium:.2f}")
             
-            if st.button(f"Delete Policy {policy_id}", key=f"del_{policy_id}"):
-                if delete_policy(policy_id):
-                    st.success(f"Policy {name} deleted successfully")
-                    st.rerun()
-            st.markdown("---")
+                if st.button(f"Delete Policy {policy_id}", key=f"del_{policy_id}"):
+                    if delete_policy(policy_id):
+                        st.success(f"Policy {name} deleted successfully")
+                        st.rerun()
+                st.markdown("---")
 
         st.header("Add New Policy")
         new_policy_name = st.text_input("Policy Name")
@@ -590,58 +1149,99 @@ if st.session_state.logged_in:
             st.success("Policy added successfully")
             st.rerun()
             
-        # View all policy holders
-        st.subheader("Policy Holder Management")
-        policy_holders = view_policy_holders()
-        for holder in policy_holders:
-            st.write(f"Policy Holder ID: {holder[0]}, Name: {holder[1]}, Age: {holder[2]}, Contact: {holder[3]}, Address: {holder[4]}")
+        # Policy holder directory
+        with metrics.render_span("policy_holders"):
+            st.subheader("Policy Holder Management")
+            view_policy_holder_directory()
+
+        # Bulk import of policy holders, purchases or claims from a CSV upload
+        import bulk_import  # loads pandas; only needed on the admin page
+
+        st.subheader("Bulk Import")
+        import_kind = st.selectbox("Import Type", list(bulk_import.IMPORT_KINDS), key="import_kind")
+        import_file = st.file_uploader("CSV File", type="csv", key="import_file")
+        import_commit_size = st.number_input("Rows per Commit", min_value=100, value=bulk_import.COMMIT_SIZE,
+                                             step=1000, key="import_commit_size")
+        if import_file is not None and st.button("Start Import", key="import_button"):
+            progress_bar = st.progress(0.0)
+            rejects = io.StringIO()
+
+            def show_progress(stats):
+                progress_bar.progress(min(import_file.tell() / max(import_file.size, 1), 1.0),
+                                      text=f"{stats['inserted']:,} inserted, {stats['rejected']:,} rejected "
+                                           f"({stats['rows_per_second']:,.0f} rows/s)")
+
+            try:
+                stats = bulk_import.import_csv(import_file, import_kind, commit_size=int(import_commit_size),
+                                               rejects=rejects, progress=show_progress)
+            except (bulk_import.ImportFormatError, OperationalError) as e:
+                st.error(f"Import failed: {e}")
+            else:
+                progress_bar.progress(1.0)
+                st.success(f"Imported {stats['inserted']:,} of {stats['read']:,} rows in {stats['elapsed']:.1f}s.")
+                st.session_state.import_rejects = (import_kind, stats["rejected"], rejects.getvalue())
+        if st.session_state.get("import_rejects"):
+            rejects_kind, rejected_count, rejects_csv = st.session_state.import_rejects
+            if rejected_count:
+                st.download_button(f"Download {rejected_count:,} Rejected Rows", rejects_csv,
+                                   file_name=f"{rejects_kind}_rejects.csv", mime="text/csv")
+
+        # Streaming extracts for the actuarial team
+        st.subheader("Data Export")
+        with metrics.render_span("data_export"):
+            view_data_export()
         
         # Claims Processing
         st.subheader("Claims Processing")
-        view_claims()
+        with metrics.render_span("claims_processing"):
+            view_claims()
         
         # Reports
         st.subheader("Reports and Analytics")
-        generate_reports()
+        with metrics.render_span("reports"):
+            generate_reports()
     
     # Policy holder specific functions
     elif role == 'policy_holder':
         # Display user's purchased policies
-        st.header("Your Policies")
-        user_policies = get_user_policies(st.session_state.user_id)
-        if user_policies:
-            for policy in user_policies:
-                policy_id, name, details, premium, purchase_date = policy
+        with metrics.render_span("your_policies"):
+            st.header("Your Policies")
+            lookups = user_lookups()
+            user_policies = lookups["user_policies"]
+            if user_policies:
+                for policy in user_policies:
+                    policy_id, name, details, premium, purchase_date = policy
+                    st.write("---")
+                    st.write(f"*Policy Name:* {name}")
+                    st.write(f"*Details:* {details}")
+                    st.write(f"*Premium:* Rs{premium:.2f}")
+                    st.write(f"*Purchase Date:* {purchase_date.strftime('%Y-%m-%d %H:%M')}")
                 st.write("---")
-                st.write(f"*Policy Name:* {name}")
-                st.write(f"*Details:* {details}")
-                st.write(f"*Premium:* Rs{premium:.2f}")
-                st.write(f"*Purchase Date:* {purchase_date.strftime('%Y-%m-%d %H:%M')}")
-            st.write("---")
-        else:
-            st.info("You haven't purchased any policies yet.")
+            else:
+                st.info("You haven't purchased any policies yet.")
 
         # Display available policies for purchase
-        st.header("Available Policies")
-        policies = view_policies()
+        with metrics.render_span("catalog"):
+            st.header("Available Policies")
+            policies = view_policies()
         
-        # Create a unique identifier for each policy using combination of section and policy_id
-        for idx, policy in enumerate(policies):
-            policy_id, name, policy_details, premium = policy
-            st.write(f"*{name}*")
-            st.write(f"Details: {policy_details}")
-            st.write(f"Premium: Rs{premium:.2f}")
+            # Create a unique identifier for each policy using combination of section and policy_id
+            for idx, policy in enumerate(policies):
+                policy_id, name, policy_details, premium = policy
+                st.write(f"*{name}*")
+                st.write(f"Details: {policy_details}")
+                st.write(f"Premium: Rs{premium:.2f}")
             
-            # Check if user already has this policy
-            already_purchased = any(up[0] == policy_id for up in user_policies)
-            if already_purchased:
-                st.info("You already own this policy")
-            else:
-                # Using combination of index and policy_id to create unique key
-                if st.button(f"Buy Policy {policy_id}", key=f"buy_policy_{idx}_{policy_id}"):
-                    st.session_state.buying_policy_id = policy_id
-                    st.rerun()
-            st.markdown("---")
+                # Check if user already has this policy
+                already_purchased = policy_id in lookups["owned_policy_ids"]
+                if already_purchased:
+                    st.info("You already own this policy")
+                else:
+                    # Using combination of index and policy_id to create unique key
+                    if st.button(f"Buy Policy {policy_id}", key=f"buy_policy_{idx}_{policy_id}"):
+                        st.session_state.buying_policy_id = policy_id
+                        st.rerun()
+                st.markdown("---")
 
         # Policy purchase form
         if hasattr(st.session_state, 'buying_policy_id'):
@@ -655,7 +1255,7 @@ if st.session_state.logged_in:
                 if buy_policy(st.session_state.user_id, st.session_state.buying_policy_id, 
                             name, age, contact, address):
                     st.success("Policy purchased successfully!")
-                    st.session_state.policy_holder_id = get_policy_holder_id(st.session_state.user_id)
+                    invalidate_user_lookups()
                     del st.session_state.buying_policy_id
                     st.rerun()
         
@@ -675,28 +1275,43 @@ if st.session_state.logged_in:
             
             if st.button("Submit Claim"):
                 if claim_policy and claim_amount > 0:
-                    submit_claim(st.session_state.policy_holder_id, claim_amount, claim_description)
+                    submit_claim(lookups["policy_holder_id"], claim_amount, claim_description, claim_policy[0])
+                    invalidate_user_lookups()
                 else:
                     st.error("Please select a policy and enter a valid claim amount.")
         else:
             st.warning("You need to purchase a policy before you can submit claims.")
         st.header("Your Claims")
     
-    policy_holder_id = get_policy_holder_id(st.session_state.user_id)
-    if policy_holder_id:
-        claims = get_policy_holder_claims(policy_holder_id)
+    with metrics.render_span("your_claims"):
+        policy_holder_id = user_lookups()["policy_holder_id"]
+        if policy_holder_id:
+            claims = memoized(get_policy_holder_claims, policy_holder_id)
+            queued = claim_queue.queued_count(policy_holder_id)
+            if queued:
+                st.info(f"{queued} submitted claim(s) are still being recorded and will appear here shortly.")
         
-        if claims:
-            for claim in claims:
-                claim_id, claim_amount, description, status = claim
-                st.write(f"**Claim ID:** {claim_id}")
-                st.write(f"**Claim Amount:** Rs{claim_amount:.2f}")
-                st.write(f"**Description:** {description}")
-                st.write(f"**Status:** :red[{status}]")  # Display status in bold with color for emphasis
-                st.markdown("---")
-        else:
-            st.info("You have no submitted claims.")
+            if claims:
+                for claim in claims:
+                    claim_id, claim_amount, description, status = claim
+                    st.write(f"**Claim ID:** {claim_id}")
+                    st.write(f"**Claim Amount:** Rs{claim_amount:.2f}")
+                    st.write(f"**Description:** {description}")
+                    st.write(f"**Status:** :red[{status}]")  # Display status in bold with color for emphasis
+                    st.markdown("---")
+            else:
+                st.info("You have no submitted claims.")
     
+    # Connection pool statistics for monitoring
+    if role == 'admin':
+        with st.sidebar.expander("Database Connection Pool"):
+            st.json(db.pool_stats())
+        with st.sidebar.expander("Query and Render Timings"):
+            st.json(metrics.snapshot())
+        if claim_queue.ENABLED:
+            with st.sidebar.expander("Claim Ingestion Queue"):
+                st.json(claim_queue.stats())
+
     # Logout button
     if st.button("Logout"):
         for key in list(st.session_state.keys()):
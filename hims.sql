@@ -25,14 +25,28 @@ CREATE TABLE policy_holders (
     user_id INT NOT NULL,
     FOREIGN KEY (user_id) REFERENCES users(user_id)
 );
+-- One policy holder record per user (buy_policy creates it with an upsert)
+CREATE UNIQUE INDEX uq_policy_holders_user_id ON policy_holders (user_id);
+-- Serve the admin policy holder directory's search: name and contact prefixes,
+-- and words anywhere in the name
+CREATE INDEX idx_policy_holders_name ON policy_holders (name);
+CREATE INDEX idx_policy_holders_contact ON policy_holders (contact);
+CREATE FULLTEXT INDEX ft_policy_holders_name ON policy_holders (name);
 CREATE TABLE claims (
     claim_id INT AUTO_INCREMENT PRIMARY KEY,
     policy_holder_id INT,
+    policy_id INT NULL,
     claim_amount DECIMAL(10, 2),
     description TEXT,
     status ENUM('Pending', 'Approved', 'Rejected') DEFAULT 'Pending',
-    FOREIGN KEY (policy_holder_id) REFERENCES policy_holders(id)
+    ingest_ref CHAR(32) NULL,
+    FOREIGN KEY (policy_holder_id) REFERENCES policy_holders(id),
+    CONSTRAINT fk_claims_policy FOREIGN KEY (policy_id) REFERENCES policies(policy_id)
 );
+-- Idempotency key for claims written by the claim ingestion queue
+CREATE UNIQUE INDEX uq_claims_ingest_ref ON claims (ingest_ref);
+-- Serves the admin claims review queue (pending claims paged by claim_id)
+CREATE INDEX idx_claims_status_claim_id ON claims (status, claim_id);
 CREATE TABLE policy_purchases (
     purchase_id INT PRIMARY KEY AUTO_INCREMENT,
     user_id INT NOT NULL,
@@ -41,15 +55,23 @@ CREATE TABLE policy_purchases (
     FOREIGN KEY (user_id) REFERENCES users(user_id),
     FOREIGN KEY (policy_id) REFERENCES policies(policy_id)
 );
+-- Covering index for get_user_policies (latest purchase per policy for a user)
+CREATE INDEX idx_policy_purchases_user_policy_date ON policy_purchases (user_id, policy_id, purchase_date);
 
 -- TRIGGERS 
+-- The log tables are partitioned by month on their date column; `python
+-- audit_logs.py rotate` (daily) adds monthly partitions and `python audit_logs.py
+-- archive` exports old months to files and drops them.
 -- 1.Create Log Table and  Trigger to Automatically Log Policy Purchases
 CREATE TABLE purchase_logs (
-    log_id INT AUTO_INCREMENT PRIMARY KEY,
+    log_id INT AUTO_INCREMENT,
     user_id INT NOT NULL,
     policy_id INT NOT NULL,
-    purchase_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    log_details TEXT
+    purchase_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    log_details TEXT,
+    PRIMARY KEY (log_id, purchase_date)
+) PARTITION BY RANGE (UNIX_TIMESTAMP(purchase_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
 );
 
 DELIMITER //
@@ -66,11 +88,14 @@ DELIMITER ;
 -- 2. Log Table and Trigger for Claim Submissions
 
 CREATE TABLE claim_submission_logs (
-    log_id INT AUTO_INCREMENT PRIMARY KEY,
+    log_id INT AUTO_INCREMENT,
     policy_holder_id INT NOT NULL,
     claim_id INT NOT NULL,
-    submission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    log_details TEXT
+    submission_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    log_details TEXT,
+    PRIMARY KEY (log_id, submission_date)
+) PARTITION BY RANGE (UNIX_TIMESTAMP(submission_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
 );
 
 DELIMITER //
@@ -88,12 +113,15 @@ DELIMITER ;
 -- 3. Log Table and Trigger for Claim Status Changes
 
 CREATE TABLE claim_status_change_logs (
-    log_id INT AUTO_INCREMENT PRIMARY KEY,
+    log_id INT AUTO_INCREMENT,
     claim_id INT NOT NULL,
     old_status ENUM('Pending', 'Approved', 'Rejected') NOT NULL,
     new_status ENUM('Pending', 'Approved', 'Rejected') NOT NULL,
-    change_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    log_details TEXT
+    change_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    log_details TEXT,
+    PRIMARY KEY (log_id, change_date)
+) PARTITION BY RANGE (UNIX_TIMESTAMP(change_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
 );
 
 DELIMITER //
@@ -113,11 +141,14 @@ DELIMITER ;
 -- 4. Log Table and Trigger for Policy Creation
 
 CREATE TABLE policy_creation_logs (
-    log_id INT AUTO_INCREMENT PRIMARY KEY,
+    log_id INT AUTO_INCREMENT,
     policy_id INT NOT NULL,
     policy_name VARCHAR(100),
-    creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    log_details TEXT
+    creation_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    log_details TEXT,
+    PRIMARY KEY (log_id, creation_date)
+) PARTITION BY RANGE (UNIX_TIMESTAMP(creation_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
 );
 
 DELIMITER //
@@ -135,11 +166,14 @@ DELIMITER ;
 -- 5. Log Table and Trigger for Policy Deletion
 
 CREATE TABLE policy_deletion_logs (
-    log_id INT AUTO_INCREMENT PRIMARY KEY,
+    log_id INT AUTO_INCREMENT,
     policy_id INT NOT NULL,
     policy_name VARCHAR(100),
-    deletion_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    log_details TEXT
+    deletion_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    log_details TEXT,
+    PRIMARY KEY (log_id, deletion_date)
+) PARTITION BY RANGE (UNIX_TIMESTAMP(deletion_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
 );
 
 DELIMITER //
@@ -154,6 +188,53 @@ END;
 //
 DELIMITER ;
 
+-- Months exported to archive files and dropped from the log tables above
+CREATE TABLE audit_log_archives (
+    table_name VARCHAR(64) NOT NULL,
+    month DATE NOT NULL,
+    row_count INT NOT NULL,
+    path VARCHAR(1024) NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, month)
+);
+
+-- ROLLUPS
+-- Daily per-policy business totals, maintained on write by hims.py and rebuilt
+-- from the tables above with `python rollups.py backfill`. Claims are kept under
+-- their policy_id, or under 0 when the claim doesn't record one. The per-policy
+-- monthly loss-ratio report aggregates this table, not the claims.
+CREATE TABLE daily_policy_rollups (
+    day DATE NOT NULL,
+    policy_id INT NOT NULL,
+    purchases INT NOT NULL DEFAULT 0,
+    premium_collected DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    claims_submitted INT NOT NULL DEFAULT 0,
+    claims_approved INT NOT NULL DEFAULT 0,
+    approved_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, policy_id)
+);
+
+-- SCHEMA MIGRATIONS
+-- Migrations from migrations/ that this file already includes; `python migrate.py`
+-- applies any later ones to databases created from an older version of this file.
+-- hims_sqlite.sql is the same schema for the SQLite backend; keep both in step.
+CREATE TABLE schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64),
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO schema_migrations (version, name) VALUES
+(1, 'claims_status_claim_id_index'),
+(2, 'daily_policy_rollups'),
+(3, 'policy_purchases_user_policy_date_index'),
+(4, 'policy_holder_directory_indexes'),
+(5, 'partition_audit_logs'),
+(6, 'claims_ingest_ref'),
+(7, 'policy_holders_unique_user'),
+(8, 'claims_policy_id'),
+(9, 'get_user_policies_procedure');
+
 -- PROCEDURES
 
 -- Database connection function
@@ -332,17 +413,15 @@ BEGIN
         RETURN;
     END;
     
-    SELECT p.policy_id, p.policy_name, p.policy_details, p.premium,
-           (SELECT MAX(pp.purchase_date)
-            FROM policy_purchases pp
-            WHERE pp.policy_id = p.policy_id AND pp.user_id = user_id) AS latest_purchase_date
-    FROM policies p
-    WHERE p.policy_id IN (
-        SELECT pp.policy_id
-        FROM policy_purchases pp
-        WHERE pp.user_id = user_id
-    )
-    ORDER BY latest_purchase_date DESC;
+    SELECT p.policy_id, p.policy_name, p.policy_details, p.premium, pp.latest_purchase_date
+    FROM (
+        SELECT pp2.policy_id, MAX(pp2.purchase_date) AS latest_purchase_date
+        FROM policy_purchases pp2
+        WHERE pp2.user_id = user_id
+        GROUP BY pp2.policy_id
+    ) pp
+    JOIN policies p ON p.policy_id = pp.policy_id
+    ORDER BY pp.latest_purchase_date DESC;
 END;
 
 -- Delete policy function
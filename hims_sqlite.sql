@@ -0,0 +1,224 @@
+-- hims.sql for the embedded SQLite backend (HIMS_DB_BACKEND=sqlite)
+--
+-- The same tables, indexes, seed policies and audit triggers as hims.sql, in
+-- SQLite's dialect; keep the two in step. sqlite_backend.py creates a new
+-- database file from this script on first use (`python sqlite_backend.py init`
+-- does it explicitly and can add an admin user). Differences from MySQL:
+-- * money columns are declared DECIMAL REAL: REAL affinity, so arithmetic on them
+--   is never integer arithmetic, and sqlite_backend.py reads them back as Decimal
+-- * usernames, policy holder names and contacts compare case-insensitively
+--   (COLLATE NOCASE), like MySQL's default collation, so logins and the
+--   directory search find the same rows
+-- * the policy holder name search uses the policy_holders_fts FTS5 table, kept in
+--   sync by triggers, instead of a FULLTEXT index
+-- * the log tables are not partitioned; audit_logs.py rotation and archival are
+--   MySQL-only
+-- * foreign key columns are indexed explicitly (InnoDB creates those indexes
+--   itself)
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) COLLATE NOCASE NOT NULL,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'policy_holder' CHECK (role IN ('admin', 'policy_holder'))
+);
+CREATE TABLE policies (
+    policy_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    policy_name VARCHAR(255) NOT NULL,
+    premium DECIMAL REAL(10, 2) NOT NULL,
+    policy_details TEXT NOT NULL
+);
+INSERT INTO policies (policy_name, premium, policy_details) VALUES 
+('Individual Health Insurance', 27500, 'The individual gets compensated for illness and medical expenses till the insured limit is reached. The premium of the plan is decided on the basis of age and medical history.'),
+('Family Health Insurance', 55000, 'Family Health Insurance Policy secures your entire family under a single cover.'),
+('Critical Illness Insurance', 12500, 'The Critical Illness Insurance plan insures the person by offering a lump sum amount of money for life-threatening diseases post diagnosis. The amount is predefined irrespective of expenses.'),
+('Senior Citizen Health Insurance', 70000, 'The Senior Citizen Health Insurance will offer you coverage for the cost of hospitalisation and medicines, whether it arises from a health issue or any accident.'),
+('Top Up Health Insurance', 12500, 'Top Up Health Insurance plan is for higher coverage amounts. It provides additional coverage over the regular policy to increase the amount of sum insured.'),
+('Hospital Daily Cash', 75500, 'Hospital Daily Cash grants individual of routine treatment a benefit of Rs. 500 to 10,000, as per the coverage amount selected.'),
+('Personal Accident Insurance', 25000, 'This policy provides a lump sum amount to the victim or his/her family as support.'),
+('ULIPs', 65000, 'ULIPs invests a part of your premium and the other remaining part is used for buying health covers.'),
+('Disease-Specific', 25000, 'Disease-Specific health insurance provides coverage for specific diseases.'),
+('Mediclaim', 27500, 'Mediclaim Policy ensures compensation for your hospitalisation expenses in case of any illness and accident.');
+CREATE TABLE policy_holders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) COLLATE NOCASE,
+    age INT NOT NULL,
+    contact VARCHAR(50) COLLATE NOCASE,
+    address TEXT,
+    user_id INT NOT NULL REFERENCES users(user_id)
+);
+CREATE UNIQUE INDEX uq_policy_holders_user_id ON policy_holders (user_id);
+CREATE INDEX idx_policy_holders_name ON policy_holders (name);
+CREATE INDEX idx_policy_holders_contact ON policy_holders (contact);
+-- Words of holder names for the directory search (external content: the names
+-- themselves stay in policy_holders)
+CREATE VIRTUAL TABLE policy_holders_fts USING fts5(name, content='policy_holders', content_rowid='id');
+CREATE TRIGGER policy_holders_fts_insert
+AFTER INSERT ON policy_holders
+BEGIN
+    INSERT INTO policy_holders_fts (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+CREATE TRIGGER policy_holders_fts_delete
+AFTER DELETE ON policy_holders
+BEGIN
+    INSERT INTO policy_holders_fts (policy_holders_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+END;
+CREATE TRIGGER policy_holders_fts_update
+AFTER UPDATE OF name ON policy_holders
+BEGIN
+    INSERT INTO policy_holders_fts (policy_holders_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    INSERT INTO policy_holders_fts (rowid, name) VALUES (NEW.id, NEW.name);
+END;
+CREATE TABLE claims (
+    claim_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    policy_holder_id INT REFERENCES policy_holders(id),
+    policy_id INT NULL REFERENCES policies(policy_id),
+    claim_amount DECIMAL REAL(10, 2),
+    description TEXT,
+    status TEXT DEFAULT 'Pending' CHECK (status IN ('Pending', 'Approved', 'Rejected')),
+    ingest_ref CHAR(32) NULL
+);
+CREATE UNIQUE INDEX uq_claims_ingest_ref ON claims (ingest_ref);
+CREATE INDEX idx_claims_status_claim_id ON claims (status, claim_id);
+CREATE INDEX idx_claims_policy_holder_id ON claims (policy_holder_id);
+CREATE INDEX idx_claims_policy_id ON claims (policy_id);
+CREATE TABLE policy_purchases (
+    purchase_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL REFERENCES users(user_id),
+    policy_id INT NOT NULL REFERENCES policies(policy_id),
+    purchase_date DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX idx_policy_purchases_user_policy_date ON policy_purchases (user_id, policy_id, purchase_date);
+CREATE INDEX idx_policy_purchases_policy_id ON policy_purchases (policy_id);
+
+-- TRIGGERS
+-- 1. Policy purchases
+CREATE TABLE purchase_logs (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL,
+    policy_id INT NOT NULL,
+    purchase_date TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    log_details TEXT
+);
+CREATE INDEX idx_purchase_logs_date ON purchase_logs (purchase_date);
+CREATE TRIGGER after_policy_purchase
+AFTER INSERT ON policy_purchases
+FOR EACH ROW
+BEGIN
+    INSERT INTO purchase_logs (user_id, policy_id, purchase_date, log_details)
+    VALUES (NEW.user_id, NEW.policy_id, NEW.purchase_date, 'Policy purchased with ID: ' || NEW.policy_id);
+END;
+
+-- 2. Claim submissions
+CREATE TABLE claim_submission_logs (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    policy_holder_id INT NOT NULL,
+    claim_id INT NOT NULL,
+    submission_date TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    log_details TEXT
+);
+CREATE INDEX idx_claim_submission_logs_date ON claim_submission_logs (submission_date);
+CREATE TRIGGER after_claim_submission
+AFTER INSERT ON claims
+FOR EACH ROW
+BEGIN
+    INSERT INTO claim_submission_logs (policy_holder_id, claim_id, submission_date, log_details)
+    VALUES (NEW.policy_holder_id, NEW.claim_id, datetime('now', 'localtime'),
+            'Claim submitted with ID: ' || NEW.claim_id || ' for amount: ' || printf('%.2f', NEW.claim_amount));
+END;
+
+-- 3. Claim status changes
+CREATE TABLE claim_status_change_logs (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    claim_id INT NOT NULL,
+    old_status TEXT NOT NULL CHECK (old_status IN ('Pending', 'Approved', 'Rejected')),
+    new_status TEXT NOT NULL CHECK (new_status IN ('Pending', 'Approved', 'Rejected')),
+    change_date TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    log_details TEXT
+);
+CREATE INDEX idx_claim_status_change_logs_date ON claim_status_change_logs (change_date);
+CREATE TRIGGER after_claim_status_change
+AFTER UPDATE ON claims
+FOR EACH ROW
+WHEN OLD.status <> NEW.status
+BEGIN
+    INSERT INTO claim_status_change_logs (claim_id, old_status, new_status, change_date, log_details)
+    VALUES (NEW.claim_id, OLD.status, NEW.status, datetime('now', 'localtime'),
+            'Claim status changed from ' || OLD.status || ' to ' || NEW.status || ' for Claim ID: ' || NEW.claim_id);
+END;
+
+-- 4. Policy creation
+CREATE TABLE policy_creation_logs (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    policy_id INT NOT NULL,
+    policy_name VARCHAR(100),
+    creation_date TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    log_details TEXT
+);
+CREATE INDEX idx_policy_creation_logs_date ON policy_creation_logs (creation_date);
+CREATE TRIGGER after_policy_creation
+AFTER INSERT ON policies
+FOR EACH ROW
+BEGIN
+    INSERT INTO policy_creation_logs (policy_id, policy_name, creation_date, log_details)
+    VALUES (NEW.policy_id, NEW.policy_name, datetime('now', 'localtime'),
+            'Policy created with ID: ' || NEW.policy_id || ' and Name: ' || NEW.policy_name);
+END;
+
+-- 5. Policy deletion
+CREATE TABLE policy_deletion_logs (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    policy_id INT NOT NULL,
+    policy_name VARCHAR(100),
+    deletion_date TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    log_details TEXT
+);
+CREATE INDEX idx_policy_deletion_logs_date ON policy_deletion_logs (deletion_date);
+CREATE TRIGGER after_policy_deletion
+AFTER DELETE ON policies
+FOR EACH ROW
+BEGIN
+    INSERT INTO policy_deletion_logs (policy_id, policy_name, deletion_date, log_details)
+    VALUES (OLD.policy_id, OLD.policy_name, datetime('now', 'localtime'),
+            'Policy deleted with ID: ' || OLD.policy_id || ' and Name: ' || OLD.policy_name);
+END;
+
+-- Kept so audit_logs.live_since() works the same; nothing is archived here
+CREATE TABLE audit_log_archives (
+    table_name VARCHAR(64) NOT NULL,
+    month DATE NOT NULL,
+    row_count INT NOT NULL,
+    path VARCHAR(1024) NOT NULL,
+    archived_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (table_name, month)
+);
+
+-- ROLLUPS
+CREATE TABLE daily_policy_rollups (
+    day DATE NOT NULL,
+    policy_id INT NOT NULL,
+    purchases INT NOT NULL DEFAULT 0,
+    premium_collected DECIMAL REAL(14, 2) NOT NULL DEFAULT 0,
+    claims_submitted INT NOT NULL DEFAULT 0,
+    claims_approved INT NOT NULL DEFAULT 0,
+    approved_amount DECIMAL REAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, policy_id)
+) WITHOUT ROWID;
+
+-- SCHEMA MIGRATIONS
+-- The MySQL migrations this schema corresponds to (migrate.py is MySQL-only)
+CREATE TABLE schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64),
+    applied_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+INSERT INTO schema_migrations (version, name) VALUES
+(1, 'claims_status_claim_id_index'),
+(2, 'daily_policy_rollups'),
+(3, 'policy_purchases_user_policy_date_index'),
+(4, 'policy_holder_directory_indexes'),
+(5, 'partition_audit_logs'),
+(6, 'claims_ingest_ref'),
+(7, 'policy_holders_unique_user'),
+(8, 'claims_policy_id'),
+(9, 'get_user_policies_procedure');
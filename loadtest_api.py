@@ -0,0 +1,171 @@
+# Load test for the JSON API (api.py)
+#
+#   python loadtest_api.py --url http://127.0.0.1:8080 --concurrency 200 --duration 30
+#   python loadtest_api.py --mix catalog=1 --output catalog.json
+#
+# Runs --concurrency clients for --duration seconds, each repeatedly picking a
+# request from the weighted --mix, and reports throughput and latency percentiles
+# per request type. User, holder and claim IDs are sampled from the ranges present
+# in the database db.py is configured for, so run it against the API's (local)
+# database. submit_claim and buy_policy write real rows.
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import aiohttp
+
+import db
+
+DEFAULT_MIX = {
+    "catalog": 30,
+    "user_policies": 25,
+    "holder_claims": 25,
+    "login": 5,
+    "submit_claim": 8,
+    "update_claim_status": 4,
+    "buy_policy": 3,
+}
+
+
+def id_ranges():
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        ranges = {}
+        for name, table, column in (("user", "policy_holders", "user_id"), ("holder", "policy_holders", "id"),
+                                    ("claim", "claims", "claim_id"), ("policy", "policies", "policy_id")):
+            cursor.execute(f"SELECT COALESCE(MIN({column}), 1), COALESCE(MAX({column}), 1) FROM {table}")
+            ranges[name] = cursor.fetchone()
+        cursor.execute("SELECT username, password FROM users LIMIT 100")
+        ranges["logins"] = cursor.fetchall() or [("nobody", "nothing")]
+        cursor.execute("SELECT username, password FROM users WHERE role = 'admin' LIMIT 1")
+        ranges["admin"] = cursor.fetchone() or ("nobody", "nothing")
+        return ranges
+    finally:
+        conn.close()
+
+
+# (method, path, JSON body) for one request of the given kind
+def make_request(kind, rng, ranges):
+    user_id = rng.randint(*ranges["user"])
+    holder_id = rng.randint(*ranges["holder"])
+    if kind == "catalog":
+        return "GET", "/policies", None
+    if kind == "user_policies":
+        return "GET", f"/users/{user_id}/policies", None
+    if kind == "holder_claims":
+        return "GET", f"/holders/{holder_id}/claims", None
+    if kind == "login":
+        username, password = rng.choice(ranges["logins"])
+        return "POST", "/login", {"username": username, "password": password}
+    if kind == "submit_claim":
+        return "POST", "/claims", {"policy_holder_id": holder_id, "claim_amount": round(rng.lognormvariate(10, 1), 2),
+                                   "description": "Load test claim"}
+    if kind == "update_claim_status":
+        # The admin login is only checked when the API runs without HIMS_API_KEY
+        username, password = ranges["admin"]
+        return "PUT", f"/claims/{rng.randint(*ranges['claim'])}/status", {"status": rng.choice(["Approved", "Rejected"]),
+                                                                           "username": username, "password": password}
+    if kind == "buy_policy":
+        return "POST", f"/users/{user_id}/purchases", {"policy_id": rng.randint(*ranges["policy"]),
+                                                       "name": f"Holder {user_id}", "age": rng.randint(18, 90)}
+    raise ValueError(f"Unknown request kind {kind!r}")
+
+
+def percentile(samples, q):
+    return samples[min(int(len(samples) * q), len(samples) - 1)] if samples else 0.0
+
+
+async def run_load(url, mix, concurrency, duration, api_key=None, seed=0):
+    ranges = id_ranges()
+    kinds, weights = list(mix), list(mix.values())
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    headers = {"X-API-Key": api_key} if api_key else {}
+    deadline = time.monotonic() + duration
+
+    async def client(session, rng):
+        while time.monotonic() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            method, path, body = make_request(kind, rng, ranges)
+            started = time.perf_counter()
+            try:
+                async with session.request(method, url + path, json=body) as response:
+                    await response.read()
+                    # 4xx for sampled IDs that don't exist is expected; 5xx is a failure
+                    failed = response.status >= 500
+            except aiohttp.ClientError:
+                failed = True
+            latencies[kind].append((time.perf_counter() - started) * 1000)
+            if failed:
+                errors[kind] += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        started = time.monotonic()
+        await asyncio.gather(*(client(session, random.Random(seed + i)) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    total = sum(len(samples) for samples in latencies.values())
+    results = {
+        "url": url,
+        "concurrency": concurrency,
+        "duration_s": elapsed,
+        "requests": total,
+        "requests_per_second": total / elapsed if elapsed else 0.0,
+        "errors": sum(errors.values()),
+        "by_kind": {},
+    }
+    for kind, samples in latencies.items():
+        samples.sort()
+        results["by_kind"][kind] = {
+            "requests": len(samples),
+            "errors": errors[kind],
+            "p50_ms": percentile(samples, 0.5),
+            "p95_ms": percentile(samples, 0.95),
+            "p99_ms": percentile(samples, 0.99),
+        }
+    return results
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown request kind {kind!r}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the JSON API with a weighted request mix")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=100, help="simultaneous clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="weighted request kinds, e.g. catalog=50,holder_claims=50 (default: a mixed workload)")
+    parser.add_argument("--api-key", help="value for the X-API-Key header")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args.url.rstrip("/"), args.mix, args.concurrency, args.duration,
+                                   args.api_key, args.seed))
+    print(f"{results['requests']:,} requests in {results['duration_s']:.1f}s: "
+          f"{results['requests_per_second']:,.0f} req/s, {results['errors']:,} errors")
+    for kind, stats in results["by_kind"].items():
+        print(f"  {kind:20} {stats['requests']:8,}  p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms  "
+              f"p99 {stats['p99_ms']:7.1f} ms  errors {stats['errors']:,}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if results["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
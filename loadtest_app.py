@@ -0,0 +1,356 @@
+# Concurrent-session load test for the Streamlit app (hims.py)
+#
+#   python loadtest_app.py --sessions 20 --admins 2 --journeys 3
+#   python loadtest_app.py --scale small --sessions 50 --output app_load.json
+#
+# Every session is a Streamlit AppTest running the real hims.py script in this
+# process, so the sessions share db.py's pools and cache.py's caches the way the
+# browser sessions of one server node do. Policy holder sessions log in, browse
+# the catalog, buy a policy, submit a claim and log out; admin sessions log in,
+# load the dashboard, change the reports' date range, approve or reject a pending
+# claim and log out. Each step is one rerun of the script (one interaction in the
+# browser) and is timed.
+#
+# Reported: rerun latency percentiles per step, database statements per rerun and
+# peak memory growth per session. Statements are counted from metrics.py's query
+# histograms; concurrent sessions' statements can't be told apart, so the
+# per-step counts come from a single-session warm-up pass run first. A journey
+# that fails (an exception in the script, a rerun that times out, a widget that
+# isn't there) is recorded as a failure and the session starts its next journey
+# from a fresh AppTest. --scale tops
+# the database up with synthetic_data.py beforehand, and the policy holder
+# sessions log in as its synthetic users. Purchases, claims and approvals are
+# written for real, so run against a throwaway database (HIMS_DB_NAME=hims_load).
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner
+
+import db
+import metrics
+import synthetic_data
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hims.py")
+
+SESSIONS = 10
+ADMINS = 1
+JOURNEYS = 3  # journeys per session
+THINK_TIME = 0.5  # maximum seconds a session pauses between steps
+RERUN_TIMEOUT = 60  # seconds one rerun may take before AppTest gives up
+START_TIMEOUT = 60  # seconds sessions wait for each other before starting anyway
+
+
+class JourneyError(Exception):
+    pass
+
+
+def percentile(samples, q):
+    return samples[min(int(len(samples) * q), len(samples) - 1)] if samples else 0.0
+
+
+# AppTest is written for one test at a time: each run installs a mock Runtime
+# singleton and clears it when it ends, which breaks the runs of other sessions
+# still in flight, sets global.appTest only for the run's duration, and compiles
+# the script again into a fresh ScriptCache. Keep the runtime and the option in
+# place for the whole load test, and share one script cache between the sessions
+# as the server does.
+def allow_concurrent_runs():
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    last = {}
+    original_instance = Runtime.instance.__func__
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+        return cls._instance or last.get("runtime") or original_instance(cls)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in last)
+    config.set_option("global.appTest", True)
+
+
+# Database statements executed in this process so far
+def statements_executed():
+    return sum(stats["count"] for stats in metrics.snapshot()["db_queries"].values())
+
+
+# Peak resident set size of this process, in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+# (username, password) for the admin sessions and the policy holder sessions
+def session_logins(holders, admin=None):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        if admin is None:
+            cursor.execute("SELECT username, password FROM users WHERE role = 'admin' LIMIT 1")
+            admin = cursor.fetchone()
+            if admin is None:
+                raise JourneyError("No admin user in the database; pass --admin-user and --admin-password")
+        cursor.execute("SELECT username, password FROM users WHERE role = 'policy_holder' ORDER BY user_id LIMIT %s",
+                       (max(holders, 1),))
+        holder_logins = cursor.fetchall()
+        if not holder_logins:
+            raise JourneyError("No policy holder users in the database; fill it with --scale")
+    finally:
+        conn.close()
+    return tuple(admin), [tuple(login) for login in holder_logins]
+
+
+def find(elements, label=None, key_prefix=None):
+    for element in elements:
+        if (label is None or element.label == label) and \
+                (key_prefix is None or (element.key or "").startswith(key_prefix)):
+            return element
+    return None
+
+
+# One simulated browser session of hims.py
+class Session:
+    def __init__(self, username, password, rng, think_time=THINK_TIME, timeout=RERUN_TIMEOUT):
+        self.app = AppTest.from_file(APP_SCRIPT, default_timeout=timeout)
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.think_time = think_time
+        self.samples = []  # (step, milliseconds, statements executed meanwhile)
+        self.failures = []  # (step, message)
+        self.step = None  # the step being run, or the last one run
+
+    # Run the script once, as the browser does after an interaction
+    def rerun(self, step):
+        self.step = step
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+        statements = statements_executed()
+        started = time.perf_counter()
+        try:
+            self.app.run()
+        except Exception as e:
+            # A timed-out rerun is a result too; AppTest raises RuntimeError for it
+            self.samples.append((step, (time.perf_counter() - started) * 1000, statements_executed() - statements))
+            self.failures.append((step, f"{type(e).__name__}: {e}"))
+            raise JourneyError(f"{step} failed: {e}") from e
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.samples.append((step, elapsed_ms, statements_executed() - statements))
+        if self.app.exception:
+            self.failures.append((step, self.app.exception[0].value))
+            raise JourneyError(f"{step} raised {self.app.exception[0].value}")
+
+    def login(self):
+        self.rerun("open")
+        self.app.text_input(key="login_username_unique").input(self.username)
+        self.app.text_input(key="login_password_unique").input(self.password)
+        self.app.button(key="login_button_unique").click()
+        self.rerun("login")
+        if not self.app.session_state["logged_in"]:
+            self.failures.append(("login", f"could not log in as {self.username}"))
+            raise JourneyError(f"could not log in as {self.username}")
+
+    def logout(self):
+        find(self.app.button, label="Logout").click()
+        self.rerun("logout")
+
+    def holder_journey(self):
+        self.login()
+        self.rerun("browse_catalog")
+
+        buy = [button for button in self.app.button if (button.key or "").startswith("buy_policy_")]
+        if buy:
+            self.rng.choice(buy).click()
+            self.rerun("choose_policy")
+            find(self.app.text_input, label="Full Name").input(f"Load Test {self.username}")
+            find(self.app.number_input, label="Age").set_value(self.rng.randint(18, 90))
+            find(self.app.text_input, label="Contact Number").input("9999999999")
+            find(self.app.button, label="Confirm Purchase").click()
+            self.rerun("buy_policy")
+
+        claim_amount = find(self.app.number_input, label="Claim Amount")
+        if claim_amount is not None:
+            claim_amount.set_value(round(self.rng.lognormvariate(10, 1), 2))
+            find(self.app.text_area, label="Claim Description").input("Load test claim")
+            find(self.app.button, label="Submit Claim").click()
+            self.rerun("submit_claim")
+        self.logout()
+
+    def admin_journey(self):
+        self.login()
+        self.rerun("dashboard")
+
+        # A date range nobody has viewed yet, so the trends are loaded, not cached
+        end = date.today() - timedelta(days=self.rng.randint(0, 365))
+        self.app.date_input(key="trends_date_range").set_value((end - timedelta(days=30), end))
+        self.rerun("reports")
+
+        decide = [button for button in self.app.button
+                  if (button.key or "").startswith(("approve_", "reject_"))]
+        if decide:
+            self.rng.choice(decide).click()
+            self.rerun("adjudicate_claim")
+        self.logout()
+
+    def run(self, role, journeys):
+        journey = self.admin_journey if role == "admin" else self.holder_journey
+        for _ in range(journeys):
+            try:
+                journey()
+            except Exception as e:
+                if not isinstance(e, JourneyError):  # JourneyErrors are recorded where they're raised
+                    self.failures.append((f"after {self.step}", f"{type(e).__name__}: {e}"))
+                # Start the next journey from a fresh session
+                self.app = AppTest.from_file(APP_SCRIPT, default_timeout=self.app.default_timeout)
+
+
+# Statements per rerun of each step, from one admin and one policy holder journey
+# run on their own (which also warms the caches and pools)
+def warm_up(admin, holder, seed=0, timeout=RERUN_TIMEOUT):
+    statements = {}
+    for role, (username, password) in (("admin", admin), ("policy_holder", holder)):
+        session = Session(username, password, random.Random(seed), think_time=0, timeout=timeout)
+        session.run(role, 1)
+        if session.failures:
+            step, message = session.failures[0]
+            raise JourneyError(f"warm-up {role} journey failed at {step}: {message}")
+        for step, _, count in session.samples:
+            statements.setdefault(step, []).append(count)
+    return {step: statistics.fmean(counts) for step, counts in statements.items()}
+
+
+def run_load(sessions=SESSIONS, admins=ADMINS, journeys=JOURNEYS, think_time=THINK_TIME, seed=0,
+             admin_login=None, timeout=RERUN_TIMEOUT, log=print):
+    admin, holder_logins = session_logins(sessions - admins, admin_login)
+    allow_concurrent_runs()
+    log("Warming up with one admin and one policy holder journey")
+    step_statements = warm_up(admin, holder_logins[-1], seed, timeout)
+
+    roles = ["admin"] * admins + ["policy_holder"] * (sessions - admins)
+    rss_before = peak_rss_mb()
+    statements_before = statements_executed()
+    start = threading.Barrier(sessions, timeout=START_TIMEOUT)
+
+    def session(index):
+        username, password = admin if roles[index] == "admin" else holder_logins[index % len(holder_logins)]
+        try:
+            simulated = Session(username, password, random.Random(seed + index), think_time, timeout)
+        except Exception:
+            start.abort()
+            raise
+        try:
+            start.wait()
+        except threading.BrokenBarrierError:
+            pass  # another session failed to start; run without waiting for it
+        simulated.run(roles[index], journeys)
+        return simulated
+
+    log(f"Running {sessions} sessions ({admins} admin) for {journeys} journeys each")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(sessions) as executor:
+        finished = list(executor.map(session, range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    samples = [sample for simulated in finished for sample in simulated.samples]
+    failures = [failure for simulated in finished for failure in simulated.failures]
+    latencies = {}
+    for step, elapsed_ms, _ in samples:
+        latencies.setdefault(step, []).append(elapsed_ms)
+    every_rerun = sorted(elapsed_ms for _, elapsed_ms, _ in samples)
+
+    results = {
+        "sessions": sessions,
+        "admins": admins,
+        "journeys": journeys,
+        "duration_s": elapsed,
+        "reruns": len(samples),
+        "reruns_per_second": len(samples) / elapsed if elapsed else 0.0,
+        "failures": len(failures),
+        "first_failures": [f"{step}: {message}" for step, message in failures[:10]],
+        "p50_ms": percentile(every_rerun, 0.5),
+        "p95_ms": percentile(every_rerun, 0.95),
+        "p99_ms": percentile(every_rerun, 0.99),
+        "statements_per_rerun": (statements_executed() - statements_before) / len(samples) if samples else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "memory_per_session_mb": (peak_rss_mb() - rss_before) / sessions,
+        "by_step": {},
+    }
+    for step, step_samples in latencies.items():
+        step_samples.sort()
+        results["by_step"][step] = {
+            "reruns": len(step_samples),
+            "p50_ms": percentile(step_samples, 0.5),
+            "p95_ms": percentile(step_samples, 0.95),
+            "p99_ms": percentile(step_samples, 0.99),
+            "max_ms": step_samples[-1],
+            "statements_per_rerun": step_statements.get(step),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test hims.py with concurrent scripted Streamlit sessions")
+    parser.add_argument("--sessions", type=int, default=SESSIONS, help="simultaneous sessions")
+    parser.add_argument("--admins", type=int, default=ADMINS, help="how many of the sessions are admins")
+    parser.add_argument("--journeys", type=int, default=JOURNEYS, help="journeys each session runs")
+    parser.add_argument("--think-time", type=float, default=THINK_TIME,
+                        help="maximum seconds between a session's steps (default: 0.5)")
+    parser.add_argument("--scale", choices=synthetic_data.SCALES, help="fill the database to this scale first")
+    parser.add_argument("--admin-user", help="admin username (default: the first admin in the users table)")
+    parser.add_argument("--admin-password")
+    parser.add_argument("--timeout", type=float, default=RERUN_TIMEOUT, help="seconds one rerun may take")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    if not 0 <= args.admins <= args.sessions:
+        parser.error("--admins must be between 0 and --sessions")
+
+    if args.scale:
+        conn = db.get_connection()
+        try:
+            print(f"Filling to scale {args.scale}")
+            synthetic_data.fill(conn, seed=args.seed, **synthetic_data.SCALES[args.scale])
+        finally:
+            conn.close()
+
+    admin_login = (args.admin_user, args.admin_password) if args.admin_user else None
+    try:
+        results = run_load(args.sessions, args.admins, args.journeys, args.think_time, args.seed, admin_login,
+                           args.timeout)
+    except JourneyError as e:
+        sys.exit(f"error: {e}")
+
+    print(f"{results['reruns']:,} reruns in {results['duration_s']:.1f}s: {results['reruns_per_second']:,.1f} reruns/s, "
+          f"p50 {results['p50_ms']:.0f} ms, p95 {results['p95_ms']:.0f} ms, p99 {results['p99_ms']:.0f} ms, "
+          f"{results['failures']:,} failures")
+    print(f"{results['statements_per_rerun']:.1f} statements per rerun, "
+          f"{results['memory_per_session_mb']:.1f} MB per session (peak RSS {results['peak_rss_mb']:.0f} MB)")
+    for step, stats in results["by_step"].items():
+        statements = stats["statements_per_rerun"]
+        print(f"  {step:18} {stats['reruns']:6,}  p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms  "
+              f"p99 {stats['p99_ms']:7.1f} ms  statements {'-' if statements is None else f'{statements:.1f}'}")
+    for failure in results["first_failures"]:
+        print(f"  failed: {failure}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if results["failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# Query and render timing metrics, shared by every Streamlit session
+#
+# Every cursor handed out by db.py records the time, row count and errors of its
+# execute calls under the data function that made them (set with @tagged), and
+# hims.py wraps each page section in render_span(). The aggregated histograms are
+# available as Prometheus text or JSON from an HTTP endpoint started by
+# start_server() when HIMS_METRICS_PORT is set:
+#
+#   curl localhost:9464/metrics          Prometheus text format
+#   curl localhost:9464/metrics.json     JSON summary
+#
+# Statements slower than HIMS_SLOW_QUERY_MS are logged to the "hims.slow_query"
+# logger (and appended to HIMS_SLOW_QUERY_LOG when set).
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("HIMS_METRICS_PORT", "0"))  # 0 disables the endpoint
+METRICS_HOST = os.environ.get("HIMS_METRICS_HOST", "127.0.0.1")
+SLOW_QUERY_MS = float(os.environ.get("HIMS_SLOW_QUERY_MS", "0"))  # 0 disables the slow query log
+SLOW_QUERY_LOG = os.environ.get("HIMS_SLOW_QUERY_LOG")
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Data function the current database calls are made on behalf of
+current_function = contextvars.ContextVar("current_function", default="untagged")
+
+slow_query_logger = logging.getLogger("hims.slow_query")
+if SLOW_QUERY_LOG:
+    slow_query_logger.addHandler(logging.FileHandler(SLOW_QUERY_LOG))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    # Upper bound of the bucket holding the given quantile (the largest bucket
+    # bound for observations beyond it)
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+_lock = threading.Lock()
+_query_seconds = {}  # function -> Histogram
+_query_rows = {}  # function -> rows returned or affected
+_query_errors = {}  # function -> failed statements
+_render_seconds = {}  # section -> Histogram
+
+
+def observe_query(function, seconds, rows, failed):
+    with _lock:
+        _query_seconds.setdefault(function, Histogram()).observe(seconds)
+        _query_rows[function] = _query_rows.get(function, 0) + rows
+        if failed:
+            _query_errors[function] = _query_errors.get(function, 0) + 1
+
+
+def observe_render(section, seconds):
+    with _lock:
+        _render_seconds.setdefault(section, Histogram()).observe(seconds)
+
+
+# Decorator: tag the database calls made inside func with its name
+def tagged(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = current_function.set(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current_function.reset(token)
+    return wrapper
+
+
+# Time a page section
+@contextmanager
+def render_span(section):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_render(section, time.perf_counter() - started)
+
+
+# Cursor wrapper that times execute/executemany; everything else is delegated
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def execute(self, query, args=None):
+        return self._timed(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._timed(self._cursor.executemany, query, args)
+
+    def _timed(self, method, query, args):
+        function = current_function.get()
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = method(query, args)
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            # Unbuffered cursors don't know their row count until fetched
+            rowcount = getattr(self._cursor, "rowcount", -1)
+            rows = rowcount if not failed and 0 <= rowcount < 2 ** 63 else 0
+            observe_query(function, seconds, rows, failed)
+            if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+                slow_query_logger.warning("slow query in %s: %.1f ms, %d rows%s: %s", function, seconds * 1000,
+                                          rows, " (failed)" if failed else "", " ".join(str(query).split())[:500])
+
+
+def histogram_summary(histogram):
+    return {
+        "count": histogram.count,
+        "total_ms": histogram.sum * 1000,
+        "mean_ms": histogram.sum * 1000 / histogram.count if histogram.count else 0.0,
+        "p50_ms": histogram.quantile(0.5) * 1000,
+        "p95_ms": histogram.quantile(0.95) * 1000,
+        "p99_ms": histogram.quantile(0.99) * 1000,
+    }
+
+
+# JSON-serialisable summary of everything recorded so far
+def snapshot():
+    with _lock:
+        queries = {function: dict(histogram_summary(histogram), rows=_query_rows.get(function, 0),
+                                  errors=_query_errors.get(function, 0))
+                   for function, histogram in sorted(_query_seconds.items())}
+        render = {section: histogram_summary(histogram) for section, histogram in sorted(_render_seconds.items())}
+    return {"db_queries": queries, "render": render}
+
+
+def prometheus_histogram(lines, name, label, histograms):
+    for value, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {histogram.sum}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {histogram.count}')
+
+
+# Everything recorded so far in the Prometheus text exposition format
+def prometheus_text():
+    lines = []
+    with _lock:
+        lines.append("# HELP hims_db_query_seconds Time spent executing database statements, by data function")
+        lines.append("# TYPE hims_db_query_seconds histogram")
+        prometheus_histogram(lines, "hims_db_query_seconds", "function", _query_seconds)
+        lines.append("# HELP hims_db_rows_total Rows returned or affected by database statements, by data function")
+        lines.append("# TYPE hims_db_rows_total counter")
+        lines.extend(f'hims_db_rows_total{{function="{function}"}} {rows}'
+                     for function, rows in sorted(_query_rows.items()))
+        lines.append("# HELP hims_db_errors_total Database statements that raised, by data function")
+        lines.append("# TYPE hims_db_errors_total counter")
+        lines.extend(f'hims_db_errors_total{{function="{function}"}} {errors}'
+                     for function, errors in sorted(_query_errors.items()))
+        lines.append("# HELP hims_render_seconds Time spent rendering page sections")
+        lines.append("# TYPE hims_render_seconds histogram")
+        prometheus_histogram(lines, "hims_render_seconds", "section", _render_seconds)
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _query_seconds.clear()
+        _query_rows.clear()
+        _query_errors.clear()
+        _render_seconds.clear()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus_text(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot(), indent=2), "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Start the metrics endpoint in a background thread, once per process. Safe to
+# call on every rerun; does nothing when no port is configured.
+def start_server(port=METRICS_PORT, host=METRICS_HOST):
+    global _server
+    if not port or _server is not None:
+        return _server or None
+    with _server_lock:
+        if _server is None:
+            try:
+                server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                # e.g. another app process on this node already serves the port;
+                # don't retry on every rerun
+                logging.getLogger("hims.metrics").warning("metrics endpoint not started on %s:%s: %s", host, port, e)
+                _server = False
+                return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="hims-metrics", daemon=True).start()
+            _server = server
+    return _server
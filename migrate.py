@@ -0,0 +1,154 @@
+# Versioned schema migrations for existing databases
+#
+#   python migrate.py             apply pending migrations
+#   python migrate.py --status    list applied and pending migrations
+#
+# hims.sql builds a new database with the current schema and records the
+# migrations it already contains. Every schema change is also added as
+# migrations/NNNN_description.sql so databases created earlier can be brought
+# up to date. Each file is applied once, in version order, and recorded in
+# schema_migrations. Files may use DELIMITER like the mysql client does.
+import argparse
+import hashlib
+import os
+import re
+import sys
+
+import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+LOCK_NAME = "hims_schema_migrations"
+
+
+class MigrationError(Exception):
+    pass
+
+
+# (version, name, path) for every migration file, in version order
+def find_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Two migration files share a version number")
+    return migrations
+
+
+# Split a SQL script into statements, honouring DELIMITER lines and skipping comments
+def split_statements(sql):
+    statements = []
+    delimiter = ";"
+    current = []
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith("DELIMITER "):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not current and (not stripped or stripped.startswith("--")):
+            continue
+        current.append(line)
+        if stripped.endswith(delimiter):
+            statement = "\n".join(current).rstrip()[:-len(delimiter)].strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    if "\n".join(current).strip():
+        statements.append("\n".join(current).strip())
+    return statements
+
+
+def checksum(sql):
+    return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            checksum CHAR(64),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_migrations(cursor):
+    cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cursor.fetchall())
+
+
+# Apply every pending migration; returns the list of (version, name) applied
+def migrate(conn, migrations=None, log=print):
+    migrations = find_migrations() if migrations is None else migrations
+    cursor = conn.cursor()
+    ensure_migrations_table(cursor)
+
+    # Serialise concurrent runners (e.g. several app nodes starting together)
+    cursor.execute("SELECT GET_LOCK(%s, 30)", (LOCK_NAME,))
+    if cursor.fetchone()[0] != 1:
+        raise MigrationError("Another migration run holds the lock")
+    try:
+        applied = applied_migrations(cursor)
+        done = []
+        for version, name, path in migrations:
+            with open(path, encoding="utf-8") as f:
+                sql = f.read()
+            if version in applied:
+                if applied[version] and applied[version] != checksum(sql):
+                    log(f"warning: migration {version:04d}_{name} changed after it was applied")
+                continue
+
+            log(f"Applying {version:04d}_{name}")
+            # MySQL commits DDL implicitly, so a failure part-way through a file can
+            # leave it partly applied; the error names the statement to fix up by hand
+            for statement in split_statements(sql):
+                try:
+                    cursor.execute(statement)
+                except Exception as e:
+                    conn.rollback()
+                    raise MigrationError(f"{version:04d}_{name} failed on:\n{statement}\n{e}") from e
+            cursor.execute("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                           (version, name, checksum(sql)))
+            conn.commit()
+            done.append((version, name))
+        return done
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchall()
+
+
+def status(conn):
+    cursor = conn.cursor()
+    ensure_migrations_table(cursor)
+    applied = applied_migrations(cursor)
+    return [(version, name, version in applied) for version, name, _ in find_migrations()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations from migrations/")
+    parser.add_argument("--status", action="store_true", help="list migrations and whether they are applied")
+    args = parser.parse_args()
+    if db.BACKEND != "mysql":
+        parser.error("migrations are MySQL scripts; SQLite databases are created with the current schema")
+
+    conn = db.get_connection()
+    try:
+        if args.status:
+            for version, name, is_applied in status(conn):
+                print(f"{version:04d}_{name}: {'applied' if is_applied else 'pending'}")
+            return
+        done = migrate(conn)
+        print(f"Applied {len(done)} migration(s)" if done else "Database is up to date")
+    except MigrationError as e:
+        sys.exit(f"error: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+-- Serves the admin claims review queue (pending claims paged by claim_id)
+CREATE INDEX idx_claims_status_claim_id ON claims (status, claim_id);
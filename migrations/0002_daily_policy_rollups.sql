@@ -0,0 +1,12 @@
+-- Daily per-policy business totals maintained by hims.py.
+-- Populate existing history afterwards with `python rollups.py backfill`.
+CREATE TABLE daily_policy_rollups (
+    day DATE NOT NULL,
+    policy_id INT NOT NULL,
+    purchases INT NOT NULL DEFAULT 0,
+    premium_collected DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    claims_submitted INT NOT NULL DEFAULT 0,
+    claims_approved INT NOT NULL DEFAULT 0,
+    approved_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, policy_id)
+);
@@ -0,0 +1,2 @@
+-- Covering index for get_user_policies (latest purchase per policy for a user)
+CREATE INDEX idx_policy_purchases_user_policy_date ON policy_purchases (user_id, policy_id, purchase_date);
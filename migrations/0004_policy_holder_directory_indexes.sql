@@ -0,0 +1,5 @@
+-- Serve the admin policy holder directory's search: name and contact prefixes,
+-- and words anywhere in the name
+CREATE INDEX idx_policy_holders_name ON policy_holders (name);
+CREATE INDEX idx_policy_holders_contact ON policy_holders (contact);
+CREATE FULLTEXT INDEX ft_policy_holders_name ON policy_holders (name);
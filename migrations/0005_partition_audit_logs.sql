@@ -0,0 +1,45 @@
+-- Range partition the trigger-maintained log tables by month so old months can be
+-- archived and dropped with `python audit_logs.py archive`. The partitioning column
+-- has to be part of every unique key, so each primary key becomes (log_id, date).
+-- Afterwards run `python audit_logs.py rotate` once to split the existing rows into
+-- monthly partitions, then daily (e.g. from cron) to add partitions ahead of time.
+ALTER TABLE purchase_logs
+    MODIFY purchase_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, purchase_date);
+ALTER TABLE purchase_logs PARTITION BY RANGE (UNIX_TIMESTAMP(purchase_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+ALTER TABLE claim_submission_logs
+    MODIFY submission_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, submission_date);
+ALTER TABLE claim_submission_logs PARTITION BY RANGE (UNIX_TIMESTAMP(submission_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+ALTER TABLE claim_status_change_logs
+    MODIFY change_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, change_date);
+ALTER TABLE claim_status_change_logs PARTITION BY RANGE (UNIX_TIMESTAMP(change_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+ALTER TABLE policy_creation_logs
+    MODIFY creation_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, creation_date);
+ALTER TABLE policy_creation_logs PARTITION BY RANGE (UNIX_TIMESTAMP(creation_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+ALTER TABLE policy_deletion_logs
+    MODIFY deletion_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, deletion_date);
+ALTER TABLE policy_deletion_logs PARTITION BY RANGE (UNIX_TIMESTAMP(deletion_date)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+
+-- Months exported to archive files and dropped from the log tables
+CREATE TABLE audit_log_archives (
+    table_name VARCHAR(64) NOT NULL,
+    month DATE NOT NULL,
+    row_count INT NOT NULL,
+    path VARCHAR(1024) NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, month)
+);
@@ -0,0 +1,4 @@
+-- Idempotency key for claims written by the claim ingestion queue
+-- (claim_queue.py): a batch flushed twice inserts each claim once
+ALTER TABLE claims ADD COLUMN ingest_ref CHAR(32) NULL;
+CREATE UNIQUE INDEX uq_claims_ingest_ref ON claims (ingest_ref);
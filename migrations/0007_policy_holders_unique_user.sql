@@ -0,0 +1,16 @@
+-- One policy holder record per user, so buy_policy can create it with an upsert
+-- instead of check-then-insert. Duplicates created by earlier concurrent
+-- purchases are merged into the user's first record before adding the key.
+UPDATE claims c
+JOIN policy_holders h ON h.id = c.policy_holder_id
+JOIN (
+    SELECT user_id, MIN(id) AS keep_id FROM policy_holders GROUP BY user_id HAVING COUNT(*) > 1
+) k ON k.user_id = h.user_id
+SET c.policy_holder_id = k.keep_id
+WHERE h.id <> k.keep_id;
+DELETE h FROM policy_holders h
+JOIN (
+    SELECT user_id, MIN(id) AS keep_id FROM policy_holders GROUP BY user_id HAVING COUNT(*) > 1
+) k ON k.user_id = h.user_id
+WHERE h.id <> k.keep_id;
+CREATE UNIQUE INDEX uq_policy_holders_user_id ON policy_holders (user_id);
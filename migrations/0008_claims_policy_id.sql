@@ -0,0 +1,18 @@
+-- Record the policy a claim is made against, so claims and approved amounts are
+-- rolled up per policy and loss ratios can be reported per product.
+ALTER TABLE claims
+    ADD COLUMN policy_id INT NULL AFTER policy_holder_id,
+    ADD CONSTRAINT fk_claims_policy FOREIGN KEY (policy_id) REFERENCES policies(policy_id);
+-- Existing claims of holders who own exactly one policy can only be against it;
+-- the rest stay unattributed (rolled up under policy_id 0). Run `python rollups.py
+-- backfill` afterwards to re-attribute the rollups of days still in the claim logs.
+UPDATE claims c
+JOIN policy_holders h ON h.id = c.policy_holder_id
+JOIN (
+    SELECT user_id, MIN(policy_id) AS policy_id
+    FROM policy_purchases
+    GROUP BY user_id
+    HAVING COUNT(DISTINCT policy_id) = 1
+) owned ON owned.user_id = h.user_id
+SET c.policy_id = owned.policy_id
+WHERE c.policy_id IS NULL;
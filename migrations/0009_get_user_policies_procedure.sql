@@ -0,0 +1,25 @@
+-- Recreate get_user_policies: its derived table filtered on an unqualified
+-- user_id, which inside the procedure resolves to the parameter, so it returned
+-- every user's purchases.
+DROP PROCEDURE IF EXISTS get_user_policies;
+
+DELIMITER $$
+CREATE PROCEDURE get_user_policies(IN user_id INT)
+BEGIN
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        SHOW ERRORS;
+        RETURN;
+    END;
+    
+    SELECT p.policy_id, p.policy_name, p.policy_details, p.premium, pp.latest_purchase_date
+    FROM (
+        SELECT pp2.policy_id, MAX(pp2.purchase_date) AS latest_purchase_date
+        FROM policy_purchases pp2
+        WHERE pp2.user_id = user_id
+        GROUP BY pp2.policy_id
+    ) pp
+    JOIN policies p ON p.policy_id = pp.policy_id
+    ORDER BY pp.latest_purchase_date DESC;
+END$$
+DELIMITER ;
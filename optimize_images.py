@@ -0,0 +1,31 @@
+# Write pre-compressed WebP variants of the PNG backgrounds in static/
+#
+#   python optimize_images.py [--quality 80]
+#
+# set_page_style() serves a .webp next to a .png automatically (browsers without
+# WebP support keep using the PNG). Requires Pillow.
+import argparse
+import os
+
+from PIL import Image
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create WebP variants of the images in static/")
+    parser.add_argument("--quality", type=int, default=80, help="WebP quality (0-100)")
+    args = parser.parse_args()
+
+    for filename in sorted(os.listdir(STATIC_DIR)):
+        if not filename.lower().endswith(".png"):
+            continue
+        png_path = os.path.join(STATIC_DIR, filename)
+        webp_path = os.path.splitext(png_path)[0] + ".webp"
+        with Image.open(png_path) as image:
+            image.save(webp_path, "WEBP", quality=args.quality, method=6)
+        print(f"{filename}: {os.path.getsize(png_path):,} -> {os.path.getsize(webp_path):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# SQL shared by the Streamlit app (hims.py, pymysql) and the JSON API (api.py,
+# aiomysql), so both paths read and write the same way
+LOGIN = "SELECT role, user_id FROM users WHERE username = %s and password = %s"
+
+POLICY_CATALOG = "SELECT policy_id, policy_name, policy_details, premium FROM policies"
+
+POLICY_HOLDER_ID = "SELECT id FROM policy_holders WHERE user_id = %s"
+
+# Create the user's policy holder record unless it exists (policy_holders.user_id
+# is unique). Either way the cursor's lastrowid is the holder's id; an existing
+# record is left unchanged.
+UPSERT_POLICY_HOLDER = """
+    INSERT INTO policy_holders (user_id, name, age, contact, address)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+"""
+
+# Record a purchase of an existing policy; inserts no row (rowcount 0) when the
+# policy doesn't exist
+INSERT_PURCHASE = """
+    INSERT INTO policy_purchases (user_id, policy_id)
+    SELECT %s, policy_id FROM policies WHERE policy_id = %s
+"""
+
+# A user's purchased policies with the latest purchase date of each. The grouped
+# derived table is served entirely by the policy_purchases(user_id, policy_id,
+# purchase_date) index.
+USER_POLICIES = """
+    SELECT p.policy_id, p.policy_name, p.policy_details, p.premium, pp.latest_purchase_date
+    FROM (
+        SELECT policy_id, MAX(purchase_date) AS latest_purchase_date
+        FROM policy_purchases
+        WHERE user_id = %s
+        GROUP BY policy_id
+    ) pp
+    JOIN policies p ON p.policy_id = pp.policy_id
+    ORDER BY pp.latest_purchase_date DESC
+"""
+
+INSERT_CLAIM = """
+    INSERT INTO claims (policy_holder_id, policy_id, claim_amount, description, status)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+# Only a Pending claim is adjudicated (firing the after_claim_status_change
+# trigger), so a decision is final and an approval is counted exactly once
+UPDATE_CLAIM_STATUS = "UPDATE claims SET status = %s WHERE claim_id = %s AND status = 'Pending'"
+
+POLICY_HOLDER_CLAIMS = """
+    SELECT claim_id, claim_amount, description, status
+    FROM claims
+    WHERE policy_holder_id = %s
+    ORDER BY claim_id DESC
+"""
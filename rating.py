@@ -0,0 +1,193 @@
+# Premium rating engine
+#
+#   python rating.py quote --age 52 --coverage 500000 [--policy "Mediclaim"]
+#   python rating.py reprice --output repricing.csv [--all-policies]
+#
+# premium = coverage * base_rate * age band factor * coverage tier factor
+#           * policy type factor
+#
+# The factors come from rating_tables.json (HIMS_RATING_TABLES overrides the
+# path), loaded once per process. The shipped tables reproduce the original
+# calculate_premium(): a 5% base rate and a 1.2 loading above age 45. `reprice`
+# re-rates the whole book (every holder's policies, or every holder against every
+# policy with --all-policies) in one vectorised NumPy pass and exports the premium
+# delta against the current catalog premium for each holder.
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+
+import db
+
+RATING_TABLES_PATH = os.environ.get(
+    "HIMS_RATING_TABLES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rating_tables.json"))
+FETCH_SIZE = 100000  # rows per fetchmany when loading the book
+
+
+class RatingTableError(ValueError):
+    pass
+
+
+# Upper limits and factors of a banded table. Bands are listed in increasing order
+# of their limit and the last band has no limit (null).
+def band_arrays(bands, limit_key):
+    if not bands or bands[-1][limit_key] is not None:
+        raise RatingTableError(f"The last band must have {limit_key}: null")
+    limits = np.array([band[limit_key] for band in bands[:-1]], dtype=float)
+    if np.any(np.diff(limits) <= 0):
+        raise RatingTableError(f"Bands must be in increasing order of {limit_key}")
+    factors = np.array([band["factor"] for band in bands], dtype=float)
+    return limits, factors
+
+
+class RatingTables:
+    def __init__(self, tables):
+        self.base_rate = float(tables["base_rate"])
+        self.age_limits, self.age_factors = band_arrays(tables["age_bands"], "max_age")
+        self.coverage_limits, self.coverage_factors = band_arrays(tables["coverage_tiers"], "max_coverage")
+        policy_types = dict(tables.get("policy_types", {}))
+        self.default_type = policy_types.pop("default", {"factor": 1.0, "coverage": 0})
+        self.policy_types = policy_types
+
+    # Rating factor and default coverage amount for a policy, by name
+    def policy_type(self, policy_name):
+        policy_type = self.policy_types.get(policy_name, self.default_type)
+        return float(policy_type.get("factor", 1.0)), float(policy_type.get("coverage", self.default_type["coverage"]))
+
+    # Premiums for arrays of ages and coverage amounts (and optional policy type
+    # factors); the arguments broadcast against each other
+    def premiums(self, ages, coverages, type_factors=1.0):
+        ages = np.asarray(ages, dtype=float)
+        coverages = np.asarray(coverages, dtype=float)
+        age_factors = self.age_factors[np.searchsorted(self.age_limits, ages, side="left")]
+        coverage_factors = self.coverage_factors[np.searchsorted(self.coverage_limits, coverages, side="left")]
+        return coverages * self.base_rate * age_factors * coverage_factors * type_factors
+
+
+@lru_cache(maxsize=None)
+def load_rating_tables(path=RATING_TABLES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return RatingTables(json.load(f))
+
+
+# Premium for a single applicant
+def quote(coverage_amount, age, policy_name=None, tables=None):
+    tables = tables or load_rating_tables()
+    type_factor = tables.policy_type(policy_name)[0] if policy_name else 1.0
+    return float(tables.premiums(age, coverage_amount, type_factor))
+
+
+# Run a query and return its columns as NumPy arrays, streaming rows in batches
+def fetch_columns(conn, query, dtypes):
+    cursor = conn.cursor(db.pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(query)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(rows)
+    finally:
+        cursor.close()
+    rows = [row for chunk in chunks for row in chunk]
+    return [np.array([row[i] for row in rows], dtype=dtype) for i, dtype in enumerate(dtypes)]
+
+
+# Re-rate the book. Returns a dict of equal-length arrays, one entry per
+# (holder, policy) pair: the holder's policies, or every policy with all_policies.
+def reprice_book(conn, tables=None, all_policies=False):
+    tables = tables or load_rating_tables()
+
+    holder_ids, holder_users, holder_ages = fetch_columns(
+        conn, "SELECT id, user_id, age FROM policy_holders ORDER BY user_id, id", (np.int64, np.int64, np.int64))
+    policy_ids, policy_names, policy_premiums = fetch_columns(
+        conn, "SELECT policy_id, policy_name, premium FROM policies ORDER BY policy_id", (np.int64, object, float))
+    policy_types = [tables.policy_type(name) for name in policy_names]
+    type_factors = np.array([factor for factor, _ in policy_types], dtype=float)
+    coverages = np.array([coverage for _, coverage in policy_types], dtype=float)
+
+    if all_policies:
+        holder_index = np.repeat(np.arange(len(holder_ids)), len(policy_ids))
+        policy_index = np.tile(np.arange(len(policy_ids)), len(holder_ids))
+    else:
+        owned_users, owned_policies = fetch_columns(
+            conn, "SELECT DISTINCT user_id, policy_id FROM policy_purchases", (np.int64, np.int64))
+        # Match purchases to holders and policies by binary search on the sorted IDs
+        holder_index = np.searchsorted(holder_users, owned_users)
+        policy_index = np.searchsorted(policy_ids, owned_policies)
+        matched = ((holder_index < len(holder_users)) & (policy_index < len(policy_ids)))
+        matched[matched] &= ((holder_users[holder_index[matched]] == owned_users[matched])
+                             & (policy_ids[policy_index[matched]] == owned_policies[matched]))
+        holder_index, policy_index = holder_index[matched], policy_index[matched]
+
+    new_premiums = np.round(tables.premiums(holder_ages[holder_index], coverages[policy_index],
+                                            type_factors[policy_index]), 2)
+    current_premiums = policy_premiums[policy_index]
+    return {
+        "holder_id": holder_ids[holder_index],
+        "user_id": holder_users[holder_index],
+        "age": holder_ages[holder_index],
+        "policy_id": policy_ids[policy_index],
+        "policy_name": policy_names[policy_index],
+        "current_premium": current_premiums,
+        "new_premium": new_premiums,
+        "delta": np.round(new_premiums - current_premiums, 2),
+    }
+
+
+def export_csv(book, path):
+    columns = list(book)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*(book[column].tolist() for column in columns)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quote premiums and re-price the policy book")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    quote_parser = subparsers.add_parser("quote", help="quote one applicant")
+    quote_parser.add_argument("--age", type=float, required=True)
+    quote_parser.add_argument("--coverage", type=float, required=True)
+    quote_parser.add_argument("--policy", help="policy name, for its policy type factor")
+    reprice_parser = subparsers.add_parser("reprice", help="re-price every holder and export the deltas")
+    reprice_parser.add_argument("--output", required=True, help="CSV file for the per-holder results")
+    reprice_parser.add_argument("--all-policies", action="store_true",
+                                help="quote every holder against every policy, not just the ones they own")
+    args = parser.parse_args()
+
+    try:
+        tables = load_rating_tables()
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"error: cannot load rating tables from {RATING_TABLES_PATH}: {e}")
+
+    if args.command == "quote":
+        print(f"{quote(args.coverage, args.age, args.policy, tables):.2f}")
+        return
+
+    started = time.monotonic()
+    conn = db.get_connection()
+    try:
+        book = reprice_book(conn, tables, all_policies=args.all_policies)
+    finally:
+        conn.close()
+    rated = time.monotonic()
+    export_csv(book, args.output)
+    finished = time.monotonic()
+
+    print(f"Re-priced {len(book['holder_id']):,} holder policies for "
+          f"{len(np.unique(book['holder_id'])):,} holders in {rated - started:.2f}s "
+          f"(export {finished - rated:.2f}s)")
+    print(f"Current premium total {book['current_premium'].sum():,.2f}, "
+          f"new total {book['new_premium'].sum():,.2f}, "
+          f"change {book['delta'].sum():+,.2f}")
+
+
+if __name__ == "__main__":
+    main()
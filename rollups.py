@@ -0,0 +1,173 @@
+# Daily per-policy rollups for time-series reporting
+#
+# daily_policy_rollups holds one row per (day, policy) with purchases, premium,
+# claims submitted, claims approved and approved amount. The record_* helpers are
+# called with the writer's cursor so the rollup changes commit atomically with
+# the write itself. `python rollups.py backfill` rebuilds rows from the raw and
+# log tables for data written before the rollups existed. The per-policy monthly
+# loss ratios (approved amount / premium collected) are read from this table, so
+# the report never scans claims or purchases.
+import argparse
+from datetime import date, timedelta
+
+import audit_logs
+import db
+
+# Claim counts and amounts of claims that don't record the policy they are made
+# against (claims.policy_id is NULL) are kept under this policy_id
+UNATTRIBUTED_POLICY_ID = 0
+
+
+# The statements are also executed by api.py on its async cursors
+RECORD_PURCHASE = """
+    INSERT INTO daily_policy_rollups (day, policy_id, purchases, premium_collected)
+    SELECT CURDATE(), policy_id, 1, premium FROM policies WHERE policy_id = %s
+    ON DUPLICATE KEY UPDATE purchases = purchases + 1,
+                            premium_collected = premium_collected + VALUES(premium_collected)
+"""
+
+RECORD_CLAIMS_SUBMITTED = """
+    INSERT INTO daily_policy_rollups (day, policy_id, claims_submitted)
+    VALUES (CURDATE(), %s, %s)
+    ON DUPLICATE KEY UPDATE claims_submitted = claims_submitted + VALUES(claims_submitted)
+"""
+
+
+# Statement and parameters adding approved claims to today's rollup
+def claims_approved_statement(claim_ids):
+    placeholders = ", ".join(["%s"] * len(claim_ids))
+    return f"""
+        INSERT INTO daily_policy_rollups (day, policy_id, claims_approved, approved_amount)
+        SELECT CURDATE(), COALESCE(policy_id, %s), COUNT(*), COALESCE(SUM(claim_amount), 0)
+        FROM claims WHERE claim_id IN ({placeholders})
+        GROUP BY COALESCE(policy_id, %s)
+        ON DUPLICATE KEY UPDATE claims_approved = claims_approved + VALUES(claims_approved),
+                                approved_amount = approved_amount + VALUES(approved_amount)
+    """, [UNATTRIBUTED_POLICY_ID] + list(claim_ids) + [UNATTRIBUTED_POLICY_ID]
+
+
+def record_purchase(cursor, policy_id):
+    cursor.execute(RECORD_PURCHASE, (policy_id,))
+
+
+def record_claims_submitted(cursor, policy_id=None, count=1):
+    cursor.execute(RECORD_CLAIMS_SUBMITTED, (policy_id or UNATTRIBUTED_POLICY_ID, count))
+
+
+def record_claims_approved(cursor, claim_ids):
+    cursor.execute(*claims_approved_statement(claim_ids))
+
+
+# Add precomputed increments, given as rows of (day, policy_id, purchases,
+# premium_collected, claims_submitted, claims_approved, approved_amount)
+def add_daily_totals(cursor, rows):
+    cursor.executemany("""
+        INSERT INTO daily_policy_rollups
+            (day, policy_id, purchases, premium_collected, claims_submitted, claims_approved, approved_amount)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE purchases = purchases + VALUES(purchases),
+                                premium_collected = premium_collected + VALUES(premium_collected),
+                                claims_submitted = claims_submitted + VALUES(claims_submitted),
+                                claims_approved = claims_approved + VALUES(claims_approved),
+                                approved_amount = approved_amount + VALUES(approved_amount)
+    """, rows)
+
+
+# Daily totals across all policies between start and end (inclusive)
+def fetch_daily_totals(cursor, start, end):
+    cursor.execute("""
+        SELECT day, SUM(purchases), SUM(premium_collected), SUM(claims_submitted),
+               SUM(claims_approved), SUM(approved_amount)
+        FROM daily_policy_rollups
+        WHERE day BETWEEN %s AND %s
+        GROUP BY day
+        ORDER BY day
+    """, (start, end))
+    return cursor.fetchall()
+
+
+# Monthly totals per policy between start and end (inclusive), as rows of
+# (month 'YYYY-MM', policy_id, policy_name, premium_collected, approved_amount,
+# loss_ratio). loss_ratio is None when no premium was collected that month; the
+# unattributed claims come back under UNATTRIBUTED_POLICY_ID with no name.
+def fetch_monthly_loss_ratios(cursor, start, end):
+    cursor.execute("""
+        SELECT DATE_FORMAT(r.day, '%%Y-%%m') AS month, r.policy_id, p.policy_name,
+               SUM(r.premium_collected), SUM(r.approved_amount),
+               SUM(r.approved_amount) / NULLIF(SUM(r.premium_collected), 0)
+        FROM daily_policy_rollups r
+        LEFT JOIN policies p ON p.policy_id = r.policy_id
+        WHERE r.day BETWEEN %s AND %s
+        GROUP BY month, r.policy_id, p.policy_name
+        ORDER BY month, r.policy_id
+    """, (start, end))
+    return cursor.fetchall()
+
+
+# Rebuild the rollups for days between start and end (inclusive) from
+# policy_purchases, claim_submission_logs and claim_status_change_logs. Days whose
+# log rows have been archived (audit_logs.py) can't be rebuilt, so start defaults
+# to the first day still live.
+def backfill(conn, start=None, end=None):
+    cursor = conn.cursor()
+    live_since = audit_logs.live_since(cursor, ("claim_submission_logs", "claim_status_change_logs"))
+    if start and live_since and start < live_since:
+        raise ValueError(f"Claim logs before {live_since} are archived; backfill from {live_since} or later")
+    start = start or live_since or date(1970, 1, 1)
+    end = end or date.today()
+    range_params = (start, end + timedelta(days=1))
+
+    try:
+        cursor.execute("DELETE FROM daily_policy_rollups WHERE day BETWEEN %s AND %s", (start, end))
+        cursor.execute("""
+            INSERT INTO daily_policy_rollups (day, policy_id, purchases, premium_collected)
+            SELECT DATE(pp.purchase_date), pp.policy_id, COUNT(*), COALESCE(SUM(p.premium), 0)
+            FROM policy_purchases pp
+            LEFT JOIN policies p ON p.policy_id = pp.policy_id
+            WHERE pp.purchase_date >= %s AND pp.purchase_date < %s
+            GROUP BY DATE(pp.purchase_date), pp.policy_id
+        """, range_params)
+        cursor.execute("""
+            INSERT INTO daily_policy_rollups (day, policy_id, claims_submitted)
+            SELECT DATE(l.submission_date), COALESCE(c.policy_id, %s), COUNT(*)
+            FROM claim_submission_logs l
+            LEFT JOIN claims c ON c.claim_id = l.claim_id
+            WHERE l.submission_date >= %s AND l.submission_date < %s
+            GROUP BY DATE(l.submission_date), COALESCE(c.policy_id, %s)
+            ON DUPLICATE KEY UPDATE claims_submitted = VALUES(claims_submitted)
+        """, (UNATTRIBUTED_POLICY_ID,) + range_params + (UNATTRIBUTED_POLICY_ID,))
+        cursor.execute("""
+            INSERT INTO daily_policy_rollups (day, policy_id, claims_approved, approved_amount)
+            SELECT DATE(l.change_date), COALESCE(c.policy_id, %s), COUNT(*), COALESCE(SUM(c.claim_amount), 0)
+            FROM claim_status_change_logs l
+            JOIN claims c ON c.claim_id = l.claim_id
+            WHERE l.new_status = 'Approved' AND l.change_date >= %s AND l.change_date < %s
+            GROUP BY DATE(l.change_date), COALESCE(c.policy_id, %s)
+            ON DUPLICATE KEY UPDATE claims_approved = VALUES(claims_approved),
+                                    approved_amount = VALUES(approved_amount)
+        """, (UNATTRIBUTED_POLICY_ID,) + range_params + (UNATTRIBUTED_POLICY_ID,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily_policy_rollups table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="rebuild rollups from the raw tables")
+    backfill_parser.add_argument("--start", type=date.fromisoformat, help="first day to rebuild (default: all unarchived history)")
+    backfill_parser.add_argument("--end", type=date.fromisoformat, help="last day to rebuild (default: today)")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        conn = db.get_connection()
+        try:
+            backfill(conn, args.start, args.end)
+        finally:
+            conn.close()
+        print(f"Rebuilt daily_policy_rollups from {args.start or 'the beginning'} to {args.end or date.today()}")
+
+
+if __name__ == "__main__":
+    main()
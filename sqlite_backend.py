@@ -0,0 +1,393 @@
+# Embedded SQLite storage backend (HIMS_DB_BACKEND=sqlite)
+#
+#   HIMS_DB_BACKEND=sqlite HIMS_SQLITE_PATH=hims.sqlite3 streamlit run hims.py
+#   python sqlite_backend.py init --admin-user admin --admin-password secret
+#
+# For single-node deployments (branch-office kiosks), CI and development: no
+# MySQL server, the database is one file created from hims_sqlite.sql on first
+# use. db.py's pool hands out the connections made here, which look like
+# pymysql's to the rest of the app: the same %s-style SQL (translated to SQLite's
+# dialect once per statement), cursor.execute() returning the affected row count,
+# lastrowid after an upsert, Decimal money and date/datetime values, pymysql type
+# codes in cursor.description, and errors raised as pymysql's exception classes.
+# Writes take the database's write lock when their transaction starts (BEGIN
+# IMMEDIATE), as do SELECT ... FOR UPDATE statements, so concurrent writers queue
+# for up to HIMS_SQLITE_BUSY_TIMEOUT seconds instead of deadlocking. The database
+# runs in WAL mode, so readers never wait for the writer.
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import pymysql
+from pymysql.constants import FIELD_TYPE
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SQLITE_PATH = os.environ.get("HIMS_SQLITE_PATH", os.path.join(APP_DIR, "hims.sqlite3"))
+SCHEMA_PATH = os.path.join(APP_DIR, "hims_sqlite.sql")
+BUSY_TIMEOUT = float(os.environ.get("HIMS_SQLITE_BUSY_TIMEOUT", "30"))  # seconds to wait for the write lock
+
+# Applied to every connection. journal_mode is stored in the file; the rest are
+# per connection.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # durable at checkpoints; a crash can't corrupt a WAL database
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA cache_size = -65536",  # 64 MB page cache
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+)
+
+# sqlite3 errors raised as the pymysql class callers already handle
+ERROR_CLASSES = (
+    (sqlite3.IntegrityError, pymysql.err.IntegrityError),
+    (sqlite3.OperationalError, pymysql.err.OperationalError),
+    (sqlite3.ProgrammingError, pymysql.err.ProgrammingError),
+    (sqlite3.DataError, pymysql.err.DataError),
+    (sqlite3.DatabaseError, pymysql.err.DatabaseError),
+)
+
+MONEY = Decimal("0.01")
+
+# Declared column type prefix -> the pymysql type code MySQL reports for it
+DECLARED_TYPES = (
+    ("DECIMAL", FIELD_TYPE.NEWDECIMAL),
+    ("DATETIME", FIELD_TYPE.DATETIME),
+    ("TIMESTAMP", FIELD_TYPE.TIMESTAMP),
+    ("DATE", FIELD_TYPE.DATE),
+    ("INT", FIELD_TYPE.LONGLONG),
+    ("VARCHAR", FIELD_TYPE.VAR_STRING),
+    ("CHAR", FIELD_TYPE.STRING),
+    ("TEXT", FIELD_TYPE.BLOB),
+    ("BLOB", FIELD_TYPE.BLOB),
+    ("REAL", FIELD_TYPE.DOUBLE),
+)
+TYPE_SIZE = re.compile(r"\((\d+)(?:,\s*(\d+))?\)")
+
+
+# Values in and out: Decimal and dates are stored as text (money columns turn it
+# into REAL), and columns declared DECIMAL, DATE, DATETIME or TIMESTAMP are read
+# back as the Python types pymysql returns
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()).quantize(MONEY))
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+# Computed columns (MAX(purchase_date), DATE(change_date), SUM(claim_amount), ...)
+# have no declared type, so SQLite returns their dates as text and their sums as
+# floats. These are converted when fetched to the date, datetime and Decimal
+# values MySQL returns for them.
+ISO_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2}(\.\d+)?)?$")
+CONVERTED_TYPES = {None, FIELD_TYPE.NEWDECIMAL, FIELD_TYPE.DATE, FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP}
+AGGREGATE_SCALE = 6  # decimal places kept from an untyped float (MySQL divides DECIMAL(, 2) to 6)
+
+
+def convert_value(value, scale=None):
+    if isinstance(value, float):
+        value = Decimal(repr(round(value, AGGREGATE_SCALE if scale is None else scale)))
+        return value if scale is None else value.quantize(Decimal(1).scaleb(-scale))
+    if isinstance(value, str) and 10 <= len(value) <= 26 and ISO_DATETIME.match(value):
+        return datetime.fromisoformat(value) if len(value) > 10 else date.fromisoformat(value)
+    return value
+
+
+# Convert a row's computed columns; converted is [(index, scale)]
+def convert_row(row, converted):
+    if row is None or not converted:
+        return row
+    row = list(row)
+    for index, scale in converted:
+        row[index] = convert_value(row[index], scale)
+    return tuple(row)
+
+
+class Statement:
+    def __init__(self, sql, writes, returning):
+        self.sql = sql
+        self.writes = writes  # starts a write transaction
+        self.returning = returning  # an upsert whose RETURNING row gives lastrowid
+
+
+DUPLICATE_KEY = re.compile(r"\bON DUPLICATE KEY UPDATE\b(.*)$", re.S)
+LAST_INSERT_ID = re.compile(r"^\s*(\w+)\s*=\s*LAST_INSERT_ID\(\1\)\s*$")
+DATE_FORMAT = re.compile(r"\bDATE_FORMAT\(([^,()]+),\s*('[^']*')\)")
+LIKE_PARAMETER = re.compile(r"\bLIKE \?(?!\s+ESCAPE)")
+
+
+# Translate a statement written for MySQL (as pymysql sends it) to SQLite. Only
+# the constructs the app's SQL uses are handled.
+@lru_cache(maxsize=1024)
+def translate(query, has_args=True):
+    # SQLite's INSERT OR IGNORE still raises foreign key errors that MySQL's
+    # INSERT IGNORE turns into warnings; neither should hide a rejected row
+    if re.search(r"\bINSERT\s+IGNORE\b", query, re.I):
+        raise pymysql.err.NotSupportedError("INSERT IGNORE is not supported on the SQLite backend")
+    sql = query.replace("%s", "?")
+    if has_args:
+        sql = sql.replace("%%", "%")
+    for_update = re.search(r"\bFOR UPDATE\b", sql) is not None
+    sql = re.sub(r"\s+FOR UPDATE\b", "", sql)
+    sql = sql.replace("CURDATE()", "date('now', 'localtime')").replace("NOW()", "datetime('now', 'localtime')")
+    sql = DATE_FORMAT.sub(r"strftime(\2, \1)", sql)
+    # MySQL's LIKE escapes with a backslash by default; SQLite's has no escape
+    sql = LIKE_PARAMETER.sub(r"LIKE ? ESCAPE '\\'", sql)
+
+    returning = False
+    duplicate = DUPLICATE_KEY.search(sql)
+    if duplicate:
+        assignments = duplicate.group(1)
+        last_insert = LAST_INSERT_ID.match(assignments)
+        if last_insert:
+            # The existing row's key becomes lastrowid, as LAST_INSERT_ID(id) does
+            column = last_insert.group(1)
+            upsert = f"ON CONFLICT DO UPDATE SET {column} = {column} RETURNING {column}"
+            returning = True
+        else:
+            upsert = "ON CONFLICT DO UPDATE SET" + re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", assignments)
+        sql = sql[:duplicate.start()] + upsert
+
+    first_word = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    writes = for_update or first_word not in ("SELECT", "WITH", "PRAGMA", "EXPLAIN")
+    return Statement(sql, writes, returning)
+
+
+def database_error(error):
+    for sqlite_class, pymysql_class in ERROR_CLASSES:
+        if isinstance(error, sqlite_class):
+            return pymysql_class(str(error))
+    return error
+
+
+# DB-API cursor with pymysql's behaviour. The cursor class argument pymysql
+# takes (e.g. SSCursor) is accepted and ignored: SQLite cursors already step
+# through the result rather than buffering it.
+class Cursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self._cursor = conn._raw.cursor()
+        self.lastrowid = None
+        self.rowcount = -1
+        self._converted = []
+
+    # pymysql-style description: (name, type_code, display_size, internal_size,
+    # precision, scale, null_ok). Type codes come from the declared type of the
+    # table column with the same name; computed columns have none.
+    @property
+    def description(self):
+        if self._cursor.description is None:
+            return None
+        types = self.connection.column_types
+        return tuple((column[0],) + types.get(column[0], (None, None, None, None, None, None))
+                     for column in self._cursor.description)
+
+    # Returns the number of rows changed (0 for queries, like pymysql's SSCursor)
+    def execute(self, query, args=None):
+        statement = translate(query, args is not None)
+        try:
+            if statement.writes:
+                self.connection.begin()
+            self._cursor.execute(statement.sql, tuple(args) if args is not None else ())
+            if statement.returning:
+                row = self._cursor.fetchone()
+                self.lastrowid = row[0] if row else None
+                self.rowcount = 1
+            else:
+                self.lastrowid = self._cursor.lastrowid
+                self.rowcount = self._cursor.rowcount
+        except sqlite3.Error as e:
+            raise database_error(e) from e
+        description = self.description or ()
+        self._converted = [(index, column[5]) for index, column in enumerate(description)
+                           if column[1] in CONVERTED_TYPES]
+        return max(self.rowcount, 0)
+
+    def executemany(self, query, args):
+        statement = translate(query)
+        try:
+            self.connection.begin()
+            self._cursor.executemany(statement.sql, [tuple(row) for row in args])
+            self.rowcount = self._cursor.rowcount
+            self._converted = []
+        except sqlite3.Error as e:
+            raise database_error(e) from e
+        return max(self.rowcount, 0)
+
+    def fetchone(self):
+        return convert_row(self._cursor.fetchone(), self._converted)
+
+    def fetchmany(self, size=None):
+        return [convert_row(row, self._converted) for row in self._cursor.fetchmany(size or self._cursor.arraysize)]
+
+    def fetchall(self):
+        return [convert_row(row, self._converted) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return (convert_row(row, self._converted) for row in self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    def __init__(self, path=None, busy_timeout=BUSY_TIMEOUT):
+        path = path or SQLITE_PATH
+        ensure_schema(path)
+        # Transactions are started explicitly (begin()), so sqlite3 must not
+        # start its own; pooled connections move between threads
+        self._raw = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False,
+                                    detect_types=sqlite3.PARSE_DECLTYPES)
+        for pragma in PRAGMAS:
+            self._raw.execute(pragma)
+        self.column_types = column_types(path, self._raw)
+        self.open = True
+
+    def cursor(self, cursor_class=None):
+        return Cursor(self)
+
+    # Start a write transaction unless one is open
+    def begin(self):
+        if not self._raw.in_transaction:
+            self._raw.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        if self._raw.in_transaction:
+            self._raw.execute("COMMIT")
+
+    def rollback(self):
+        if self._raw.in_transaction:
+            self._raw.execute("ROLLBACK")
+
+    def ping(self, reconnect=False):
+        try:
+            self._raw.execute("SELECT 1")
+        except sqlite3.Error as e:
+            raise database_error(e) from e
+
+    def close(self):
+        if self.open:
+            self.open = False
+            self._raw.close()
+
+
+def connect(path=None):
+    return Connection(path)
+
+
+# Statements of a SQL script; trigger bodies keep their inner semicolons
+def split_script(sql):
+    statements, current = [], []
+    for line in sql.splitlines():
+        if not current and (not line.strip() or line.strip().startswith("--")):
+            continue
+        current.append(line)
+        if sqlite3.complete_statement("\n".join(current)):
+            statements.append("\n".join(current).strip())
+            current = []
+    return statements
+
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+_column_types = {}
+
+
+# Description fields after the name for a declared column type, or None if it
+# has no MySQL equivalent
+def declared_type(declared):
+    declared = declared.upper()
+    for prefix, type_code in DECLARED_TYPES:
+        if declared.startswith(prefix):
+            size = TYPE_SIZE.search(declared)
+            precision = int(size.group(1)) if size else None
+            scale = int(size.group(2)) if size and size.group(2) else None
+            if scale is None and type_code == FIELD_TYPE.NEWDECIMAL:
+                scale = 0
+            return (type_code, None, None, precision, scale, None)
+    return None
+
+
+# {column name: description fields} for the columns of the database's tables,
+# leaving out names declared with different types in different tables. Read once
+# per path.
+def column_types(path, conn):
+    types = _column_types.get(path)
+    if types is None:
+        types, conflicting = {}, set()
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table in tables:
+            for column in conn.execute(f"PRAGMA table_info({table})"):
+                fields = declared_type(column[2])
+                if fields is None or column[1] in conflicting:
+                    continue
+                if types.setdefault(column[1], fields)[0] != fields[0]:
+                    conflicting.add(column[1])
+                    del types[column[1]]
+        _column_types[path] = types
+    return types
+
+
+# Create the schema in a new (or empty) database file. Checked once per path per
+# process; the write lock keeps two processes from both creating it.
+def ensure_schema(path):
+    if path in _schema_ready:
+        return
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'policies'").fetchone():
+                    with open(SCHEMA_PATH, encoding="utf-8") as f:
+                        for statement in split_script(f.read()):
+                            conn.execute(statement)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        _schema_ready.add(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the embedded SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    init_parser = subparsers.add_parser("init", help="create the database file from hims_sqlite.sql")
+    init_parser.add_argument("--path", default=SQLITE_PATH, help="database file (default: HIMS_SQLITE_PATH)")
+    init_parser.add_argument("--admin-user", help="also add an admin user with this name")
+    init_parser.add_argument("--admin-password")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        if args.admin_user and not args.admin_password:
+            parser.error("--admin-user needs --admin-password")
+        conn = connect(args.path)
+        try:
+            cursor = conn.cursor()
+            if args.admin_user:
+                cursor.execute("SELECT 1 FROM users WHERE username = %s", (args.admin_user,))
+                if cursor.fetchone():
+                    sys.exit(f"error: user {args.admin_user!r} already exists")
+                cursor.execute("INSERT INTO users (username, password, role) VALUES (%s, %s, 'admin')",
+                               (args.admin_user, args.admin_password))
+                conn.commit()
+            cursor.execute("SELECT COUNT(*) FROM policies")
+            policies = cursor.fetchone()[0]
+        finally:
+            conn.close()
+        print(f"SQLite database ready at {args.path} ({policies} policies)")
+
+
+if __name__ == "__main__":
+    main()
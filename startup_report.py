@@ -0,0 +1,103 @@
+# Cold-start import report for hims.py
+#
+#   python startup_report.py              print the modules hims.py loads at startup
+#   python startup_report.py --check      also exit non-zero on a regression
+#   python startup_report.py --json       machine-readable output
+#
+# Runs hims.py's top-level imports in a fresh interpreter under -X importtime,
+# after importing streamlit (which the server has already loaded before any
+# session runs the script), and reports the cumulative time of each top-level
+# module. --check fails when a module that must load lazily (the analytics
+# stack) is imported at startup, or when the total exceeds the budget.
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "hims.py")
+
+# Modules hims.py must only import on first use by the reporting path
+LAZY_MODULES = ("matplotlib", "numpy", "pandas", "plotly", "pyarrow")
+
+# Default budget for the app's own startup imports, in milliseconds
+BUDGET_MS = 150
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+
+# Source of the import statements at the top level of the app script
+def startup_imports(script=APP_SCRIPT):
+    with open(script, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+# Run the imports under -X importtime and return [(module, cumulative_us, depth)]
+# for everything imported after streamlit
+def measure(imports):
+    code = "import streamlit\n" + "\n".join(imports)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=APP_DIR,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"error: importing the app's modules failed:\n{result.stderr[-2000:]}")
+
+    modules = []
+    after_streamlit = False
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, module = int(match.group(2)), len(match.group(3)), match.group(4)
+        depth = (indent - 1) // 2
+        if not after_streamlit:
+            # importtime prints a package after its submodules, so everything up to
+            # and including the top-level streamlit line belongs to streamlit
+            after_streamlit = depth == 0 and module == "streamlit"
+            continue
+        modules.append((module, cumulative, depth))
+    return modules
+
+
+def build_report(budget_ms=BUDGET_MS):
+    imports = startup_imports()
+    modules = measure(imports)
+    top_level = [(module, cumulative) for module, cumulative, depth in modules if depth == 0]
+    total_ms = sum(cumulative for _, cumulative in top_level) / 1000
+    lazy_loaded = sorted({module.split(".")[0] for module, _, _ in modules} & set(LAZY_MODULES))
+    return {
+        "imports": imports,
+        "modules": [{"module": module, "cumulative_ms": cumulative / 1000} for module, cumulative in top_level],
+        "total_ms": total_ms,
+        "budget_ms": budget_ms,
+        "lazy_modules_loaded": lazy_loaded,
+        "ok": total_ms <= budget_ms and not lazy_loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the import cost of starting hims.py")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on a regression")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="allowed total import time")
+    args = parser.parse_args()
+
+    report = build_report(args.budget_ms)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for entry in sorted(report["modules"], key=lambda entry: -entry["cumulative_ms"]):
+            print(f"{entry['cumulative_ms']:9.1f} ms  {entry['module']}")
+        print(f"{report['total_ms']:9.1f} ms  total (budget {report['budget_ms']:.0f} ms)")
+        if report["lazy_modules_loaded"]:
+            print(f"Loaded at startup but should be lazy: {', '.join(report['lazy_modules_loaded'])}")
+
+    if args.check and not report["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# Synthetic data for benchmarks and capacity tests
+#
+#   python synthetic_data.py --scale medium
+#   python synthetic_data.py --users 20000 --purchases 80000 --claims 150000 --seed 7
+#
+# Tops the hims.sql tables up to the requested row counts (rows already present
+# count towards the totals), so the same database can be grown from one scale to
+# the next. Point it at a throwaway database (HIMS_DB_NAME=hims_bench) built from
+# hims.sql: the rows are real and are not removed afterwards. Rows are generated
+# and inserted BATCH_SIZE at a time, so memory stays flat at any scale.
+#
+# Distributions: most users become policy holders, with ages spread around the
+# early forties; purchases favour a few popular policies and a minority of heavy
+# buyers, and grow more frequent towards the present; claims come mostly from a
+# small share of holders, with log-normal amounts and a realistic status mix.
+# Claims are submitted over the same history and approved or rejected a few days
+# later, like real ones: each is inserted as Pending and then updated, and the
+# log rows the triggers write (stamped with the current time) are replaced by
+# ones dated at submission and decision, so the rollups rebuilt from the logs
+# show the history rather than one day of submissions.
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import db
+import rollups
+
+SCALES = {
+    "small": {"users": 10_000, "purchases": 50_000, "claims": 100_000},
+    "medium": {"users": 100_000, "purchases": 500_000, "claims": 1_000_000},
+    "large": {"users": 1_000_000, "purchases": 5_000_000, "claims": 10_000_000},
+}
+
+BATCH_SIZE = 10000  # rows per executemany and commit
+HOLDER_SHARE = 0.8  # share of new users who hold a policy
+HISTORY_DAYS = 730  # purchases and claims are spread over this many days before now
+REVIEW_DAYS = 7  # mean days from a claim's submission to its approval or rejection
+MAX_CLAIM_AMOUNT = 99999999.99  # claims.claim_amount is DECIMAL(10, 2)
+CLAIM_STATUSES = ["Pending", "Approved", "Rejected"]
+CLAIM_STATUS_WEIGHTS = [0.15, 0.6, 0.25]
+CLAIM_DESCRIPTIONS = [
+    "Hospitalisation", "Outpatient consultation", "Diagnostic tests", "Surgery", "Maternity",
+    "Emergency room visit", "Prescription medicines", "Physiotherapy", "Day care procedure", "Ambulance",
+]
+
+
+def table_count(cursor, table):
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def max_id(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+# (offset, size) of each batch of n rows
+def batch_ranges(n):
+    for start in range(0, n, BATCH_SIZE):
+        yield start, min(BATCH_SIZE, n - start)
+
+
+# Insert batches of rows (lists of tuples, generated one at a time), committing
+# each one. query is an INSERT statement, or a function(cursor, rows) that
+# writes a batch.
+def insert_batches(conn, query, batches, label, log):
+    cursor = conn.cursor()
+    started = time.monotonic()
+    total = 0
+    for rows in batches:
+        if callable(query):
+            query(cursor, rows)
+        else:
+            cursor.executemany(query, rows)
+        conn.commit()
+        total += len(rows)
+    elapsed = time.monotonic() - started
+    if total:
+        log(f"  {label}: {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+# Weights that make a few of n items much more likely than the rest
+def skewed_weights(rng, n, shape):
+    weights = rng.gamma(shape, size=n)
+    return weights / weights.sum()
+
+
+# Function drawing size values with the given probabilities; the cumulative
+# weights are computed once instead of on every draw
+def sampler(rng, values, weights):
+    cumulative = np.cumsum(weights)
+    cumulative /= cumulative[-1]
+    return lambda size: values[np.searchsorted(cumulative, rng.random(size), side="right")]
+
+
+# Seconds before now, for events whose volume grows linearly towards the present
+def seconds_ago(rng, size):
+    return (HISTORY_DAYS * 86400 * (1 - np.sqrt(rng.random(size)))).astype(int)
+
+
+# Write a batch of claims as the app would have: insert them Pending, then
+# approve or reject the decided ones, and date the trigger-written log rows at
+# submission and decision. Rows are (claim_id, policy_holder_id, policy_id,
+# amount, description, status, submitted, decided).
+def write_claims(cursor, rows):
+    first, last = rows[0][0], rows[-1][0]
+    cursor.execute("SELECT COALESCE(MAX(log_id), 0) FROM claim_submission_logs")
+    submissions_before = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(MAX(log_id), 0) FROM claim_status_change_logs")
+    changes_before = cursor.fetchone()[0]
+
+    cursor.executemany("INSERT INTO claims (claim_id, policy_holder_id, policy_id, claim_amount, description, status) "
+                       "VALUES (%s, %s, %s, %s, %s, %s)", [row[:5] + ("Pending",) for row in rows])
+    for status in ("Approved", "Rejected"):
+        decided = [row[0] for row in rows if row[5] == status]
+        if decided:
+            cursor.execute(f"UPDATE claims SET status = %s WHERE claim_id IN ({', '.join(['%s'] * len(decided))})",
+                           [status] + decided)
+
+    cursor.execute("DELETE FROM claim_submission_logs WHERE log_id > %s AND claim_id BETWEEN %s AND %s",
+                   (submissions_before, first, last))
+    cursor.executemany("INSERT INTO claim_submission_logs (policy_holder_id, claim_id, submission_date, log_details) "
+                       "VALUES (%s, %s, %s, %s)",
+                       [(holder_id, claim_id, submitted,
+                         f"Claim submitted with ID: {claim_id} for amount: {amount:.2f}")
+                        for claim_id, holder_id, _, amount, _, _, submitted, _ in rows])
+    cursor.execute("DELETE FROM claim_status_change_logs WHERE log_id > %s AND claim_id BETWEEN %s AND %s",
+                   (changes_before, first, last))
+    cursor.executemany("INSERT INTO claim_status_change_logs (claim_id, old_status, new_status, change_date, "
+                       "log_details) VALUES (%s, %s, %s, %s, %s)",
+                       [(claim_id, "Pending", status, decided,
+                         f"Claim status changed from Pending to {status} for Claim ID: {claim_id}")
+                        for claim_id, _, _, _, _, status, _, decided in rows if status != "Pending"])
+
+
+# Add users, policy holders, purchases and claims until the tables hold the
+# requested number of rows. Returns the number of rows added to each table.
+def fill(conn, users, purchases, claims, seed=0, log=print):
+    rng = np.random.default_rng(seed)
+    cursor = conn.cursor()
+    added = {}
+
+    cursor.execute("SELECT policy_id FROM policies")
+    policy_ids = np.array([row[0] for row in cursor.fetchall()])
+    if not len(policy_ids):
+        raise ValueError("The policies table is empty; load hims.sql first")
+
+    new_users = max(users - table_count(cursor, "users"), 0)
+    first_user = max_id(cursor, "users", "user_id") + 1
+    insert_batches(conn, "INSERT INTO users (user_id, username, password, role) VALUES (%s, %s, %s, %s)",
+                   ([(user_id, f"synthetic_user_{user_id}", "synthetic", "policy_holder")
+                     for user_id in range(first_user + start, first_user + start + size)]
+                    for start, size in batch_ranges(new_users)),
+                   "users", log)
+    added["users"] = new_users
+
+    holder_users = np.sort(rng.choice(np.arange(first_user, first_user + new_users),
+                                      size=int(new_users * HOLDER_SHARE), replace=False))
+    first_holder = max_id(cursor, "policy_holders", "id") + 1
+
+    def holder_batches():
+        for start, size in batch_ranges(len(holder_users)):
+            ages = np.clip(rng.normal(42, 14, size=size), 18, 90).astype(int)
+            contacts = rng.integers(6_000_000_000, 9_999_999_999, size=size)
+            yield [(first_holder + start + i, user_id, f"Holder {user_id}", age, str(contact),
+                    f"{user_id % 999 + 1} Synthetic Street")
+                   for i, (user_id, age, contact) in enumerate(zip(holder_users[start:start + size].tolist(),
+                                                                   ages.tolist(), contacts.tolist()))]
+
+    insert_batches(conn, "INSERT INTO policy_holders (id, user_id, name, age, contact, address) "
+                         "VALUES (%s, %s, %s, %s, %s, %s)", holder_batches(), "policy_holders", log)
+    added["policy_holders"] = len(holder_users)
+
+    # Buyers and claimants are drawn from all holders, including earlier ones
+    cursor.execute("SELECT id, user_id FROM policy_holders")
+    holder_rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    if not len(holder_rows):
+        raise ValueError("No policy holders to attach purchases and claims to")
+
+    new_purchases = max(purchases - table_count(cursor, "policy_purchases"), 0)
+    pick_buyer = sampler(rng, holder_rows[:, 1], skewed_weights(rng, len(holder_rows), 1.5))
+    popularity = 1.0 / np.arange(1, len(policy_ids) + 1) ** 1.1
+    popularity /= popularity.sum()
+    # Claims follow the same policy popularity as purchases
+    pick_policy = sampler(rng, rng.permutation(policy_ids), popularity)
+    now = datetime.now().replace(microsecond=0)
+
+    def purchase_batches():
+        for _, size in batch_ranges(new_purchases):
+            yield [(user_id, policy_id, now - timedelta(seconds=ago))
+                   for user_id, policy_id, ago in zip(pick_buyer(size).tolist(), pick_policy(size).tolist(),
+                                                      seconds_ago(rng, size).tolist())]
+
+    insert_batches(conn, "INSERT INTO policy_purchases (user_id, policy_id, purchase_date) VALUES (%s, %s, %s)",
+                   purchase_batches(), "policy_purchases", log)
+    added["policy_purchases"] = new_purchases
+
+    new_claims = max(claims - table_count(cursor, "claims"), 0)
+    first_claim = max_id(cursor, "claims", "claim_id") + 1
+    pick_claimant = sampler(rng, holder_rows[:, 0], skewed_weights(rng, len(holder_rows), 0.5))
+
+    def claim_batches():
+        for start, size in batch_ranges(new_claims):
+            amounts = np.round(np.clip(rng.lognormal(np.log(25000), 1.1, size=size), 100, MAX_CLAIM_AMOUNT), 2)
+            statuses = rng.choice(CLAIM_STATUSES, size=size, p=CLAIM_STATUS_WEIGHTS)
+            submitted_ago = seconds_ago(rng, size)
+            # Decided after a review delay; claims too recent for it stay Pending
+            decided_ago = submitted_ago - rng.exponential(REVIEW_DAYS * 86400, size=size).astype(int)
+            statuses[decided_ago < 0] = "Pending"
+            yield [(first_claim + start + i, holder_id, policy_id, amount, description, status,
+                    now - timedelta(seconds=submitted), now - timedelta(seconds=max(decided, 0)))
+                   for i, (holder_id, policy_id, amount, description, status, submitted, decided) in enumerate(zip(
+                       pick_claimant(size).tolist(), pick_policy(size).tolist(), amounts.tolist(),
+                       rng.choice(CLAIM_DESCRIPTIONS, size=size).tolist(), statuses.tolist(),
+                       submitted_ago.tolist(), decided_ago.tolist()))]
+
+    insert_batches(conn, write_claims, claim_batches(), "claims", log)
+    added["claims"] = new_claims
+
+    if new_purchases or new_claims:
+        started = time.monotonic()
+        rollups.backfill(conn)
+        log(f"  daily_policy_rollups rebuilt in {time.monotonic() - started:.1f}s")
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic users, holders, purchases and claims")
+    parser.add_argument("--scale", choices=SCALES, default="small", help="preset row counts (default: small)")
+    parser.add_argument("--users", type=int, help="total users (overrides the scale)")
+    parser.add_argument("--purchases", type=int, help="total policy purchases (overrides the scale)")
+    parser.add_argument("--claims", type=int, help="total claims (overrides the scale)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    volumes = dict(SCALES[args.scale])
+    for table in volumes:
+        if getattr(args, table) is not None:
+            volumes[table] = getattr(args, table)
+
+    conn = db.get_connection()
+    try:
+        print(f"Filling {db.describe()} to {volumes['users']:,} users, "
+              f"{volumes['purchases']:,} purchases and {volumes['claims']:,} claims")
+        added = fill(conn, seed=args.seed, **volumes)
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    finally:
+        conn.close()
+    print("Added " + ", ".join(f"{count:,} {table}" for table, count in added.items()))
+
+
+if __name__ == "__main__":
+    main()
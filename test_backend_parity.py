@@ -0,0 +1,211 @@
+# Backend parity: hims.py's data functions on the embedded SQLite backend must
+# return what they return on MySQL (the same rows, Decimal money, date and
+# datetime values, pymysql exceptions)
+#
+#   python -m pytest -q test_backend_parity.py
+#
+# Runs against a throwaway database file, so it needs no MySQL server and is
+# meant for CI. The backend is chosen when db is imported, hence the environment
+# set up before the imports below.
+import os
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+TMP_DIR = tempfile.mkdtemp(prefix="hims-parity-")
+os.environ["HIMS_DB_BACKEND"] = "sqlite"
+os.environ["HIMS_SQLITE_PATH"] = os.path.join(TMP_DIR, "hims.sqlite3")
+os.environ.pop("HIMS_DB_REPLICAS", None)
+os.environ.pop("HIMS_CLAIM_QUEUE", None)
+
+import pymysql  # noqa: E402
+import pytest  # noqa: E402
+from pymysql.constants import FIELD_TYPE  # noqa: E402
+
+import benchmark  # noqa: E402
+import claim_queue  # noqa: E402
+import db  # noqa: E402
+import export_data  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def app():
+    return benchmark.load_app_functions()
+
+
+@pytest.fixture(scope="module")
+def holder(app):
+    assert app.register_user("alice", "secret")
+    role, user_id = app.login("alice", "secret")
+    assert role == "policy_holder"
+    assert app.buy_policy(user_id, 1, "Alice Fernandes", 34, "9876543210", "12 Hill Road")
+    assert app.buy_policy(user_id, 3, "Alice Fernandes", 34, "9876543210", "12 Hill Road")
+    return user_id, app.get_policy_holder_id(user_id)
+
+
+def query(sql, args=None):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, args)
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def test_backend_is_sqlite():
+    assert db.BACKEND == "sqlite"
+    assert db.describe() == f"sqlite:{os.environ['HIMS_SQLITE_PATH']}"
+
+
+def test_login_ignores_username_case_like_mysql(app, holder):
+    user_id, _ = holder
+    assert app.login("alice", "wrong") == (None, None)
+    assert app.login("ALICE", "secret") == ("policy_holder", user_id)
+
+
+def test_repeat_purchases_share_one_holder_record(app, holder):
+    user_id, holder_id = holder
+    assert query("SELECT COUNT(*) FROM policy_holders WHERE user_id = %s", (user_id,)) == [(1,)]
+    assert query("SELECT COUNT(*) FROM purchase_logs WHERE user_id = %s", (user_id,)) == [(2,)]
+
+
+def test_buying_an_unknown_policy_fails(app, holder):
+    user_id, _ = holder
+    assert app.buy_policy(user_id, 999, "Alice Fernandes", 34, "9876543210", "12 Hill Road") is False
+
+
+def test_user_policies_types(app, holder):
+    user_id, _ = holder
+    policies = app.get_user_policies(user_id)
+    assert sorted(row[0] for row in policies) == [1, 3]
+    policy_id, name, details, premium, purchased = policies[0]
+    assert isinstance(premium, Decimal) and premium == premium.quantize(Decimal("0.01"))
+    assert isinstance(purchased, datetime)
+
+
+def test_holder_search(app, holder):
+    _, holder_id = holder
+    for search_by, term in [("Name", "alice fern"), ("Name", "Al"), ("Contact", "98765"), ("ID", str(holder_id))]:
+        rows, has_more = app.search_policy_holders(search_by, term, 0, 10)
+        assert [row[0] for row in rows] == [holder_id], (search_by, term)
+        assert has_more is False
+    rows, _ = app.search_policy_holders("Name", "100%", 0, 10)
+    assert rows == []
+
+
+def test_claims_and_adjudication(app, holder):
+    _, holder_id = holder
+    app.submit_claim(holder_id, 1500.5, "Day care procedure", 1)
+    app.submit_claim(holder_id, 200, "Prescription medicines", 3)
+    app.submit_claim(holder_id, 1234567.89, "Hospitalisation", 1)
+    claims = app.get_policy_holder_claims(holder_id)
+    assert {row[1] for row in claims} == {Decimal("1500.50"), Decimal("200.00"), Decimal("1234567.89")}
+
+    rows, has_more = app.get_pending_claims_page(0, 10)
+    claim_ids = [row[0] for row in rows]
+    assert len(claim_ids) == 3 and has_more is False
+    assert app.update_claim_status(claim_ids[0], "Approved") is not False
+    results = app.bulk_update_claim_status("Rejected", claim_ids=claim_ids + [999999])
+    assert results == [(claim_ids[0], "Skipped (already Approved)"), (claim_ids[1], "Rejected"),
+                       (claim_ids[2], "Rejected"), (999999, "Not found")]
+    assert app.update_claim_status(claim_ids[1], "Approved") is False
+    changes = query("SELECT claim_id, old_status, new_status, change_date FROM claim_status_change_logs "
+                    "ORDER BY log_id")
+    assert [row[:3] for row in changes] == [(claim_ids[0], "Pending", "Approved"),
+                                            (claim_ids[1], "Pending", "Rejected"),
+                                            (claim_ids[2], "Pending", "Rejected")]
+    assert isinstance(changes[0][3], datetime)
+
+
+def test_reports_return_decimal_totals(app, holder):
+    [(total_claims,)] = query("SELECT COUNT(*) FROM claims")
+    reports = app.load_reports()
+    assert reports["total_policies"] == 10
+    assert reports["total_claims"] == total_claims
+    assert isinstance(reports["total_premium_collected"], Decimal)
+    assert reports["total_premium_collected"] == Decimal("40000.00")
+    assert isinstance(reports["total_claims_approved"], Decimal)
+
+
+def test_trends_and_loss_ratios(app, holder):
+    today = date.today()
+    trends = app.load_trends(today - timedelta(days=1), today)["trends_df"]
+    assert trends["Premium Collected"].sum() == 40000.0
+    assert query("SELECT MAX(day) FROM daily_policy_rollups") == [(today,)]
+    loss_df = app.load_loss_ratios(today.replace(day=1), today)["loss_df"]
+    assert set(loss_df["Policy ID"]) >= {1, 3}
+
+
+def test_aggregates_convert_like_mysql():
+    [(total, average, latest, day)] = query(
+        "SELECT SUM(premium), AVG(premium), MAX(purchase_date), DATE(MAX(purchase_date)) "
+        "FROM policy_purchases JOIN policies USING (policy_id)")
+    assert total == Decimal("40000") and isinstance(average, Decimal)
+    assert isinstance(latest, datetime) and isinstance(day, date)
+    [(count,)] = query("SELECT COUNT(*) FROM claims")
+    assert isinstance(count, int)
+
+
+def test_description_type_codes(holder):
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT claim_id, claim_amount, description, COUNT(*) FROM claims")
+        description = cursor.description
+    finally:
+        conn.close()
+    assert [column[1] for column in description] == [FIELD_TYPE.LONGLONG, FIELD_TYPE.NEWDECIMAL, FIELD_TYPE.BLOB,
+                                                      None]
+    assert description[1][4:6] == (10, 2)
+
+
+def test_parquet_export_types_do_not_depend_on_the_first_chunk(holder):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = os.path.join(TMP_DIR, "claims.parquet")
+    assert export_data.export("claims", output, chunk_size=1)["rows"] == 3
+    schema = pq.read_schema(output)
+    assert str(schema.field("claim_amount").type) == "decimal128(38, 2)"
+    assert str(schema.field("ingest_ref").type) == "string"
+
+
+def test_claims_export_filters_by_submission_date(holder):
+    output = os.path.join(TMP_DIR, "claims.csv")
+    today = date.today()
+    assert export_data.export("claims", output, start=today, end=today)["rows"] == 3
+    assert export_data.export("claims", output, end=today - timedelta(days=1))["rows"] == 0
+    assert export_data.export("claims", output, start=today, statuses=["Approved"])["rows"] == 1
+
+
+def test_insert_ignore_is_refused():
+    with pytest.raises(pymysql.err.NotSupportedError):
+        query("INSERT IGNORE INTO claims (policy_holder_id, claim_amount, status) VALUES (%s, %s, 'Pending')",
+              (1, 1))
+
+
+def test_foreign_key_errors_are_pymysql_errors():
+    with pytest.raises(pymysql.err.IntegrityError):
+        query("INSERT INTO claims (policy_holder_id, claim_amount, status) VALUES (%s, %s, 'Pending')",
+              (999999, 1))
+
+
+def test_claim_queue_dead_letters_rejected_claims(holder, monkeypatch):
+    _, holder_id = holder
+    queue_path = os.path.join(TMP_DIR, "queue.sqlite3")
+    monkeypatch.setattr(claim_queue, "QUEUE_PATH", queue_path)
+    monkeypatch.setattr(claim_queue, "_local", claim_queue.threading.local())
+    before = query("SELECT COALESCE(SUM(claims_submitted), 0) FROM daily_policy_rollups")[0][0]
+
+    claim_queue.enqueue(holder_id, 75, "queued", 3)
+    claim_queue.enqueue(999999, 80, "unknown holder")
+    claim_queue.enqueue(holder_id, 85, "unknown policy", 12345)
+    assert claim_queue.flush() == 3
+
+    assert query("SELECT description FROM claims WHERE ingest_ref IS NOT NULL") == [("queued",)]
+    after = query("SELECT COALESCE(SUM(claims_submitted), 0) FROM daily_policy_rollups")[0][0]
+    assert after - before == 1
+    dead = sqlite3.connect(queue_path).execute("SELECT description FROM dead_claims ORDER BY seq").fetchall()
+    assert dead == [("unknown holder",), ("unknown policy",)]
+    stats = claim_queue.stats()
+    assert (stats["queued"], stats["dead_claims"]) == (0, 2)